@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Retention and archival for the UserActivity table.
+
+Activity older than ACTIVITY_RETENTION_DAYS is moved out of the hot table in
+batches. Each batch is written as gzip-compressed NDJSON, partitioned by
+day under ACTIVITY_ARCHIVE_DIR/YYYY/MM/, and its rows are deleted only once
+the files are safely on disk. A file is named after the smallest activity id
+it holds, so a batch that is retried after a crash overwrites its own files
+instead of duplicating rows. Derived data (interest counters, seen bitmaps,
+analytics rollups) is kept, so archival does not change what users see.
+
+manifest.json in the archive directory keeps the cumulative metrics and the
+cutoff everything before which has been archived.
+
+    python activity_archive.py archive [--days 180] [--batch-size 5000] [--dry-run]
+    python activity_archive.py stats
+    python activity_archive.py replay --start 2025-01-01 --end 2025-02-01 [--user-id ID] [--restore]
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import app, db, ACTIVITY_RETENTION_DAYS, ACTIVITY_ARCHIVE_DIR, ACTIVITY_ARCHIVE_BATCH
+from models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('id', 'user_id', 'activity_type', 'content_id', 'search_query', 'duration', 'timestamp',
+           'activity_metadata')
+
+_manifest_lock = threading.Lock()
+
+
+def _manifest_path(archive_dir):
+    return os.path.join(archive_dir, 'manifest.json')
+
+
+def load_manifest(archive_dir=ACTIVITY_ARCHIVE_DIR):
+    try:
+        with open(_manifest_path(archive_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'archived_before': None, 'rows': 0, 'files': 0, 'raw_bytes': 0, 'compressed_bytes': 0,
+                'runs': 0, 'partitions': {}}
+
+
+def _save_manifest(archive_dir, manifest):
+    os.makedirs(archive_dir, exist_ok=True)
+    path = _manifest_path(archive_dir)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def archived_before(archive_dir=ACTIVITY_ARCHIVE_DIR):
+    """Cutoff before which activity may only be in the archive, or None"""
+    value = load_manifest(archive_dir)['archived_before']
+    return datetime.fromisoformat(value) if value else None
+
+
+def _partition_path(archive_dir, day, first_id):
+    return os.path.join(archive_dir, f'{day:%Y}', f'{day:%m}', f'{day:%Y-%m-%d}.{first_id:012d}.ndjson.gz')
+
+
+def _serialize(row):
+    record = {column: getattr(row, column) for column in COLUMNS}
+    record['timestamp'] = row.timestamp.isoformat() if row.timestamp else None
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def _write_partition(path, lines):
+    """Write one compressed file atomically; returns (raw bytes, compressed bytes)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    payload = ''.join(lines).encode('utf-8')
+    with open(path + '.tmp', 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+            gz.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return len(payload), os.path.getsize(path)
+
+
+def archive(days=ACTIVITY_RETENTION_DAYS, batch_size=ACTIVITY_ARCHIVE_BATCH, archive_dir=ACTIVITY_ARCHIVE_DIR,
+            dry_run=False, max_batches=None):
+    """Move activity older than days into the archive; returns this run's metrics"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    start = time.monotonic()
+    summary = {'cutoff': cutoff.isoformat(), 'rows': 0, 'files': 0, 'raw_bytes': 0, 'compressed_bytes': 0,
+               'batches': 0}
+
+    if dry_run:
+        summary['rows'] = UserActivity.query.filter(UserActivity.timestamp < cutoff).count()
+        return summary
+
+    with _manifest_lock:
+        manifest = load_manifest(archive_dir)
+        while max_batches is None or summary['batches'] < max_batches:
+            # Old rows sit at the start of the primary key, so this walks the index and stops early
+            rows = UserActivity.query.filter(UserActivity.timestamp < cutoff)\
+                .order_by(UserActivity.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            by_day = defaultdict(list)
+            for row in rows:
+                by_day[row.timestamp.date()].append(row)
+            written = []
+            for day, day_rows in by_day.items():
+                path = _partition_path(archive_dir, day, day_rows[0].id)
+                written.append((day, len(day_rows), *_write_partition(path, [_serialize(row) for row in day_rows])))
+
+            ids = [row.id for row in rows]
+            UserActivity.query.filter(UserActivity.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+            # Metrics are saved per batch so an interrupted run still accounts for what it moved
+            for day, count, raw_bytes, compressed_bytes in written:
+                partition = manifest['partitions'].setdefault(f'{day:%Y-%m}', {'rows': 0, 'files': 0,
+                                                                                   'compressed_bytes': 0})
+                partition['rows'] += count
+                partition['files'] += 1
+                partition['compressed_bytes'] += compressed_bytes
+                for key, amount in (('files', 1), ('raw_bytes', raw_bytes), ('compressed_bytes', compressed_bytes)):
+                    summary[key] += amount
+                    manifest[key] += amount
+            summary['rows'] += len(ids)
+            manifest['rows'] += len(ids)
+            summary['batches'] += 1
+            _save_manifest(archive_dir, manifest)
+
+        manifest['runs'] += 1
+        if max_batches is None or summary['batches'] < max_batches:
+            previous = manifest['archived_before']
+            if previous is None or previous < summary['cutoff']:
+                manifest['archived_before'] = summary['cutoff']
+        manifest['last_run'] = {**summary, 'finished_at': datetime.utcnow().isoformat()}
+        _save_manifest(archive_dir, manifest)
+
+    summary['seconds'] = round(time.monotonic() - start, 2)
+    summary['bytes_saved'] = summary['raw_bytes'] - summary['compressed_bytes']
+    if summary['rows']:
+        logger.info(f"Archived {summary['rows']} activities older than {cutoff:%Y-%m-%d} "
+                    f"into {summary['files']} files ({summary['compressed_bytes']} bytes)")
+    return summary
+
+
+def iter_archived(start=None, end=None, user_id=None, archive_dir=ACTIVITY_ARCHIVE_DIR):
+    """Yield archived activity dicts with start <= timestamp < end, in partition order"""
+    for root, dirs, files in os.walk(archive_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.ndjson.gz'):
+                continue
+            day = datetime.strptime(name[:10], '%Y-%m-%d')
+            if (start and day + timedelta(days=1) <= start) or (end and day >= end):
+                continue
+            with gzip.open(os.path.join(root, name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if user_id is not None and record['user_id'] != user_id:
+                        continue
+                    timestamp = datetime.fromisoformat(record['timestamp']) if record['timestamp'] else None
+                    if timestamp and ((start and timestamp < start) or (end and timestamp >= end)):
+                        continue
+                    record['timestamp'] = timestamp
+                    yield record
+
+
+def restore(start=None, end=None, user_id=None, archive_dir=ACTIVITY_ARCHIVE_DIR, batch_size=5000):
+    """Copy archived rows back into UserActivity, skipping ids that are already present"""
+    restored = 0
+    batch = []
+
+    def write(batch):
+        present = {row[0] for row in db.session.query(UserActivity.id)
+                   .filter(UserActivity.id.in_([record['id'] for record in batch]))}
+        rows = [record for record in batch if record['id'] not in present]
+        if rows:
+            db.session.execute(insert(UserActivity), rows)
+        return len(rows)
+
+    for record in iter_archived(start, end, user_id, archive_dir):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            restored += write(batch)
+            batch = []
+    if batch:
+        restored += write(batch)
+    db.session.commit()
+    return restored
+
+
+def stats(archive_dir=ACTIVITY_ARCHIVE_DIR):
+    manifest = load_manifest(archive_dir)
+    return {
+        'archived_before': manifest['archived_before'],
+        'rows': manifest['rows'],
+        'files': manifest['files'],
+        'compressed_bytes': manifest['compressed_bytes'],
+        'bytes_saved': manifest['raw_bytes'] - manifest['compressed_bytes'],
+        'compression_ratio': round(manifest['raw_bytes'] / manifest['compressed_bytes'], 2)
+        if manifest['compressed_bytes'] else None,
+        'runs': manifest['runs'],
+        'last_run': manifest.get('last_run'),
+    }
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old user activity')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    archive_parser = subparsers.add_parser('archive')
+    archive_parser.add_argument('--days', type=int, default=ACTIVITY_RETENTION_DAYS)
+    archive_parser.add_argument('--batch-size', type=int, default=ACTIVITY_ARCHIVE_BATCH)
+    archive_parser.add_argument('--max-batches', type=int, default=None)
+    archive_parser.add_argument('--dry-run', action='store_true')
+    subparsers.add_parser('stats')
+    replay_parser = subparsers.add_parser('replay', help='print archived rows as NDJSON, or restore them')
+    replay_parser.add_argument('--start', type=_parse_date, default=None)
+    replay_parser.add_argument('--end', type=_parse_date, default=None)
+    replay_parser.add_argument('--user-id', type=int, default=None)
+    replay_parser.add_argument('--restore', action='store_true', help='insert the rows back into UserActivity')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        if args.command == 'archive':
+            print(f"📦 Archiving activity older than {args.days} days to {ACTIVITY_ARCHIVE_DIR}...")
+            summary = archive(args.days, args.batch_size, dry_run=args.dry_run, max_batches=args.max_batches)
+            if args.dry_run:
+                print(f"🔍 {summary['rows']} rows would be archived")
+            else:
+                print(f"✅ Moved {summary['rows']} rows into {summary['files']} files in {summary['seconds']}s "
+                      f"({summary['raw_bytes']} bytes as NDJSON, {summary['compressed_bytes']} compressed)")
+        elif args.command == 'stats':
+            print(json.dumps(stats(), indent=2))
+        elif args.restore:
+            print("♻️ Restoring archived activity...")
+            print(f"✅ Restored {restore(args.start, args.end, args.user_id)} rows")
+        else:
+            for record in iter_archived(args.start, args.end, args.user_id):
+                record['timestamp'] = record['timestamp'].isoformat() if record['timestamp'] else None
+                sys.stdout.write(json.dumps(record) + '\n')
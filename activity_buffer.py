@@ -0,0 +1,209 @@
+"""
+Write-behind ingestion for user activity.
+
+Request handlers enqueue activity records in memory instead of committing
+one row each. A background writer drains the queue and persists a batch
+once it reaches max_batch records or flush_interval seconds have passed:
+one bulk INSERT into UserActivity, committed on its own and retried with
+exponential backoff before the batch is given up as failed, then the derived
+interest counters, analytics rollups and seen-content bits in a second
+transaction. A failure in the derived updates never loses the raw rows;
+it is counted in derived_failed and the rollups can be repaired with
+activity_rollups.py check --fix. When the queue is full, producers wait up
+to put_timeout seconds for room before the record is dropped and counted.
+Remaining records are flushed at shutdown.
+"""
+
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import db
+from models import UserActivity
+from interest_profiles import record_content_interactions
+from seen_content import mark_seen
+from activity_rollups import record_activities
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ActivityBuffer:
+    """Bounded in-memory queue of activity rows flushed by one writer thread"""
+
+    def __init__(self, app, max_batch=500, flush_interval=1.0, max_pending=10000, put_timeout=0.05,
+                 retries=3, backoff_base=0.5, backoff_cap=8.0, on_flush=None):
+        self.app = app
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.on_flush = on_flush
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._stopped = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.waited = 0
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.derived_failed = 0
+        self.last_flush_ms = None
+
+    def record(self, user_id, activity_type, content_id=None, search_query=None, duration=None,
+               activity_metadata=None):
+        """Queue one activity; returns False if it was dropped"""
+        row = {
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'content_id': content_id,
+            'search_query': search_query,
+            'duration': duration,
+            'activity_metadata': activity_metadata,
+            'timestamp': datetime.utcnow(),
+        }
+        with self._lock:
+            if self._stopped:
+                return False
+            self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.waited += 1
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                logger.warning(f"Activity queue full, dropping {activity_type} for user {user_id}")
+                return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _ensure_started(self):
+        if self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self.flush(batch)
+            if stopping:
+                return
+
+    def flush(self, batch):
+        start = time.monotonic()
+        with self.app.app_context():
+            if not self._insert(batch):
+                return
+            with self._lock:
+                self.written += len(batch)
+
+            try:
+                self._apply_derived(batch)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.derived_failed += len(batch)
+                logger.error(f"Error updating counters for {len(batch)} activities (rows were saved): {e}")
+
+            try:
+                if self.on_flush is not None:
+                    self.on_flush(batch)
+            except Exception as e:
+                logger.error(f"Error in activity flush callback: {e}")
+        with self._lock:
+            self.flushes += 1
+            self.last_flush_ms = round((time.monotonic() - start) * 1000, 2)
+
+    def _insert(self, batch):
+        """Commit the raw rows, retrying with backoff; the writer holds off new batches meanwhile"""
+        for attempt in range(self.retries + 1):
+            try:
+                db.session.execute(insert(UserActivity), batch)
+                db.session.commit()
+                return True
+            except Exception as e:
+                db.session.rollback()
+                if attempt == self.retries:
+                    with self._lock:
+                        self.failed += len(batch)
+                    logger.error(f"Error writing {len(batch)} activities, giving up after "
+                                 f"{attempt + 1} attempts: {e}")
+                    return False
+                with self._lock:
+                    self.retried += 1
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+                logger.warning(f"Error writing {len(batch)} activities, retrying in {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    def _apply_derived(self, batch):
+        """Interest counters, analytics rollups and seen-content bits for a saved batch"""
+        record_activities(batch)
+        record_content_interactions(
+            (row['user_id'], row['content_id'], row['timestamp']) for row in batch if row['content_id']
+        )
+        views = defaultdict(list)
+        for row in batch:
+            if row['content_id'] and row['activity_type'] == 'view':
+                views[row['user_id']].append(row['content_id'])
+        for user_id, content_ids in views.items():
+            mark_seen(user_id, *content_ids)
+
+    def shutdown(self, timeout=10):
+        """Stop accepting records and flush everything already queued"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            writer = self._writer
+        if writer is None:
+            return
+        self._queue.put(_STOP)
+        writer.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'flushes': self.flushes,
+                'waited': self.waited,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'retried': self.retried,
+                'derived_failed': self.derived_failed,
+                'last_flush_ms': self.last_flush_ms,
+            }
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Daily activity rollups for the analytics dashboard.
+
+ActivityRollup keeps one count per (user, day, dimension, value), where the
+dimension is 'activity_type', 'category' (content interactions by content
+category) or 'consultation'. Activity rollups are bumped in the same
+transaction that writes the UserActivity rows and consultations in the one
+that saves them, so the analytics page reads a few hundred pre-aggregated
+rows instead of grouping a user's whole history.
+
+    python activity_rollups.py backfill [--user-id ID]
+    python activity_rollups.py check [--user-id ID] [--sample 500] [--fix]
+"""
+
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import ActivityRollup, Consultation, HealthContent, UserActivity
+from catalog import catalog
+from activity_archive import archived_before
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('activity_type', 'category', 'consultation')
+
+# Consultations are a single series, stored under a fixed value
+CONSULTATION_VALUE = 'all'
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return value
+
+
+def _increment(user_id, day, dimension, value, amount=1):
+    updated = ActivityRollup.query.filter_by(
+        user_id=user_id, day=day, dimension=dimension, value=value
+    ).update({'count': ActivityRollup.count + amount}, synchronize_session=False)
+    if updated:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(ActivityRollup(
+                user_id=user_id, day=day, dimension=dimension, value=value, count=amount
+            ))
+    except IntegrityError:
+        # Another request created the row first
+        ActivityRollup.query.filter_by(
+            user_id=user_id, day=day, dimension=dimension, value=value
+        ).update({'count': ActivityRollup.count + amount}, synchronize_session=False)
+
+
+def record_activities(activities):
+    """Bump rollups for activity dicts (user_id, activity_type, content_id, timestamp); caller commits"""
+    snapshot = catalog.snapshot()
+    amounts = defaultdict(int)
+    for activity in activities:
+        day = (activity.get('timestamp') or datetime.utcnow()).date()
+        amounts[(activity['user_id'], day, 'activity_type', activity['activity_type'])] += 1
+        if activity.get('content_id'):
+            content = snapshot.get(activity['content_id'])
+            if content is None:
+                content = db.session.get(HealthContent, activity['content_id'])
+            if content is not None:
+                amounts[(activity['user_id'], day, 'category', content.category)] += 1
+    for (user_id, day, dimension, value), amount in amounts.items():
+        _increment(user_id, day, dimension, value, amount)
+
+
+def record_consultation(user_id, when=None):
+    """Count a new consultation in the user's daily series (caller commits)"""
+    _increment(user_id, (when or datetime.utcnow()).date(), 'consultation', CONSULTATION_VALUE)
+
+
+def _totals(user_id, dimension, since=None):
+    query = db.session.query(ActivityRollup.value, db.func.sum(ActivityRollup.count))\
+        .filter(ActivityRollup.user_id == user_id, ActivityRollup.dimension == dimension)
+    if since is not None:
+        query = query.filter(ActivityRollup.day >= since)
+    return query.group_by(ActivityRollup.value).all()
+
+
+def get_activity_stats(user_id):
+    """[(activity_type, count)] over the user's whole history"""
+    return [(value, int(total)) for value, total in _totals(user_id, 'activity_type')]
+
+
+def get_category_stats(user_id):
+    """[(category, interactions)] over the user's whole history"""
+    return [(value, int(total)) for value, total in _totals(user_id, 'category')]
+
+
+def get_consultation_trends(user_id, days=30):
+    """[(ISO date, consultations)] for the last days"""
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    rows = db.session.query(ActivityRollup.day, ActivityRollup.count).filter(
+        ActivityRollup.user_id == user_id,
+        ActivityRollup.dimension == 'consultation',
+        ActivityRollup.day >= since
+    ).order_by(ActivityRollup.day).all()
+    return [(day.isoformat(), count) for day, count in rows]
+
+
+def _hot_since():
+    """First day whose activity is still entirely in UserActivity, or None if nothing was archived"""
+    cutoff = archived_before()
+    return cutoff.date() + timedelta(days=1) if cutoff else None
+
+
+def _raw_aggregates(user_id=None, since=None):
+    """Rollup counts recomputed from UserActivity and Consultation, from since onwards"""
+    counts = defaultdict(int)
+    activity_day = db.func.date(UserActivity.timestamp)
+    consultation_day = db.func.date(Consultation.created_at)
+
+    queries = [
+        ('activity_type', db.session.query(UserActivity.user_id, activity_day, UserActivity.activity_type,
+                                           db.func.count(UserActivity.id))
+         .group_by(UserActivity.user_id, activity_day, UserActivity.activity_type)),
+        ('category', db.session.query(UserActivity.user_id, activity_day, HealthContent.category,
+                                      db.func.count(UserActivity.id))
+         .join(HealthContent, HealthContent.id == UserActivity.content_id)
+         .group_by(UserActivity.user_id, activity_day, HealthContent.category)),
+        ('consultation', db.session.query(Consultation.user_id, consultation_day, db.literal(CONSULTATION_VALUE),
+                                          db.func.count(Consultation.id))
+         .group_by(Consultation.user_id, consultation_day)),
+    ]
+    for dimension, query in queries:
+        model, column = (Consultation, Consultation.created_at) if dimension == 'consultation' \
+            else (UserActivity, UserActivity.timestamp)
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        if since is not None:
+            query = query.filter(column >= datetime.combine(since, datetime.min.time()))
+        for row_user_id, day, value, count in query:
+            counts[(row_user_id, _as_date(day), dimension, value)] += count
+    return counts
+
+
+def backfill(user_id=None):
+    """Rebuild rollups from raw history; days already archived keep their rollups"""
+    since = _hot_since()
+    delete_query = ActivityRollup.query
+    if user_id is not None:
+        delete_query = delete_query.filter_by(user_id=user_id)
+    if since is not None:
+        delete_query = delete_query.filter(ActivityRollup.day >= since)
+    delete_query.delete(synchronize_session=False)
+
+    counts = _raw_aggregates(user_id, since)
+    rows = [{'user_id': row_user_id, 'day': day, 'dimension': dimension, 'value': value, 'count': count}
+            for (row_user_id, day, dimension, value), count in counts.items()]
+    for start in range(0, len(rows), 5000):
+        db.session.execute(ActivityRollup.__table__.insert(), rows[start:start + 5000])
+    db.session.commit()
+    return len(rows)
+
+
+def check(user_id=None, sample=None):
+    """Compare rollups with raw aggregates for unarchived days; returns {user_id: [differences]}"""
+    since = _hot_since()
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        query = db.session.query(UserActivity.user_id).distinct()\
+            .union(db.session.query(Consultation.user_id).distinct())\
+            .union(db.session.query(ActivityRollup.user_id).distinct())
+        user_ids = sorted(row[0] for row in query)
+        if sample:
+            step = max(1, len(user_ids) // sample)
+            user_ids = user_ids[::step][:sample]
+
+    mismatches = {}
+    for checked_user_id in user_ids:
+        expected = _raw_aggregates(checked_user_id, since)
+        rollups = ActivityRollup.query.filter_by(user_id=checked_user_id)
+        if since is not None:
+            rollups = rollups.filter(ActivityRollup.day >= since)
+        actual = {(row.user_id, row.day, row.dimension, row.value): row.count for row in rollups}
+        differences = [(key[1].isoformat(), key[2], key[3], expected.get(key, 0), actual.get(key, 0))
+                       for key in sorted(set(expected) | set(actual), key=str)
+                       if expected.get(key, 0) != actual.get(key, 0)]
+        if differences:
+            mismatches[checked_user_id] = differences
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain daily activity rollups')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    backfill_parser = subparsers.add_parser('backfill')
+    backfill_parser.add_argument('--user-id', type=int, default=None)
+    check_parser = subparsers.add_parser('check')
+    check_parser.add_argument('--user-id', type=int, default=None)
+    check_parser.add_argument('--sample', type=int, default=None)
+    check_parser.add_argument('--fix', action='store_true', help='rebuild users that do not match')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        if args.command == 'backfill':
+            print("📊 Backfilling activity rollups...")
+            count = backfill(args.user_id)
+            print(f"✅ Wrote {count} rollup rows")
+        else:
+            mismatches = check(args.user_id, args.sample)
+            for mismatched_user, differences in mismatches.items():
+                print(f"❌ User {mismatched_user}: {len(differences)} differing rows "
+                      f"(day, dimension, value, raw, rollup) e.g. {differences[:3]}")
+                if args.fix:
+                    backfill(mismatched_user)
+            if mismatches:
+                print(f"{len(mismatches)} user(s) inconsistent" + (" - rebuilt" if args.fix else ""))
+                sys.exit(0 if args.fix else 1)
+            print("✅ Rollups match raw activity")
@@ -1,20 +1,124 @@
+import hashlib
 import json
 import logging
 import os
-import requests
+import time
 from datetime import datetime, timedelta
-from collections import defaultdict
-import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
 
-from app import db, HF_HEADERS, HF_API_BASE, BIOMEDICAL_NER_MODEL, MEDICAL_QA_MODEL, CLINICAL_CLASSIFIER_MODEL
-from models import User, HealthContent, UserActivity, UserRating, UserBookmark, Consultation, PredictiveInsight
+from app import (
+    app, db, socketio, HF_HEADERS, HF_API_BASE, BIOMEDICAL_NER_MODEL, MEDICAL_QA_MODEL, CLINICAL_CLASSIFIER_MODEL,
+    HF_POOL_SIZE, HF_MAX_RETRIES, HF_MAX_IN_FLIGHT, HF_DEFAULT_TIMEOUT, HF_MODEL_TIMEOUTS,
+    CONSULTATION_PARALLEL, CONSULTATION_POOL_SIZE, NER_DEADLINE, GEMINI_DEADLINE,
+    GEMINI_MODEL, ANALYSIS_CACHE_ENABLED, ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_PERSISTENT,
+    NER_MODE, NER_LOCAL_MIN_COVERAGE, MEDICAL_LEXICON_PATH,
+    JOB_QUEUE_WORKERS, INSIGHTS_REFRESH_INTERVAL, RECOMMENDATION_REUSE_WINDOW,
+    RECOMMENDATION_CACHE_TTL, RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CANDIDATE_FACTOR,
+    RECOMMENDER_BACKEND, COLLABORATIVE_MODEL_PATH, RELATED_CONTENT_TOP_N,
+    POPULARITY_HALF_LIFE_DAYS, POPULARITY_FLUSH_INTERVAL, POPULARITY_FLUSH_BATCH, POPULARITY_DECAY_INTERVAL,
+    ANN_INDEX_PATH, ANN_MIN_ITEMS, ANN_NPROBE, EMBEDDING_DIMENSIONS,
+    PRECOMPUTED_RECOMMENDATIONS, PRECOMPUTED_GENERATION_TTL,
+    ACTIVITY_FLUSH_SIZE, ACTIVITY_FLUSH_INTERVAL, ACTIVITY_QUEUE_SIZE, ACTIVITY_QUEUE_TIMEOUT, ACTIVITY_WRITE_RETRIES,
+    SEARCH_RESULT_LIMIT
+)
+from models import User, UserActivity, Consultation, PredictiveInsight
+from inference_client import InferenceClient
+from cache import SymptomAnalysisCache, SingleFlight, RecommendationCache, symptom_analysis_key
+from entity_extractor import MedicalEntityExtractor, merge_entities
+from job_queue import JobQueue
+from catalog import catalog
+from interest_profiles import get_interest_counts, condition_categories
+from seen_content import get_seen
+from activity_buffer import ActivityBuffer
+import activity_archive
+from similarity import SimilarityEngine
+from collaborative import ModelLoader
+from related_content import RelatedContentStore
+from popularity import PopularityTracker
+from ann_index import ContentEmbeddings
+from batch_recommendations import PrecomputedRecommendations
+from content_search import ContentSearch
+from suggestions import CompletionIndex
 
 logger = logging.getLogger(__name__)
 
+# Shared pooled client for Hugging Face inference calls
+hf_client = InferenceClient(
+    HF_API_BASE,
+    headers=HF_HEADERS,
+    pool_size=HF_POOL_SIZE,
+    default_timeout=HF_DEFAULT_TIMEOUT,
+    model_timeouts=HF_MODEL_TIMEOUTS,
+    max_retries=HF_MAX_RETRIES,
+    max_in_flight=HF_MAX_IN_FLIGHT,
+)
+
+# Offline lexicon-based entity extractor
+if MEDICAL_LEXICON_PATH:
+    local_extractor = MedicalEntityExtractor.from_file(MEDICAL_LEXICON_PATH)
+else:
+    local_extractor = MedicalEntityExtractor()
+
+# Cache of recent symptom analyses keyed on normalized prompt inputs
+analysis_cache = SymptomAnalysisCache(
+    max_size=ANALYSIS_CACHE_SIZE,
+    ttl=ANALYSIS_CACHE_TTL,
+    persistent=ANALYSIS_CACHE_PERSISTENT,
+)
+
+# Coalesces identical concurrent recommendation requests per user
+recommendation_flight = SingleFlight(reuse_window=RECOMMENDATION_REUSE_WINDOW)
+
+# TF-IDF text similarity over the catalog, rebuilt per catalog version
+similarity_engine = SimilarityEngine(catalog.snapshot)
+
+# Offline-trained collaborative filtering factors (memory-mapped)
+collaborative_models = ModelLoader(COLLABORATIVE_MODEL_PATH)
+
+# Content-based recommendations per (user, limit), invalidated on activity
+recommendation_cache = RecommendationCache(max_size=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+
+# Lists written by the nightly batch job (batch_recommendations.py)
+precomputed_recommendations = PrecomputedRecommendations(generation_ttl=PRECOMPUTED_GENERATION_TTL)
+
+# Write-behind activity logging; recommendations are invalidated once a batch is stored
+activity_buffer = ActivityBuffer(app, max_batch=ACTIVITY_FLUSH_SIZE, flush_interval=ACTIVITY_FLUSH_INTERVAL,
+                                 max_pending=ACTIVITY_QUEUE_SIZE, put_timeout=ACTIVITY_QUEUE_TIMEOUT,
+                                 retries=ACTIVITY_WRITE_RETRIES,
+                                 on_flush=lambda batch: invalidate_after_activity(batch))
+
+# Background workers for LLM jobs kept off the request path
+job_queue = JobQueue(app, workers=JOB_QUEUE_WORKERS)
+
+# Precomputed top-N related items, refreshed in the background on content edits
+related_content_store = RelatedContentStore(similarity_engine.index, top_n=RELATED_CONTENT_TOP_N)
+related_content_store.watch(job_queue)
+
+# Decayed engagement counters, flushed to HealthContent.popularity_score in batches
+popularity_tracker = PopularityTracker(job_queue, half_life_days=POPULARITY_HALF_LIFE_DAYS,
+                                       flush_interval=POPULARITY_FLUSH_INTERVAL,
+                                       flush_batch=POPULARITY_FLUSH_BATCH,
+                                       decay_interval=POPULARITY_DECAY_INTERVAL)
+
+# Content embeddings with an IVF index, used instead of exact scoring on large catalogs
+content_embeddings = ContentEmbeddings(similarity_engine.index, path=ANN_INDEX_PATH,
+                                       dimensions=EMBEDDING_DIMENSIONS, nprobe=ANN_NPROBE,
+                                       min_items=ANN_MIN_ITEMS)
+
+# Full-text search (FTS5 or tsvector), with its index created on first use
+content_search = ContentSearch(limit=SEARCH_RESULT_LIMIT)
+
+# Prefix index over titles and categories for search-as-you-type, rebuilt per catalog version
+search_suggestions = CompletionIndex(catalog, job_queue)
+
+# Bounded pool for fanning out independent AI calls (green threads under eventlet)
+consultation_executor = ThreadPoolExecutor(max_workers=CONSULTATION_POOL_SIZE,
+                                           thread_name_prefix='consultation')
+
 # Initialize Gemini AI
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', 'gemini_default_key')
 client = genai.Client(api_key=GEMINI_API_KEY)
@@ -33,23 +137,23 @@ class SymptomAnalysis(BaseModel):
     recommendations: list
 
 def extract_medical_entities(text):
+    """Extract medical entities with the local lexicon, consulting the remote model per NER_MODE"""
+    if NER_MODE == 'remote':
+        return extract_remote_medical_entities(text)
+
+    entities, coverage = local_extractor.extract(text)
+    if NER_MODE == 'hybrid' or coverage < NER_LOCAL_MIN_COVERAGE:
+        logger.debug(f"Local NER coverage {coverage:.2f}, consulting remote model")
+        return merge_entities(entities, extract_remote_medical_entities(text))
+    return entities
+
+def extract_remote_medical_entities(text):
     """Extract medical entities using Hugging Face NER model"""
     try:
-        url = f"{HF_API_BASE}/{BIOMEDICAL_NER_MODEL}"
-        response = requests.post(url, headers=HF_HEADERS, json={"inputs": text})
+        response = hf_client.post(BIOMEDICAL_NER_MODEL, {"inputs": text})
         
         if response.status_code == 200:
-            entities = response.json()
-            # Process and format entities
-            processed_entities = []
-            for entity in entities:
-                if isinstance(entity, dict) and 'entity' in entity:
-                    processed_entities.append({
-                        'text': entity.get('word', ''),
-                        'label': entity.get('entity', ''),
-                        'confidence': entity.get('score', 0.0)
-                    })
-            return processed_entities
+            return _format_ner_entities(response.json())
         else:
             logger.error(f"NER API error: {response.status_code}")
             return []
@@ -57,17 +161,53 @@ def extract_medical_entities(text):
         logger.error(f"Error extracting medical entities: {e}")
         return []
 
+def extract_remote_medical_entities_batch(texts):
+    """Extract entities for a list of texts in one NER request.
+
+    Returns one entity list per input, or None if the request failed so
+    callers can retry rather than store empty results.
+    """
+    if not texts:
+        return []
+    try:
+        response = hf_client.post(BIOMEDICAL_NER_MODEL, {"inputs": list(texts)})
+        if response.status_code != 200:
+            logger.error(f"NER API batch error: {response.status_code}")
+            return None
+
+        results = response.json()
+        if len(texts) == 1 and results and isinstance(results[0], dict):
+            results = [results]
+        if not isinstance(results, list) or len(results) != len(texts):
+            logger.error("NER API batch returned an unexpected shape")
+            return None
+        return [_format_ner_entities(entities) for entities in results]
+    except Exception as e:
+        logger.error(f"Error extracting medical entities in batch: {e}")
+        return None
+
+def _format_ner_entities(entities):
+    """Convert raw NER output into {'text', 'label', 'confidence'} dicts"""
+    processed_entities = []
+    for entity in entities:
+        if isinstance(entity, dict) and 'entity' in entity:
+            processed_entities.append({
+                'text': entity.get('word', ''),
+                'label': entity.get('entity', ''),
+                'confidence': entity.get('score', 0.0)
+            })
+    return processed_entities
+
 def answer_medical_question(question, context=""):
     """Answer medical questions using Hugging Face QA model"""
     try:
-        url = f"{HF_API_BASE}/{MEDICAL_QA_MODEL}"
         payload = {
             "inputs": {
                 "question": question,
                 "context": context if context else "Medical and healthcare information context."
             }
         }
-        response = requests.post(url, headers=HF_HEADERS, json=payload)
+        response = hf_client.post(MEDICAL_QA_MODEL, payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -81,8 +221,7 @@ def answer_medical_question(question, context=""):
 def classify_medical_content(text):
     """Classify medical content using Hugging Face classification model"""
     try:
-        url = f"{HF_API_BASE}/{CLINICAL_CLASSIFIER_MODEL}"
-        response = requests.post(url, headers=HF_HEADERS, json={"inputs": text})
+        response = hf_client.post(CLINICAL_CLASSIFIER_MODEL, {"inputs": text})
         
         if response.status_code == 200:
             result = response.json()
@@ -93,50 +232,65 @@ def classify_medical_content(text):
         logger.error(f"Error classifying medical content: {e}")
         return {"label": "general", "score": 0.5}
 
-def analyze_symptoms_with_gemini(symptoms_text, user_profile=None):
-    """Analyze symptoms using Gemini AI"""
-    try:
-        profile_context = ""
-        if user_profile:
-            profile_context = f"""
-            Patient Profile:
-            - Age: {user_profile.get('age', 'unknown')}
-            - Gender: {user_profile.get('gender', 'unknown')}
-            - Medical Conditions: {user_profile.get('medical_conditions', 'none')}
-            - Medications: {user_profile.get('medications', 'none')}
-            - Allergies: {user_profile.get('allergies', 'none')}
-            """
-
-        system_prompt = """You are a medical AI assistant. Analyze the provided symptoms and provide a structured assessment. 
-        IMPORTANT: Always include medical disclaimers and recommend consulting healthcare professionals.
-        Provide your response in JSON format with: condition, severity, confidence, and recommendations."""
-
-        prompt = f"""
-        {profile_context}
-        
-        Symptoms: {symptoms_text}
-        
-        Please analyze these symptoms and provide:
-        1. Most likely condition or conditions
-        2. Severity level (low, moderate, high, critical)
-        3. Confidence level (0.0 to 1.0)
-        4. Recommendations for next steps
-        
-        Include appropriate medical disclaimers.
+def _symptom_prompt(symptoms_text, user_profile=None):
+    profile_context = ""
+    if user_profile:
+        profile_context = f"""
+        Patient Profile:
+        - Age: {user_profile.get('age', 'unknown')}
+        - Gender: {user_profile.get('gender', 'unknown')}
+        - Medical Conditions: {user_profile.get('medical_conditions', 'none')}
+        - Medications: {user_profile.get('medications', 'none')}
+        - Allergies: {user_profile.get('allergies', 'none')}
         """
 
+    return f"""
+    {profile_context}
+    
+    Symptoms: {symptoms_text}
+    
+    Please analyze these symptoms and provide:
+    1. Most likely condition or conditions
+    2. Severity level (low, moderate, high, critical)
+    3. Confidence level (0.0 to 1.0)
+    4. Recommendations for next steps
+    
+    Include appropriate medical disclaimers.
+    """
+
+def _symptom_analysis_config():
+    system_prompt = """You are a medical AI assistant. Analyze the provided symptoms and provide a structured assessment. 
+    IMPORTANT: Always include medical disclaimers and recommend consulting healthcare professionals.
+    Provide your response in JSON format with: condition, severity, confidence, and recommendations."""
+
+    return types.GenerateContentConfig(
+        system_instruction=system_prompt,
+        response_mime_type="application/json",
+        response_schema=SymptomAnalysis,
+    )
+
+def analyze_symptoms_with_gemini(symptoms_text, user_profile=None, bypass_cache=False):
+    """Analyze symptoms using Gemini AI, reusing cached analyses of identical inputs"""
+    use_cache = ANALYSIS_CACHE_ENABLED and not bypass_cache
+    cache_key = symptom_analysis_key(symptoms_text, user_profile, GEMINI_MODEL)
+    if use_cache:
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    else:
+        analysis_cache.record_bypass()
+
+    try:
         response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-                response_schema=SymptomAnalysis,
-            ),
+            model=GEMINI_MODEL,
+            contents=_symptom_prompt(symptoms_text, user_profile),
+            config=_symptom_analysis_config(),
         )
 
         if response.text:
             analysis = json.loads(response.text)
+            if use_cache:
+                analysis_cache.set(cache_key, analysis, GEMINI_MODEL)
             return analysis
         else:
             return {
@@ -155,6 +309,96 @@ def analyze_symptoms_with_gemini(symptoms_text, user_profile=None):
             "recommendations": ["Please consult with a healthcare professional for proper diagnosis."]
         }
 
+def stream_symptom_analysis(symptoms_text, user_profile=None):
+    """Stream a Gemini symptom analysis.
+
+    Yields text chunks of the JSON document as they arrive; an identical
+    cached analysis is yielded as a single chunk. Parse the concatenated
+    chunks with parse_symptom_analysis().
+    """
+    cache_key = symptom_analysis_key(symptoms_text, user_profile, GEMINI_MODEL)
+    if ANALYSIS_CACHE_ENABLED:
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            yield json.dumps(cached)
+            return
+
+    stream = client.models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=_symptom_prompt(symptoms_text, user_profile),
+        config=_symptom_analysis_config(),
+    )
+    chunks = []
+    for chunk in stream:
+        if chunk.text:
+            chunks.append(chunk.text)
+            yield chunk.text
+
+    analysis = parse_symptom_analysis(''.join(chunks))
+    if ANALYSIS_CACHE_ENABLED and analysis.get('severity') != 'unknown':
+        analysis_cache.set(cache_key, analysis, GEMINI_MODEL)
+
+def parse_symptom_analysis(text):
+    """Parse a streamed analysis document, falling back when it is incomplete"""
+    try:
+        analysis = SymptomAnalysis.model_validate_json(text)
+        return analysis.model_dump()
+    except Exception as e:
+        logger.error(f"Error parsing streamed symptom analysis: {e}")
+        return _fallback_analysis()
+
+def _fallback_analysis():
+    return {
+        "condition": "Analysis unavailable",
+        "severity": "unknown",
+        "confidence": 0.0,
+        "recommendations": ["Please consult with a healthcare professional for proper diagnosis."]
+    }
+
+def _in_app_context(func, *args):
+    with app.app_context():
+        return func(*args)
+
+def analyze_consultation(symptoms_text, user_profile=None, parallel=None):
+    """Run entity extraction and Gemini symptom analysis for a consultation.
+
+    In parallel mode both calls are issued at once and each is bounded by its
+    own deadline; a side that misses its deadline is replaced by its fallback.
+    Returns (entities, analysis, timed_out) where timed_out names the calls
+    that did not finish in time.
+    """
+    if parallel is None:
+        parallel = CONSULTATION_PARALLEL
+
+    if not parallel:
+        entities = extract_medical_entities(symptoms_text)
+        analysis = analyze_symptoms_with_gemini(symptoms_text, user_profile)
+        return entities, analysis, []
+
+    start = time.monotonic()
+    ner_future = consultation_executor.submit(_in_app_context, extract_medical_entities, symptoms_text)
+    gemini_future = consultation_executor.submit(_in_app_context, analyze_symptoms_with_gemini,
+                                                 symptoms_text, user_profile)
+
+    timed_out = []
+
+    try:
+        entities = ner_future.result(timeout=max(0.0, NER_DEADLINE - (time.monotonic() - start)))
+    except FutureTimeout:
+        logger.warning(f"Entity extraction exceeded {NER_DEADLINE}s deadline")
+        timed_out.append('entities')
+        entities = []
+
+    try:
+        analysis = gemini_future.result(timeout=max(0.0, GEMINI_DEADLINE - (time.monotonic() - start)))
+    except FutureTimeout:
+        logger.warning(f"Symptom analysis exceeded {GEMINI_DEADLINE}s deadline")
+        timed_out.append('analysis')
+        analysis = _fallback_analysis()
+
+    logger.debug(f"Consultation analysis took {time.monotonic() - start:.2f}s")
+    return entities, analysis, timed_out
+
 def generate_health_recommendations(user_id):
     """Generate personalized health recommendations using Gemini AI"""
     try:
@@ -172,100 +416,187 @@ def generate_health_recommendations(user_id):
         }
 
         # Get user's recent activity patterns
-        recent_activities = UserActivity.query.filter_by(user_id=user_id)\
-            .filter(UserActivity.timestamp > datetime.utcnow() - timedelta(days=30))\
-            .all()
+        activity_summary = get_interest_counts(user_id, days=30)['category']
 
-        activity_summary = defaultdict(int)
-        for activity in recent_activities:
-            if activity.content_id:
-                content = HealthContent.query.get(activity.content_id)
-                if content:
-                    activity_summary[content.category] += 1
-
-        system_prompt = """You are a healthcare AI assistant specializing in personalized health recommendations. 
-        Generate specific, actionable health recommendations based on the user profile and activity patterns.
-        Provide recommendations in JSON format with title, description, category, priority, and confidence."""
-
-        prompt = f"""
-        User Profile: {json.dumps(user_profile)}
-        Recent Activity: {dict(activity_summary)}
-        
-        Generate 3-5 personalized health recommendations that are:
-        1. Specific to the user's profile and conditions
-        2. Actionable and practical
-        3. Evidence-based when possible
-        4. Include appropriate medical disclaimers
-        
-        Categories: nutrition, fitness, mental_health, cardiology, preventive_care, lifestyle
-        Priority levels: low, medium, high
-        """
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-            ),
-        )
-
-        if response.text:
-            recommendations_data = json.loads(response.text)
-            if isinstance(recommendations_data, list):
-                return recommendations_data
-            elif isinstance(recommendations_data, dict) and 'recommendations' in recommendations_data:
-                return recommendations_data['recommendations']
-        
-        return []
+        # Concurrent callers with identical inputs share one Gemini call
+        inputs_key = hashlib.sha256(json.dumps({
+            'user_id': user_id,
+            'profile': user_profile,
+            'activity': activity_summary
+        }, sort_keys=True).encode('utf-8')).hexdigest()
+        return recommendation_flight.do(inputs_key, _recommendations_with_gemini,
+                                        user_profile, dict(activity_summary))
 
     except Exception as e:
         logger.error(f"Error generating health recommendations: {e}")
         return []
 
+def _recommendations_with_gemini(user_profile, activity_summary):
+    system_prompt = """You are a healthcare AI assistant specializing in personalized health recommendations. 
+    Generate specific, actionable health recommendations based on the user profile and activity patterns.
+    Provide recommendations in JSON format with title, description, category, priority, and confidence."""
+
+    prompt = f"""
+    User Profile: {json.dumps(user_profile)}
+    Recent Activity: {activity_summary}
+    
+    Generate 3-5 personalized health recommendations that are:
+    1. Specific to the user's profile and conditions
+    2. Actionable and practical
+    3. Evidence-based when possible
+    4. Include appropriate medical disclaimers
+    
+    Categories: nutrition, fitness, mental_health, cardiology, preventive_care, lifestyle
+    Priority levels: low, medium, high
+    """
+
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            response_mime_type="application/json",
+        ),
+    )
+
+    if response.text:
+        recommendations_data = json.loads(response.text)
+        if isinstance(recommendations_data, list):
+            return recommendations_data
+        elif isinstance(recommendations_data, dict) and 'recommendations' in recommendations_data:
+            return recommendations_data['recommendations']
+    
+    return []
+
 def get_content_based_recommendations(user_id, limit=10):
-    """Content-based filtering recommendations"""
+    """Content-based filtering recommendations, cached per user and limit"""
+    content_ids = recommendation_cache.get(user_id, limit)
+    if content_ids is not None:
+        return catalog.snapshot().records(content_ids)
+
+    # Activity that invalidates the user while this runs makes the result stale
+    generation = recommendation_cache.generation(user_id)
+    recommendations = None
+    if RECOMMENDER_BACKEND == 'collaborative':
+        recommendations = get_collaborative_recommendations(user_id, limit)
+    if not recommendations and PRECOMPUTED_RECOMMENDATIONS:
+        content_ids = precomputed_recommendations.get(user_id, limit, exclude=_viewed_content_ids(user_id),
+                                                      changed_since=_interests_changed_since)
+        if content_ids:
+            recommendations = catalog.snapshot().records(content_ids)
+    if not recommendations:
+        recommendations = _compute_content_based_recommendations(user_id, limit)
+    recommendation_cache.set(user_id, limit, [content.id for content in recommendations], generation)
+    return recommendations
+
+def _interests_changed_since(user_id, since):
+    """Whether anything that invalidates the user's recommendations happened after since"""
+    if since is None:
+        return False
+    invalidated = recommendation_cache.last_invalidated(user_id)
+    if invalidated is not None and invalidated >= since:
+        return True
+    # Invalidations in other processes, or older than the cache remembers, show up as activity
+    return db.session.query(UserActivity.id).filter(
+        UserActivity.user_id == user_id,
+        UserActivity.timestamp > since,
+        db.or_(UserActivity.content_id.isnot(None), UserActivity.activity_type == 'profile_update')
+    ).first() is not None
+
+def invalidate_user_recommendations(user_id):
+    """Drop cached recommendations after the user's interests change"""
+    recommendation_cache.invalidate_user(user_id)
+
+def invalidate_after_activity(activities):
+    """Content interactions and profile edits change the user's interests"""
+    for user_id in {activity['user_id'] for activity in activities
+                    if activity['content_id'] or activity['activity_type'] == 'profile_update'}:
+        invalidate_user_recommendations(user_id)
+
+def _compute_content_based_recommendations(user_id, limit):
     user = User.query.get(user_id)
     if not user:
         return []
 
     interests = get_user_interests(user_id)
     
-    # Build query based on user interests
-    query = HealthContent.query
-    
-    # Filter by categories if user has interests
-    if interests.get('categories'):
-        query = query.filter(HealthContent.category.in_(interests['categories']))
-    
-    # Filter by age range
-    if user.age:
-        query = query.filter(
-            db.or_(
-                HealthContent.target_age_min == None,
-                HealthContent.target_age_min <= user.age
-            ),
-            db.or_(
-                HealthContent.target_age_max == None,
-                HealthContent.target_age_max >= user.age
-            )
-        )
-    
     # Exclude already viewed content
-    viewed_content_ids = db.session.query(UserActivity.content_id)\
-        .filter_by(user_id=user_id, activity_type='view')\
-        .filter(UserActivity.content_id.isnot(None))\
-        .subquery()
-    
-    query = query.filter(~HealthContent.id.in_(viewed_content_ids))
+    viewed_content_ids = _viewed_content_ids(user_id)
     
-    # Order by popularity and creation date
-    recommendations = query.order_by(
-        HealthContent.popularity_score.desc(),
-        HealthContent.created_at.desc()
-    ).limit(limit).all()
+    # Rank the in-memory catalog by popularity, filtered by interests and age range
+    snapshot = catalog.snapshot()
+    candidate_ids = snapshot.recommend(
+        max(limit * RECOMMENDATION_CANDIDATE_FACTOR, limit),
+        categories=interests.get('categories'),
+        age=user.age,
+        exclude=viewed_content_ids
+    )
     
-    return recommendations
+    # Re-rank candidates by similarity to what the user has viewed
+    interest_embedding = None
+    if viewed_content_ids:
+        interest_embedding = content_embeddings.interest_vector({content_id: 1.0 for content_id in viewed_content_ids})
+    if interest_embedding is not None:
+        candidate_ids = _rank_by_embedding(snapshot, user, candidate_ids, interest_embedding,
+                                           viewed_content_ids, max(limit * RECOMMENDATION_CANDIDATE_FACTOR, limit))
+    elif viewed_content_ids and len(candidate_ids) > limit:
+        index = similarity_engine.index()
+        interest_vector = index.interest_vector({content_id: 1.0 for content_id in viewed_content_ids})
+        if interest_vector is not None:
+            scores = index.scores(interest_vector)
+            candidate_ids = sorted(
+                candidate_ids,
+                key=lambda content_id: -scores[index.positions[content_id]]
+                if content_id in index.positions else 0.0
+            )
+    return snapshot.records(candidate_ids[:limit])
+
+def _rank_by_embedding(snapshot, user, candidate_ids, interest_embedding, viewed_content_ids, pool):
+    """Merge ANN neighbours of the interest embedding into the candidates and sort by similarity"""
+    eligible = snapshot.age_index.ids_for_age(user.age) if user.age else snapshot.by_id
+    scores = {content_id: score for content_id, score in
+              content_embeddings.search(interest_embedding, pool, exclude=viewed_content_ids)
+              if content_id in eligible}
+    ann = content_embeddings.get()
+    for content_id in candidate_ids:
+        if content_id not in scores:
+            vector = ann.vector_for(content_id)
+            scores[content_id] = float(vector @ interest_embedding) if vector is not None else 0.0
+    return sorted(scores, key=lambda content_id: -scores[content_id])
+
+def get_collaborative_recommendations(user_id, limit=10):
+    """Recommendations from the collaborative model, or None if the user is not in it"""
+    model = collaborative_models.get()
+    if model is None or not model.has_user(user_id):
+        return None
+
+    user = User.query.get(user_id)
+    if not user:
+        return []
+
+    snapshot = catalog.snapshot()
+    allowed = snapshot.age_index.ids_for_age(user.age) if user.age else snapshot.by_id
+    scored = model.recommend(user_id, limit, exclude=_viewed_content_ids(user_id), allowed=allowed)
+    return snapshot.records([content_id for content_id, _ in scored])
+
+def _viewed_content_ids(user_id):
+    return get_seen(user_id)
+
+def get_related_content(content_id, limit=4):
+    """Most textually similar content, falling back to same-category items"""
+    snapshot = catalog.snapshot()
+    related_ids = related_content_store.get(content_id, limit)
+    if related_ids:
+        return snapshot.records(related_ids)
+
+    # Not precomputed yet: score on the fly until the CLI rebuild has run
+    related_content_store.check_built()
+    similar = content_embeddings.similar_to(content_id, limit)
+    if similar is None:
+        similar = similarity_engine.index().similar_to(content_id, limit)
+    if not similar:
+        return snapshot.related(content_id, limit)
+    return snapshot.records([similar_id for similar_id, _ in similar])
 
 def get_user_interests(user_id):
     """Extract user interests from profile and activity history"""
@@ -282,31 +613,12 @@ def get_user_interests(user_id):
     }
     
     # Extract from medical conditions
-    if user.medical_conditions:
-        conditions = user.medical_conditions.lower()
-        if 'diabetes' in conditions:
-            interests['categories'].append('endocrinology')
-        if 'heart' in conditions or 'cardiac' in conditions:
-            interests['categories'].append('cardiology')
-        if 'mental' in conditions or 'anxiety' in conditions or 'depression' in conditions:
-            interests['categories'].append('mental_health')
-        if 'weight' in conditions or 'obesity' in conditions:
-            interests['categories'].append('nutrition')
+    interests['categories'].extend(condition_categories(user.medical_conditions))
     
     # Extract from user activity
-    recent_activities = UserActivity.query.filter_by(user_id=user_id)\
-        .filter(UserActivity.timestamp > datetime.utcnow() - timedelta(days=30))\
-        .all()
-    
-    activity_categories = defaultdict(int)
-    activity_types = defaultdict(int)
-    
-    for activity in recent_activities:
-        if activity.content_id:
-            content = HealthContent.query.get(activity.content_id)
-            if content:
-                activity_categories[content.category] += 1
-                activity_types[content.content_type] += 1
+    activity_counts = get_interest_counts(user_id, days=30)
+    activity_categories = activity_counts['category']
+    activity_types = activity_counts['content_type']
     
     # Get top categories and content types
     interests['categories'].extend([cat for cat, count in 
@@ -372,7 +684,7 @@ def generate_predictive_insights(user_id):
         """
 
         response = client.models.generate_content(
-            model="gemini-2.5-flash",
+            model=GEMINI_MODEL,
             contents=prompt
         )
 
@@ -381,6 +693,11 @@ def generate_predictive_insights(user_id):
             insights_data = json.loads(response.text)
             saved_insights = []
             
+            if insights_data:
+                # Fresh insights supersede the previously active set
+                PredictiveInsight.query.filter_by(user_id=user_id, is_active=True)\
+                    .update({'is_active': False})
+            
             for insight_data in insights_data:
                 insight = PredictiveInsight(
                     user_id=user_id,
@@ -399,3 +716,56 @@ def generate_predictive_insights(user_id):
     except Exception as e:
         logger.error(f"Error generating predictive insights: {e}")
         return []
+
+def serialize_insight(insight):
+    return {
+        'insight_type': insight.insight_type,
+        'title': insight.title,
+        'description': insight.description,
+        'confidence_score': insight.confidence_score,
+        'priority_level': insight.priority_level,
+        'created_at': insight.created_at.isoformat() if insight.created_at else None
+    }
+
+def _refresh_predictive_insights(user_id):
+    insights = generate_predictive_insights(user_id)
+    if insights:
+        socketio.emit('insights_update', {
+            'insights': [serialize_insight(insight) for insight in insights]
+        }, to=f'user_{user_id}')
+
+def schedule_predictive_insights(user_id):
+    """Queue insight generation for a user; duplicate pending jobs are dropped"""
+    return job_queue.submit(f'insights:{user_id}', _refresh_predictive_insights, user_id)
+
+def get_latest_insights(user_id, refresh=True):
+    """Return the active insights, scheduling a refresh when they are missing or stale"""
+    insights = PredictiveInsight.query.filter_by(user_id=user_id, is_active=True)\
+        .order_by(PredictiveInsight.created_at.desc()).all()
+
+    if refresh:
+        stale_before = datetime.utcnow() - timedelta(seconds=INSIGHTS_REFRESH_INTERVAL)
+        if not insights or insights[0].created_at < stale_before:
+            schedule_predictive_insights(user_id)
+    return insights
+
+def cache_stats():
+    """Counters for the AI and recommendation caching layers"""
+    return {
+        'analysis_cache': analysis_cache.stats(),
+        'recommendation_cache': recommendation_cache.stats(),
+        'recommendation_flight': recommendation_flight.stats(),
+        'job_queue': job_queue.stats(),
+        'catalog': catalog.stats(),
+        'similarity': similarity_engine.stats(),
+        'collaborative': collaborative_models.stats(),
+        'related_content': related_content_store.stats(),
+        'popularity': popularity_tracker.stats(),
+        'ann_index': content_embeddings.stats(),
+        'precomputed_recommendations': precomputed_recommendations.stats(),
+        'activity_buffer': activity_buffer.stats(),
+        'activity_archive': activity_archive.stats(),
+        'content_search': content_search.stats(),
+        'search_suggestions': search_suggestions.stats(),
+        'inference_client': hf_client.stats()
+    }
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Approximate nearest-neighbour search over content embeddings.
+
+IVFIndex partitions L2-normalized float32 vectors into inverted lists around
+spherical k-means centroids; a query scans only the nprobe lists whose
+centroids are closest. The index is stored as one binary file that is
+memory-mapped on load, and items can be appended without a rebuild;
+appended items are kept in a small '<path>.added' segment that is replayed
+on load and folded into the base file by the next full save. The header
+records where the vectors came from ('lsa' or 'vectors').
+
+ContentEmbeddings keeps an index next to the catalog. Embeddings come from a
+latent semantic (truncated SVD) projection of the TF-IDF matrix, so they are
+computed locally on CPU; the fitted projection is saved as '<path>.lsa' so
+any process that loads the index can embed new catalog items. Precomputed
+vectors can be indexed from the command line instead. Indexes are only built from the command line (schedule the
+build with cron); when an index is missing or its coverage slips, a warning
+is logged and exact scoring is used until it is rebuilt.
+
+    python ann_index.py build                       # from the catalog
+    python ann_index.py build --vectors vectors.npz # arrays 'ids' and 'vectors'
+    python ann_index.py benchmark --items 100000
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from scipy.sparse.linalg import svds
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IVF2'
+HEADER = struct.Struct('<4sIII16s')  # magic, vectors, dimensions, lists, vector source
+# Files written before the source was recorded
+LEGACY_MAGIC = b'IVF1'
+LEGACY_HEADER = struct.Struct('<4sIII')
+
+SOURCE_LSA = 'lsa'
+SOURCE_VECTORS = 'vectors'
+
+
+def added_path(path):
+    return f"{path}.added"
+
+
+def embedder_path(path):
+    return f"{path}.lsa"
+
+
+def _stamp(path):
+    """Identifies one write of a base index file"""
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors, clusters, iterations=10, sample=50000, seed=0):
+    """Spherical k-means centroids fitted on a random sample of the vectors"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters so every list stays usable
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign(vectors, centroids, chunk=8192):
+    """Index of the closest centroid for each vector"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        assignments[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """Inverted-file index over normalized vectors scored by inner product"""
+
+    def __init__(self, centroids, offsets, ids, vectors, source=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.dimensions = centroids.shape[1]
+        self.source = source
+        self._positions = {int(content_id): row for row, content_id in enumerate(ids)}
+        # Items appended since build/load, per list
+        self._added = {}
+        self._added_vectors = {}
+        self._added_positions = {}
+
+    @classmethod
+    def build(cls, ids, vectors, lists=None, iterations=10, source=None):
+        vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        lists = lists or max(1, int(np.sqrt(len(ids))))
+        lists = min(lists, len(ids))
+        centroids = kmeans(vectors, lists, iterations)
+
+        assignments = assign(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=lists))
+        return cls(centroids, offsets, ids[order], np.ascontiguousarray(vectors[order]), source)
+
+    def __len__(self):
+        return len(self.ids) + sum(len(ids) for ids in self._added.values())
+
+    def __contains__(self, content_id):
+        return content_id in self._positions or content_id in self._added_positions
+
+    def add(self, content_id, vector):
+        """Append one item to its closest list; persisted on the next save"""
+        vector = normalize(vector).reshape(-1)
+        list_number = int(np.argmax(self.centroids @ vector))
+        added = self._added.setdefault(list_number, [])
+        self._added_positions[int(content_id)] = (list_number, len(added))
+        added.append(int(content_id))
+        self._added_vectors.setdefault(list_number, []).append(vector)
+
+    def _added_arrays(self):
+        ids, vectors, lists = [], [], []
+        for list_number, added in self._added.items():
+            ids.extend(added)
+            vectors.extend(self._added_vectors[list_number])
+            lists.extend([list_number] * len(added))
+        return (np.asarray(ids, dtype=np.int64),
+                np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions),
+                np.asarray(lists, dtype=np.int64))
+
+    def vector_for(self, content_id):
+        row = self._positions.get(content_id)
+        if row is not None:
+            return np.asarray(self.vectors[row])
+        position = self._added_positions.get(content_id)
+        if position is not None:
+            list_number, index = position
+            return self._added_vectors[list_number][index]
+        return None
+
+    def search(self, query, k=10, nprobe=8, exclude=None):
+        """Return [(content_id, score)] for the approximate k nearest items"""
+        query = normalize(query).reshape(-1)
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        candidate_ids = []
+        candidate_scores = []
+        for list_number in probes:
+            start, end = self.offsets[list_number], self.offsets[list_number + 1]
+            if end > start:
+                candidate_ids.append(self.ids[start:end])
+                candidate_scores.append(self.vectors[start:end] @ query)
+            if list_number in self._added:
+                candidate_ids.append(np.asarray(self._added[list_number], dtype=np.int64))
+                candidate_scores.append(np.asarray(self._added_vectors[list_number]) @ query)
+        if not candidate_ids:
+            return []
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if exclude:
+            scores[np.isin(ids, list(exclude))] = -np.inf
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(ids[row]), float(scores[row])) for row in best if np.isfinite(scores[row])]
+
+    def save(self, path):
+        """Write the index (including appended items) to one file, replacing it atomically"""
+        added_ids, added_vectors, added_lists = self._added_arrays()
+        ids = np.concatenate([np.asarray(self.ids), added_ids])
+        vectors = np.concatenate([np.asarray(self.vectors), added_vectors])
+        lists = np.concatenate([np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets)), added_lists])
+        order = np.argsort(lists, kind='stable')
+        offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(lists, minlength=len(self.centroids)))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(ids), self.dimensions, len(self.centroids),
+                                (self.source or '').encode('ascii')))
+            f.write(np.ascontiguousarray(self.centroids, dtype='<f4').tobytes())
+            f.write(offsets.astype('<i8').tobytes())
+            f.write(ids[order].astype('<i8').tobytes())
+            f.write(np.ascontiguousarray(vectors[order], dtype='<f4').tobytes())
+        os.replace(tmp_path, path)
+        # The base file now holds the appended items
+        if os.path.exists(added_path(path)):
+            os.remove(added_path(path))
+
+    def save_added(self, path):
+        """Write the items appended since the base file was saved to its segment"""
+        ids, vectors, lists = self._added_arrays()
+        tmp_path = f"{added_path(path)}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, base=_stamp(path), ids=ids, vectors=vectors, lists=lists)
+        os.replace(tmp_path, added_path(path))
+
+    def _replay(self, path):
+        """Re-append the items of a segment written against this base file"""
+        with np.load(added_path(path)) as segment:
+            if not np.array_equal(segment['base'], _stamp(path)):
+                logger.warning(f"Ignoring {added_path(path)}: written for a previous build of {path}")
+                return
+            for content_id, vector, list_number in zip(segment['ids'], segment['vectors'], segment['lists']):
+                added = self._added.setdefault(int(list_number), [])
+                self._added_positions[int(content_id)] = (int(list_number), len(added))
+                added.append(int(content_id))
+                self._added_vectors.setdefault(int(list_number), []).append(vector)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+            f.seek(0)
+            if magic == MAGIC:
+                magic, count, dimensions, lists, source = HEADER.unpack(f.read(HEADER.size))
+                source = source.rstrip(b'\0').decode('ascii') or None
+                offset = HEADER.size
+            elif magic == LEGACY_MAGIC:
+                magic, count, dimensions, lists = LEGACY_HEADER.unpack(f.read(LEGACY_HEADER.size))
+                source = None
+                offset = LEGACY_HEADER.size
+            else:
+                raise ValueError(f"{path} is not an IVF index")
+
+        centroids = np.array(np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(lists, dimensions)))
+        offset += lists * dimensions * 4
+        offsets = np.array(np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(lists + 1,)))
+        offset += (lists + 1) * 8
+        ids = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(count,))
+        offset += count * 8
+        vectors = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(count, dimensions))
+        index = cls(centroids, offsets, ids, vectors, source)
+        if os.path.exists(added_path(path)):
+            index._replay(path)
+        return index
+
+
+class LsaEmbedder:
+    """Projects TF-IDF rows onto their top singular directions"""
+
+    def __init__(self, components, terms):
+        self.components = components
+        # Vocabulary term of each component column, so rows of a later TF-IDF index can be mapped
+        self.terms = list(terms)
+        self._mapped = (None, None)
+
+    @classmethod
+    def fit(cls, tfidf, dimensions=128):
+        matrix = tfidf.matrix
+        dimensions = max(1, min(dimensions, min(matrix.shape) - 1))
+        _, _, vt = svds(matrix.astype(np.float32), k=dimensions)
+        terms = sorted(tfidf.vocabulary, key=tfidf.vocabulary.get)
+        return cls(vt.astype(np.float32), terms)
+
+    def _columns(self, tfidf):
+        """Columns of tfidf holding the fitted terms, or None if they line up already"""
+        # Vocabularies only grow at the end, so a mapping stays valid for the index's lifetime
+        vocabulary, columns = self._mapped
+        if vocabulary is tfidf.vocabulary:
+            return columns
+        columns = np.array([tfidf.vocabulary.get(term, -1) for term in self.terms], dtype=np.int64)
+        if np.array_equal(columns, np.arange(len(self.terms))):
+            columns = None
+        self._mapped = (tfidf.vocabulary, columns)
+        return columns
+
+    def embed(self, tfidf, rows=None):
+        matrix = tfidf.matrix if rows is None else tfidf.matrix[rows]
+        columns = self._columns(tfidf)
+        if columns is None:
+            # Terms added to the vocabulary after fitting have no direction
+            return normalize(np.asarray(matrix[:, :len(self.terms)] @ self.components.T))
+        known = columns >= 0
+        return normalize(np.asarray(matrix[:, columns[known]] @ self.components[:, known].T))
+
+    def save(self, path, base_path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, base=_stamp(base_path), components=self.components, terms=np.array(self.terms))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, base_path):
+        """The embedder saved with the given base index file, or None"""
+        with np.load(path) as saved:
+            if not np.array_equal(saved['base'], _stamp(base_path)):
+                return None
+            return cls(saved['components'], saved['terms'].tolist())
+
+
+class ContentEmbeddings:
+    """Keeps an IVFIndex of catalog embeddings in step with the TF-IDF index.
+
+    Fitting and clustering are CPU-bound, so builds only run from the command
+    line (or cron), never from a request. While no index exists, while one
+    misses more than 1% of the catalog, and for catalogs smaller than
+    min_items, callers get None and use exact TF-IDF scoring instead.
+    """
+
+    def __init__(self, tfidf_provider, path=None, dimensions=128, nprobe=8, min_items=20000):
+        self._tfidf_provider = tfidf_provider
+        self.path = path
+        self.dimensions = dimensions
+        self.nprobe = nprobe
+        self.min_items = min_items
+        self._ann = None
+        self._embedder = None
+        self._base = None
+        self._lock = threading.Lock()
+        self._load_attempted = False
+        self._checked = None
+        self._usable = False
+        self._caught_up = (None, 0)
+        self.builds = 0
+        self.incremental_adds = 0
+        self.last_build_seconds = None
+
+    def get(self):
+        """The loaded index, or None when callers should use exact scoring"""
+        tfidf = self._tfidf_provider()
+        if len(tfidf) < self.min_items:
+            return None
+        if tfidf is not self._checked and self._ann is not None and self._rebuilt_on_disk():
+            # Pick up a build written by the command line since this process loaded the index
+            self._ann = None
+            self._load_attempted = False
+        if self._ann is None and not self._load_attempted:
+            self._load()
+        if self._ann is None:
+            return None
+        self._catch_up(tfidf)
+        if tfidf is not self._checked:
+            # Loaded from disk or the TF-IDF index was rebuilt: stop using it if coverage slipped
+            self._checked = tfidf
+            missing = self._missing(tfidf)
+            self._usable = missing <= len(tfidf) // 100
+            if not self._usable:
+                command = 'ann_index.py build --vectors' if self._ann.source == SOURCE_VECTORS else 'ann_index.py build'
+                logger.warning(f"ANN index at {self.path} is missing {missing} of {len(tfidf)} items; "
+                               f"using exact scoring until it is rebuilt with {command}")
+        return self._ann if self._usable else None
+
+    def _rebuilt_on_disk(self):
+        return (self._base is not None and os.path.exists(self.path)
+                and not np.array_equal(_stamp(self.path), self._base))
+
+    def _load(self):
+        self._load_attempted = True
+        if not self.path or not os.path.exists(self.path):
+            logger.warning(f"No ANN index at {self.path}; using exact scoring until ann_index.py build has run")
+            return
+        try:
+            with self._lock:
+                self._base = _stamp(self.path)
+                self._ann = IVFIndex.load(self.path)
+                self._embedder = None
+                self._checked = None
+                self._caught_up = (None, 0)
+                if self._ann.source == SOURCE_LSA and os.path.exists(embedder_path(self.path)):
+                    self._embedder = LsaEmbedder.load(embedder_path(self.path), self.path)
+            logger.info(f"Loaded ANN index with {len(self._ann)} vectors from {self.path}")
+            if self._ann.source == SOURCE_LSA and self._embedder is None:
+                logger.warning(f"No embedder saved with {self.path}; new items are not indexed until it is rebuilt")
+        except Exception as e:
+            logger.error(f"Error loading ANN index: {e}")
+
+    def _missing(self, tfidf):
+        return sum(1 for content_id in tfidf.positions if content_id not in self._ann)
+
+    def _catch_up(self, tfidf):
+        """Embed items added to the catalog since the index was built and save them to its segment"""
+        if self._embedder is None or self._caught_up == (tfidf, len(tfidf)):
+            return
+        with self._lock:
+            self._caught_up = (tfidf, len(tfidf))
+            new_rows = [row for content_id, row in tfidf.positions.items() if content_id not in self._ann]
+            if not new_rows:
+                return
+            vectors = self._embedder.embed(tfidf, new_rows)
+            for row, vector in zip(new_rows, vectors):
+                self._ann.add(int(tfidf.ids[row]), vector)
+            self.incremental_adds += len(new_rows)
+            if self.path and not self._rebuilt_on_disk():
+                try:
+                    self._ann.save_added(self.path)
+                except OSError as e:
+                    logger.error(f"Error saving ANN index segment: {e}")
+
+    def build(self):
+        start = time.monotonic()
+        tfidf = self._tfidf_provider()
+        embedder = LsaEmbedder.fit(tfidf, self.dimensions)
+        ann = IVFIndex.build(tfidf.ids, embedder.embed(tfidf), source=SOURCE_LSA)
+        base = None
+        if self.path:
+            ann.save(self.path)
+            embedder.save(embedder_path(self.path), self.path)
+            base = _stamp(self.path)
+        with self._lock:
+            self._ann, self._embedder, self._base = ann, embedder, base
+            self._checked = None
+            self._caught_up = (tfidf, len(tfidf))
+        self.builds += 1
+        self.last_build_seconds = round(time.monotonic() - start, 2)
+        logger.info(f"Built ANN index over {len(ann)} items in {self.last_build_seconds}s")
+        return ann
+
+    def similar_to(self, content_id, k=4):
+        """Approximate neighbours of an indexed item, or None if it is not covered"""
+        ann = self.get()
+        vector = ann.vector_for(content_id) if ann is not None else None
+        if vector is None:
+            return None
+        return ann.search(vector, k, self.nprobe, exclude={content_id})
+
+    def interest_vector(self, weighted_ids):
+        ann = self.get()
+        if ann is None:
+            return None
+        vectors = [(ann.vector_for(content_id), weight) for content_id, weight in weighted_ids.items()]
+        vectors = [vector * weight for vector, weight in vectors if vector is not None]
+        if not vectors:
+            return None
+        return normalize(np.sum(vectors, axis=0))
+
+    def search(self, vector, k=10, exclude=None):
+        ann = self.get()
+        if ann is None or vector is None:
+            return []
+        return ann.search(vector, k, self.nprobe, exclude)
+
+    def stats(self):
+        ann = self._ann
+        return {
+            'ready': ann is not None,
+            'vectors': len(ann) if ann is not None else 0,
+            'lists': len(ann.centroids) if ann is not None else 0,
+            'source': ann.source if ann is not None else None,
+            'nprobe': self.nprobe,
+            'builds': self.builds,
+            'incremental_adds': self.incremental_adds,
+            'last_build_seconds': self.last_build_seconds,
+        }
+
+
+def benchmark(items=100000, dimensions=128, clusters=500, queries=500, k=10):
+    """Recall@k and latency of IVF search against exact brute force"""
+    rng = np.random.default_rng(9)
+    # Clustered vectors resemble topical content better than uniform noise
+    centers = normalize(rng.standard_normal((clusters, dimensions)))
+    vectors = normalize(centers[rng.integers(0, clusters, items)] +
+                        0.15 * rng.standard_normal((items, dimensions)).astype(np.float32))
+    ids = np.arange(1, items + 1, dtype=np.int64)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(ids, vectors)
+    build_seconds = time.perf_counter() - start
+    path = '/tmp/ann_benchmark.ivf'
+    index.save(path)
+    index = IVFIndex.load(path)
+
+    query_rows = rng.choice(items, queries, replace=False)
+    exact = []
+    exact_latencies = []
+    for row in query_rows:
+        start = time.perf_counter()
+        scores = vectors @ vectors[row]
+        best = np.argpartition(-scores, k)[:k + 1]
+        exact.append({int(ids[i]) for i in best if i != row})
+        exact_latencies.append((time.perf_counter() - start) * 1000)
+
+    results = {
+        'items': items,
+        'dimensions': dimensions,
+        'lists': len(index.centroids),
+        'build_seconds': round(build_seconds, 2),
+        'exact_p50_ms': round(sorted(exact_latencies)[queries // 2], 3),
+    }
+    for nprobe in (1, 4, 8, 16, 32):
+        latencies = []
+        hits = 0
+        for row, truth in zip(query_rows, exact):
+            start = time.perf_counter()
+            found = index.search(vectors[row], k, nprobe, exclude={int(ids[row])})
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(truth & {content_id for content_id, _ in found})
+        latencies.sort()
+        results[f'nprobe_{nprobe}'] = {
+            'recall_at_k': round(hits / (queries * k), 4),
+            'p50_ms': round(latencies[queries // 2], 3),
+            'p99_ms': round(latencies[int(queries * 0.99) - 1], 3),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or benchmark the content ANN index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build')
+    build_parser.add_argument('--vectors', default=None, help="npz file with 'ids' and 'vectors' arrays")
+    build_parser.add_argument('--output', default=None)
+    bench_parser = subparsers.add_parser('benchmark')
+    bench_parser.add_argument('--items', type=int, default=100000)
+    bench_parser.add_argument('--dimensions', type=int, default=128)
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        print(json.dumps(benchmark(args.items, args.dimensions), indent=2))
+    elif args.vectors:
+        from app import ANN_INDEX_PATH
+        arrays = np.load(args.vectors)
+        IVFIndex.build(arrays['ids'], arrays['vectors'], source=SOURCE_VECTORS).save(args.output or ANN_INDEX_PATH)
+        print(f"✅ Indexed {len(arrays['ids'])} precomputed vectors")
+    else:
+        from app import app
+        from ai_services import content_embeddings
+        with app.app_context():
+            print("🧭 Building content ANN index...")
+            if args.output:
+                content_embeddings.path = args.output
+            ann = content_embeddings.build()
+            print(f"✅ Indexed {len(ann)} items")
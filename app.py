@@ -109,7 +109,7 @@ HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY', 'hf_default_key')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', 'gemini_default_key')
 
 # Hugging Face API endpoints
-HF_API_BASE = "https://api-inference.huggingface.co/models"
+HF_API_BASE = os.environ.get('HF_API_BASE', "https://api-inference.huggingface.co/models")
 HF_HEADERS = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
 
 # Medical NLP models
@@ -117,6 +117,111 @@ BIOMEDICAL_NER_MODEL = "d4data/biomedical-ner-all"
 MEDICAL_QA_MODEL = "deepset/roberta-base-squad2"
 CLINICAL_CLASSIFIER_MODEL = "microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract-fulltext"
 
+# Gemini model used for all generation calls
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', "gemini-2.5-flash")
+
+# Symptom analysis cache settings
+ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', 3600))
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024))
+ANALYSIS_CACHE_PERSISTENT = os.environ.get('ANALYSIS_CACHE_PERSISTENT', 'false').lower() == 'true'
+
+# Entity extraction: 'local' (lexicon, remote only on low coverage), 'hybrid' (both) or 'remote'
+NER_MODE = os.environ.get('NER_MODE', 'local').lower()
+NER_LOCAL_MIN_COVERAGE = float(os.environ.get('NER_LOCAL_MIN_COVERAGE', 0.5))
+MEDICAL_LEXICON_PATH = os.environ.get('MEDICAL_LEXICON_PATH')
+
+# Hugging Face inference client settings
+HF_POOL_SIZE = int(os.environ.get('HF_POOL_SIZE', 10))
+HF_MAX_RETRIES = int(os.environ.get('HF_MAX_RETRIES', 2))
+HF_MAX_IN_FLIGHT = int(os.environ.get('HF_MAX_IN_FLIGHT', 8))
+HF_CONNECT_TIMEOUT = float(os.environ.get('HF_CONNECT_TIMEOUT', 3.05))
+HF_READ_TIMEOUT = float(os.environ.get('HF_READ_TIMEOUT', 15))
+HF_DEFAULT_TIMEOUT = (HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT)
+# (connect, read) timeouts in seconds per model; NER and classification answer faster than QA
+HF_MODEL_TIMEOUTS = {
+    BIOMEDICAL_NER_MODEL: (HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT * 2 / 3),
+    MEDICAL_QA_MODEL: HF_DEFAULT_TIMEOUT,
+    CLINICAL_CLASSIFIER_MODEL: (HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT * 2 / 3),
+}
+
+# Consultation fan-out settings (deadlines in seconds)
+CONSULTATION_PARALLEL = os.environ.get('CONSULTATION_PARALLEL', 'true').lower() == 'true'
+CONSULTATION_POOL_SIZE = int(os.environ.get('CONSULTATION_POOL_SIZE', 16))
+NER_DEADLINE = float(os.environ.get('NER_DEADLINE', 8))
+GEMINI_DEADLINE = float(os.environ.get('GEMINI_DEADLINE', 30))
+
+# Background job settings
+JOB_QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', 2))
+INSIGHTS_REFRESH_INTERVAL = int(os.environ.get('INSIGHTS_REFRESH_INTERVAL', 6 * 3600))
+
+# Seconds a finished recommendation call is reused for identical requests
+RECOMMENDATION_REUSE_WINDOW = float(os.environ.get('RECOMMENDATION_REUSE_WINDOW', 30))
+
+# Content-based recommendation cache settings
+RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 600))
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 4096))
+# Popularity-ranked candidates per slot that are re-ranked by text similarity
+RECOMMENDATION_CANDIDATE_FACTOR = int(os.environ.get('RECOMMENDATION_CANDIDATE_FACTOR', 5))
+# 'content' or 'collaborative' (falls back to content for users missing from the model)
+RECOMMENDER_BACKEND = os.environ.get('RECOMMENDER_BACKEND', 'content').lower()
+COLLABORATIVE_MODEL_PATH = os.environ.get('COLLABORATIVE_MODEL_PATH', 'collaborative_model.bin')
+
+# Seconds before the in-memory content catalog is reloaded even without local edits
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 300))
+
+# Related items stored per content id in the related_content table
+RELATED_CONTENT_TOP_N = int(os.environ.get('RELATED_CONTENT_TOP_N', 10))
+
+# Engagement-driven popularity: decay half-life, batch flush and full decay cadence
+POPULARITY_HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', 7))
+POPULARITY_FLUSH_INTERVAL = int(os.environ.get('POPULARITY_FLUSH_INTERVAL', 60))
+POPULARITY_FLUSH_BATCH = int(os.environ.get('POPULARITY_FLUSH_BATCH', 500))
+POPULARITY_DECAY_INTERVAL = int(os.environ.get('POPULARITY_DECAY_INTERVAL', 3600))
+
+# Approximate nearest-neighbour index over content embeddings (used above ANN_MIN_ITEMS)
+ANN_INDEX_PATH = os.environ.get('ANN_INDEX_PATH', 'content_ann.ivf')
+ANN_MIN_ITEMS = int(os.environ.get('ANN_MIN_ITEMS', 20000))
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', 16))
+EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', 128))
+
+# Nightly precomputed recommendations: list length stored per user and how
+# often request handlers re-check which generation is current
+PRECOMPUTED_RECOMMENDATIONS = os.environ.get('PRECOMPUTED_RECOMMENDATIONS', 'true').lower() == 'true'
+PRECOMPUTED_TOP_N = int(os.environ.get('PRECOMPUTED_TOP_N', 20))
+PRECOMPUTED_GENERATION_TTL = int(os.environ.get('PRECOMPUTED_GENERATION_TTL', 60))
+
+# Write-behind activity logging: batch size, max seconds between flushes,
+# queue bound, how long producers wait for room before dropping a record and
+# how many times a failed batch insert is retried
+ACTIVITY_BUFFER_ENABLED = os.environ.get('ACTIVITY_BUFFER_ENABLED', 'true').lower() == 'true'
+ACTIVITY_FLUSH_SIZE = int(os.environ.get('ACTIVITY_FLUSH_SIZE', 500))
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 1.0))
+ACTIVITY_QUEUE_SIZE = int(os.environ.get('ACTIVITY_QUEUE_SIZE', 10000))
+ACTIVITY_QUEUE_TIMEOUT = float(os.environ.get('ACTIVITY_QUEUE_TIMEOUT', 0.05))
+ACTIVITY_WRITE_RETRIES = int(os.environ.get('ACTIVITY_WRITE_RETRIES', 3))
+
+# Full-text content search: results per page and how strongly popularity_score
+# boosts relevance (0 ranks on text relevance alone)
+SEARCH_RESULT_LIMIT = int(os.environ.get('SEARCH_RESULT_LIMIT', 50))
+SEARCH_POPULARITY_WEIGHT = float(os.environ.get('SEARCH_POPULARITY_WEIGHT', 0.5))
+
+# Socket track_activity events: seconds duplicates are merged over, per-user
+# token bucket (events/sec and burst) and minimum seconds between pushes
+SOCKET_ACTIVITY_WINDOW = float(os.environ.get('SOCKET_ACTIVITY_WINDOW', 1.0))
+SOCKET_ACTIVITY_RATE = float(os.environ.get('SOCKET_ACTIVITY_RATE', 5))
+SOCKET_ACTIVITY_BURST = int(os.environ.get('SOCKET_ACTIVITY_BURST', 20))
+QUICK_RECOMMENDATIONS_INTERVAL = float(os.environ.get('QUICK_RECOMMENDATIONS_INTERVAL', 5))
+
+# Activity retention: rows older than this many days are moved to compressed
+# day-partitioned NDJSON files by `python activity_archive.py archive`
+ACTIVITY_RETENTION_DAYS = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 180))
+ACTIVITY_ARCHIVE_DIR = os.environ.get('ACTIVITY_ARCHIVE_DIR', 'activity_archive')
+ACTIVITY_ARCHIVE_BATCH = int(os.environ.get('ACTIVITY_ARCHIVE_BATCH', 5000))
+
+# Usernames allowed to read operational endpoints such as /api/cache/stats
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
 # Custom Jinja2 filters
 @app.template_filter('nl2br')
 def nl2br_filter(s):
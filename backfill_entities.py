@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Backfill or re-extract medical entities for historical consultations.
+
+Streams Consultation rows in keyset-paginated chunks, extracts entities in
+batches (local lexicon, remote NER model or both), writes them back with bulk
+UPDATEs and checkpoints the last processed id so an interrupted run resumes.
+Rows whose extraction failed are kept in the checkpoint and retried first on
+the next run.
+
+Examples:
+    python backfill_entities.py                       # only rows with no/empty entities
+    python backfill_entities.py --all --mode remote   # re-extract everything remotely
+    python backfill_entities.py --reset               # ignore the saved checkpoint
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import update
+
+from app import app, db, NER_LOCAL_MIN_COVERAGE
+from models import Consultation
+from ai_services import local_extractor, extract_remote_medical_entities_batch
+from entity_extractor import merge_entities
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = 'backfill_entities.checkpoint.json'
+
+
+def load_checkpoint(path):
+    """Return (last_id, failed_ids) from a previous run"""
+    if not os.path.exists(path):
+        return 0, []
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint.get('last_id', 0), checkpoint.get('failed_ids', [])
+
+
+def save_checkpoint(path, last_id, processed, failed_ids=()):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id, 'processed': processed, 'failed_ids': sorted(failed_ids),
+                   'saved_at': time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def _chunk_query(include_all):
+    query = db.session.query(Consultation.id, Consultation.symptoms)
+    if not include_all:
+        query = query.filter(db.or_(
+            Consultation.extracted_entities == None,
+            Consultation.extracted_entities == '',
+            Consultation.extracted_entities == '[]'
+        ))
+    return query
+
+
+def iter_chunks(after_id, chunk_size, include_all, retry_ids=()):
+    """Yield lists of (id, symptoms) tuples, one chunk at a time.
+
+    Previously failed rows (retry_ids) come first, then rows after after_id
+    in id order.
+    """
+    retry_ids = sorted(retry_ids)
+    for start in range(0, len(retry_ids), chunk_size):
+        rows = _chunk_query(include_all)\
+            .filter(Consultation.id.in_(retry_ids[start:start + chunk_size]))\
+            .order_by(Consultation.id).all()
+        if rows:
+            yield rows
+
+    last_id = after_id
+    while True:
+        rows = _chunk_query(include_all).filter(Consultation.id > last_id)\
+            .order_by(Consultation.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def extract_batch(texts, mode, batch_size):
+    """Return one entity list (or None on failure) per text"""
+    if mode == 'local':
+        return [local_extractor.extract(text)[0] for text in texts]
+
+    results = [None] * len(texts)
+    if mode == 'remote':
+        pending = list(range(len(texts)))
+        local_results = {}
+    else:
+        # Remote is only consulted for texts the lexicon covers poorly
+        pending = []
+        local_results = {}
+        for index, text in enumerate(texts):
+            entities, coverage = local_extractor.extract(text)
+            local_results[index] = entities
+            if coverage < NER_LOCAL_MIN_COVERAGE:
+                pending.append(index)
+            else:
+                results[index] = entities
+
+    for start in range(0, len(pending), batch_size):
+        indexes = pending[start:start + batch_size]
+        remote = extract_remote_medical_entities_batch([texts[i] for i in indexes])
+        for offset, index in enumerate(indexes):
+            if remote is None:
+                # Keep local entities in auto mode rather than leaving the row empty
+                results[index] = local_results.get(index)
+            else:
+                results[index] = merge_entities(local_results.get(index, []), remote[offset])
+    return results
+
+
+def backfill(mode='auto', chunk_size=500, batch_size=16, include_all=False,
+             checkpoint_path=DEFAULT_CHECKPOINT, reset=False, limit=None):
+    """Run the backfill and return a summary dict"""
+    after_id, retry_ids = (0, []) if reset else load_checkpoint(checkpoint_path)
+    if after_id:
+        logger.info(f"Resuming entity backfill after consultation {after_id}")
+    if retry_ids:
+        logger.info(f"Retrying {len(retry_ids)} consultations that failed in a previous run")
+    failed_ids = set(retry_ids)
+    failed_this_run = set()
+    last_id = after_id
+
+    processed = updated = failed = 0
+    start = time.monotonic()
+
+    for rows in iter_chunks(after_id, chunk_size, include_all, retry_ids):
+        if limit is not None and processed >= limit:
+            break
+        ids = [row[0] for row in rows]
+        results = extract_batch([row[1] or '' for row in rows], mode, batch_size)
+
+        params = [
+            {'id': consultation_id, 'extracted_entities': json.dumps(entities)}
+            for consultation_id, entities in zip(ids, results)
+            if entities is not None
+        ]
+        if params:
+            db.session.execute(update(Consultation), params)
+        db.session.commit()
+        # Drop identity-map references so memory stays bounded across chunks
+        db.session.expunge_all()
+
+        processed += len(rows)
+        updated += len(params)
+        failed += len(rows) - len(params)
+        # Failed rows stay in the checkpoint so a later run retries them
+        for consultation_id, entities in zip(ids, results):
+            if entities is None:
+                failed_ids.add(consultation_id)
+                failed_this_run.add(consultation_id)
+            else:
+                failed_ids.discard(consultation_id)
+        last_id = max(last_id, ids[-1])
+        save_checkpoint(checkpoint_path, last_id, processed, failed_ids)
+
+        elapsed = time.monotonic() - start
+        rate = processed / elapsed if elapsed else 0.0
+        logger.info(f"Backfilled {processed} consultations ({updated} updated, {failed} failed) "
+                    f"at {rate:.1f} rows/sec")
+    else:
+        # A complete pass has seen every retry id; ones it did not return no longer need entities
+        if failed_ids != failed_this_run:
+            failed_ids = failed_this_run
+            save_checkpoint(checkpoint_path, last_id, processed, failed_ids)
+
+    elapsed = time.monotonic() - start
+    return {
+        'processed': processed,
+        'updated': updated,
+        'failed': failed,
+        'pending_retry': len(failed_ids),
+        'seconds': round(elapsed, 2),
+        'rows_per_sec': round(processed / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill extracted entities for consultations')
+    parser.add_argument('--mode', choices=['auto', 'local', 'remote'], default='auto')
+    parser.add_argument('--chunk-size', type=int, default=500, help='rows fetched per query')
+    parser.add_argument('--batch-size', type=int, default=16, help='texts per remote NER request')
+    parser.add_argument('--all', action='store_true', help='re-extract rows that already have entities')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--reset', action='store_true', help='start from the beginning')
+    parser.add_argument('--limit', type=int, default=None, help='stop after roughly this many rows')
+    args = parser.parse_args()
+
+    with app.app_context():
+        print("🩺 Backfilling consultation entities...")
+        summary = backfill(args.mode, args.chunk_size, args.batch_size, args.all,
+                           args.checkpoint, args.reset, args.limit)
+        print(f"✅ Done: {json.dumps(summary)}")
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Nightly batch precomputation of content recommendations.
+
+Users are processed in chunks. For each chunk the job loads profiles,
+interest counters and view history with one query each, then scores the
+whole chunk against the catalog with matrix operations: age and category
+masks, the same popularity-ranked candidate pool as the live path, and
+re-ranking by TF-IDF similarity to the user's viewed content. The top-N
+list per user is written to precomputed_recommendation under a new
+generation id, which becomes current only once every chunk is written.
+
+    python batch_recommendations.py run --workers 4 --chunk-size 256
+    python batch_recommendations.py run --benchmark --users 20000 --items 5000
+"""
+
+import argparse
+import logging
+import multiprocessing
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from scipy import sparse
+
+from app import app, db, RECOMMENDATION_CANDIDATE_FACTOR, PRECOMPUTED_TOP_N
+from models import (
+    User, UserActivity, UserInterestCounter, UserSeenContent, PrecomputedRecommendation,
+    RecommendationGeneration
+)
+from catalog import catalog
+from similarity import TfidfIndex, _normalize_rows
+from interest_profiles import condition_categories
+from seen_content import SeenSet
+
+logger = logging.getLogger(__name__)
+
+# Generations kept after a successful run (the current one and its predecessor)
+KEEP_GENERATIONS = 2
+
+
+class CohortScorer:
+    """Catalog-side arrays shared by every chunk, with columns in popularity order"""
+
+    def __init__(self, snapshot, top_n=20, candidate_factor=5):
+        self.top_n = top_n
+        self.pool = max(top_n * candidate_factor, top_n)
+        self.content_ids = np.array(snapshot.ranked_ids, dtype=np.int64)
+        self.columns = {int(content_id): column for column, content_id in enumerate(self.content_ids)}
+
+        records = snapshot.records(snapshot.ranked_ids)
+        index = TfidfIndex.build(records)
+        self.matrix = index.matrix
+        self.transposed = index.matrix.T.tocsr()
+
+        self.age_min = np.array([-np.inf if r.target_age_min is None else r.target_age_min for r in records])
+        self.age_max = np.array([np.inf if r.target_age_max is None else r.target_age_max for r in records])
+        self.categories = {category: code for code, category in enumerate(snapshot.categories)}
+        self.item_category = np.array([self.categories[r.category] for r in records], dtype=np.int64)
+
+    def score(self, ages, user_categories, views):
+        """Top-N (content_id, score) lists for one chunk.
+
+        ages: per-user age or NaN; user_categories: per-user list of interest
+        categories (empty means no filter); views: sparse users x items matrix
+        of viewed content in column order.
+        """
+        users = len(ages)
+        items = len(self.content_ids)
+
+        # Target age range, skipped for users without an age
+        ages = np.asarray(ages, dtype=np.float64)[:, None]
+        eligible = (self.age_min <= ages) & (ages <= self.age_max)
+        eligible[np.isnan(ages[:, 0])] = True
+
+        # Interest categories; like the live path, an empty list means no filter
+        wanted = np.zeros((users, len(self.categories) + 1), dtype=bool)
+        unfiltered = np.zeros(users, dtype=bool)
+        for row, categories in enumerate(user_categories):
+            if not categories:
+                unfiltered[row] = True
+            for category in categories:
+                wanted[row, self.categories.get(category, len(self.categories))] = True
+        in_category = wanted[:, self.item_category]
+        in_category[unfiltered] = True
+
+        seen = views.toarray() > 0
+        mask = eligible & in_category & ~seen
+
+        # Popularity-ranked candidate pool per user (columns are already in rank order)
+        candidates = mask & (np.cumsum(mask, axis=1) <= self.pool)
+
+        interest = _normalize_rows(sparse.csr_matrix(views, dtype=np.float32) @ self.matrix)
+        similarity = (interest @ self.transposed).toarray()
+        scores = np.where(candidates, similarity, -np.inf)
+
+        k = min(self.top_n, items)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row in range(users):
+            columns = top[row]
+            values = scores[row, columns]
+            # Ties keep popularity order, as in the live path's stable sort
+            order = np.lexsort((columns, -values))
+            results.append([(int(self.content_ids[columns[i]]), float(values[i]))
+                            for i in order if np.isfinite(values[i])])
+        return results
+
+
+def load_chunk(scorer, user_ids, days=30):
+    """Ages, interest categories and a views matrix for a chunk of users"""
+    position = {user_id: row for row, user_id in enumerate(user_ids)}
+    ages = np.full(len(user_ids), np.nan)
+    categories = [[] for _ in user_ids]
+
+    for user_id, age, medical_conditions in db.session.query(
+            User.id, User.age, User.medical_conditions).filter(User.id.in_(user_ids)):
+        row = position[user_id]
+        if age:
+            ages[row] = age
+        categories[row].extend(condition_categories(medical_conditions))
+
+    # Top three activity categories over the window, as get_user_interests does
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    counts = {}
+    for user_id, value, total in db.session.query(
+            UserInterestCounter.user_id, UserInterestCounter.value, db.func.sum(UserInterestCounter.count)
+    ).filter(
+        UserInterestCounter.user_id.in_(user_ids),
+        UserInterestCounter.dimension == 'category',
+        UserInterestCounter.day >= since
+    ).group_by(UserInterestCounter.user_id, UserInterestCounter.value):
+        counts.setdefault(user_id, []).append((int(total), value))
+    for user_id, totals in counts.items():
+        totals.sort(key=lambda item: -item[0])
+        categories[position[user_id]].extend(value for _, value in totals[:3])
+
+    # Seen-content bitmaps, with activity history for users who have none yet
+    seen = {user_id: SeenSet.from_bytes(bitmap) for user_id, bitmap in
+            db.session.query(UserSeenContent.user_id, UserSeenContent.bitmap)
+            .filter(UserSeenContent.user_id.in_(user_ids))}
+    missing = [user_id for user_id in user_ids if user_id not in seen]
+    if missing:
+        for user_id, content_id in db.session.query(UserActivity.user_id, UserActivity.content_id)\
+                .filter(UserActivity.user_id.in_(missing), UserActivity.activity_type == 'view',
+                        UserActivity.content_id.isnot(None)).distinct():
+            seen.setdefault(user_id, SeenSet()).add(content_id)
+
+    rows, columns = [], []
+    for user_id, content_ids in seen.items():
+        for content_id in content_ids:
+            column = scorer.columns.get(content_id)
+            if column is not None:
+                rows.append(position[user_id])
+                columns.append(column)
+    views = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                              shape=(len(user_ids), len(scorer.content_ids)))
+    views.sum_duplicates()
+    views.data[:] = 1.0
+    return ages, categories, views
+
+
+def process_chunks(scorer, generation_id, chunks):
+    written = 0
+    for user_ids in chunks:
+        ages, categories, views = load_chunk(scorer, user_ids)
+        params = []
+        for user_id, recommendations in zip(user_ids, scorer.score(ages, categories, views)):
+            params.extend({'generation_id': generation_id, 'user_id': user_id, 'rank': rank,
+                           'content_id': content_id, 'score': score}
+                          for rank, (content_id, score) in enumerate(recommendations))
+        if params:
+            db.session.execute(PrecomputedRecommendation.__table__.insert(), params)
+        db.session.commit()
+        written += len(user_ids)
+    return written
+
+
+def _worker(scorer, generation_id, chunks):
+    # Runs in a spawned interpreter, which opens its own connections
+    with app.app_context():
+        process_chunks(scorer, generation_id, chunks)
+
+
+def run(workers=1, chunk_size=256, top_n=PRECOMPUTED_TOP_N):
+    """Compute a new generation for every user; returns a summary dict"""
+    start = time.monotonic()
+    scorer = CohortScorer(catalog.snapshot(), top_n, RECOMMENDATION_CANDIDATE_FACTOR)
+
+    generation = RecommendationGeneration(status='running')
+    db.session.add(generation)
+    db.session.commit()
+    generation_id = generation.id
+
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+    try:
+        if workers > 1 and len(chunks) > 1:
+            # app.py monkey-patches with eventlet on import, which makes fork unsafe
+            context = multiprocessing.get_context('spawn')
+            processes = [context.Process(target=_worker, args=(scorer, generation_id, chunks[i::workers]))
+                         for i in range(min(workers, len(chunks)))]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            failed = [process.exitcode for process in processes if process.exitcode != 0]
+            if failed:
+                raise RuntimeError(f"{len(failed)} worker(s) failed")
+        else:
+            process_chunks(scorer, generation_id, chunks)
+    except Exception:
+        db.session.rollback()
+        RecommendationGeneration.query.filter_by(id=generation_id).update({'status': 'failed'})
+        db.session.commit()
+        raise
+
+    RecommendationGeneration.query.filter_by(id=generation_id).update({
+        'status': 'complete', 'users': len(user_ids), 'completed_at': datetime.utcnow()
+    })
+    db.session.commit()
+    pruned = prune_generations()
+
+    seconds = time.monotonic() - start
+    summary = {
+        'generation': generation_id,
+        'users': len(user_ids),
+        'items': len(scorer.content_ids),
+        'workers': workers,
+        'seconds': round(seconds, 2),
+        'users_per_second': round(len(user_ids) / seconds, 1) if seconds else None,
+        'pruned_generations': pruned,
+    }
+    logger.info(f"Precomputed recommendations: {summary}")
+    return summary
+
+
+def prune_generations(keep=KEEP_GENERATIONS):
+    """Delete rows of all but the newest completed generations"""
+    keep_ids = [row[0] for row in db.session.query(RecommendationGeneration.id)
+                .filter_by(status='complete').order_by(RecommendationGeneration.id.desc()).limit(keep)]
+    if not keep_ids:
+        return 0
+    stale = [row[0] for row in db.session.query(RecommendationGeneration.id)
+             .filter(RecommendationGeneration.id < min(keep_ids),
+                     RecommendationGeneration.status != 'running')]
+    if stale:
+        PrecomputedRecommendation.query.filter(PrecomputedRecommendation.generation_id.in_(stale))\
+            .delete(synchronize_session=False)
+        RecommendationGeneration.query.filter(RecommendationGeneration.id.in_(stale))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+    return len(stale)
+
+
+class PrecomputedRecommendations:
+    """Reads a user's list from the current completed generation"""
+
+    def __init__(self, generation_ttl=60):
+        self.generation_ttl = generation_ttl
+        self._generation = None
+        self._completed_at = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.outdated = 0
+
+    def current_generation(self):
+        if time.monotonic() - self._checked_at > self.generation_ttl:
+            with self._lock:
+                if time.monotonic() - self._checked_at > self.generation_ttl:
+                    row = db.session.query(RecommendationGeneration.id, RecommendationGeneration.completed_at)\
+                        .filter_by(status='complete').order_by(RecommendationGeneration.id.desc()).first()
+                    self._generation, self._completed_at = row if row else (None, None)
+                    self._checked_at = time.monotonic()
+        return self._generation
+
+    def completed_at(self):
+        """When the current generation finished (UTC), or None"""
+        self.current_generation()
+        return self._completed_at
+
+    def get(self, user_id, limit, exclude=None, changed_since=None):
+        """Up to limit precomputed ids, or None if the user has no usable list.
+
+        changed_since(user_id, completed_at) says whether the user's interests
+        changed after the generation was built; such users go live.
+        """
+        generation_id = self.current_generation()
+        if generation_id is not None and changed_since is not None and \
+                changed_since(user_id, self._completed_at):
+            self.outdated += 1
+            return None
+        stored = []
+        if generation_id is not None:
+            stored = [row[0] for row in db.session.query(PrecomputedRecommendation.content_id)
+                      .filter_by(generation_id=generation_id, user_id=user_id)
+                      .order_by(PrecomputedRecommendation.rank)]
+        content_ids = [content_id for content_id in stored if not exclude or content_id not in exclude][:limit]
+
+        # New users, or lists used up by views since the batch ran, go live
+        if not content_ids or len(content_ids) < min(limit, len(stored)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content_ids
+
+    def stats(self):
+        return {
+            'generation': self._generation,
+            'hits': self.hits,
+            'misses': self.misses,
+            'outdated': self.outdated,
+        }
+
+
+def seed_benchmark_content(items, seed=13):
+    """Insert synthetic content for benchmarking (disposable databases only)"""
+    from models import HealthContent
+    from similarity import synthetic_catalog
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for record in synthetic_catalog(items, seed):
+        low = int(rng.integers(0, 60))
+        rows.append({'title': record.title, 'description': record.description, 'tags': record.tags,
+                     'target_conditions': record.target_conditions, 'category': record.category,
+                     'content_type': 'article', 'target_age_min': low, 'target_age_max': low + 40,
+                     'popularity_score': float(rng.random() * 10), 'created_at': datetime.utcnow()})
+    for start in range(0, len(rows), 5000):
+        db.session.execute(HealthContent.__table__.insert(), rows[start:start + 5000])
+    db.session.commit()
+    catalog.mark_stale()
+
+
+def seed_benchmark_users(users, views_per_user=20, seed=13):
+    """Insert synthetic users and views for benchmarking (disposable databases only)"""
+    rng = np.random.default_rng(seed)
+    content_ids = np.array(catalog.snapshot().ranked_ids)
+    start = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    for offset in range(0, users, 5000):
+        batch = range(start + offset, start + min(offset + 5000, users))
+        db.session.execute(User.__table__.insert(), [
+            {'id': user_id, 'username': f'bench{user_id}', 'email': f'bench{user_id}@example.com',
+             'password_hash': 'x', 'full_name': 'Benchmark User', 'age': int(rng.integers(18, 80)),
+             'gender': 'other', 'created_at': datetime.utcnow()}
+            for user_id in batch
+        ])
+        db.session.execute(UserActivity.__table__.insert(), [
+            {'user_id': user_id, 'activity_type': 'view', 'content_id': int(content_id),
+             'timestamp': datetime.utcnow()}
+            for user_id in batch
+            for content_id in rng.choice(content_ids, min(views_per_user, len(content_ids)), replace=False)
+        ])
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute recommendations for all users')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--workers', type=int, default=1)
+    run_parser.add_argument('--chunk-size', type=int, default=256)
+    run_parser.add_argument('--top-n', type=int, default=PRECOMPUTED_TOP_N)
+    run_parser.add_argument('--benchmark', action='store_true',
+                            help='seed synthetic users first (use a throwaway DATABASE_URL)')
+    run_parser.add_argument('--users', type=int, default=10000)
+    run_parser.add_argument('--items', type=int, default=0, help='synthetic content to seed with --benchmark')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        if args.benchmark:
+            print(f"🧪 Seeding {args.items} items and {args.users} synthetic users...")
+            if args.items:
+                seed_benchmark_content(args.items)
+            seed_benchmark_users(args.users)
+        print("🌙 Precomputing recommendations...")
+        summary = run(args.workers, args.chunk_size, args.top_n)
+        print(f"✅ {summary['users']} users in {summary['seconds']}s "
+              f"({summary['users_per_second']} users/sec), generation {summary['generation']}")
@@ -0,0 +1,390 @@
+"""
+In-process caches for expensive AI and recommendation results.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from app import db
+from models import AnalysisCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries expire after a TTL.
+
+    on_remove, if given, is called with the key of every entry dropped by
+    expiry or LRU eviction (not by delete or clear), outside the lock.
+    """
+
+    def __init__(self, max_size=1024, ttl=300, on_remove=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_remove = on_remove
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+            self.misses += 1
+        self._removed([key])
+        return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                evicted.append(self._data.popitem(last=False)[0])
+                self.evictions += 1
+        self._removed(evicted)
+
+    def purge_expired(self):
+        """Drop expired entries that have not been looked up since; returns how many"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        self._removed(expired)
+        return len(expired)
+
+    def _removed(self, keys):
+        if self.on_remove is not None:
+            for key in keys:
+                self.on_remove(key)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _normalize_text(value):
+    if not value:
+        return ''
+    return re.sub(r'\s+', ' ', str(value).strip().lower())
+
+
+def _age_band(age):
+    try:
+        return f"{int(age) // 10 * 10}s"
+    except (TypeError, ValueError):
+        return 'unknown'
+
+
+def symptom_analysis_key(symptoms_text, user_profile, model_name):
+    """Content hash of the inputs that shape a symptom analysis prompt"""
+    profile = user_profile or {}
+    material = {
+        'model': model_name,
+        'symptoms': _normalize_text(symptoms_text),
+        'age_band': _age_band(profile.get('age')),
+        'gender': _normalize_text(profile.get('gender')),
+        'medical_conditions': _normalize_text(profile.get('medical_conditions')),
+        'medications': _normalize_text(profile.get('medications')),
+        'allergies': _normalize_text(profile.get('allergies')),
+    }
+    encoded = json.dumps(material, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class SymptomAnalysisCache:
+    """Two-tier cache for Gemini symptom analyses.
+
+    Lookups hit the in-process LRU first and then, if enabled, the
+    AnalysisCacheEntry table. Persistent hits are promoted to memory.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, persistent=False):
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.ttl = ttl
+        self.persistent = persistent
+        self._lock = threading.Lock()
+        self.persistent_hits = 0
+        self.bypasses = 0
+
+    def get(self, key):
+        analysis = self.memory.get(key)
+        if analysis is not None or not self.persistent:
+            return analysis
+
+        try:
+            entry = AnalysisCacheEntry.query.filter_by(cache_key=key).first()
+            if entry and entry.expires_at > datetime.utcnow():
+                analysis = json.loads(entry.result)
+                remaining = (entry.expires_at - datetime.utcnow()).total_seconds()
+                self.memory.set(key, analysis, ttl=remaining)
+                with self._lock:
+                    self.persistent_hits += 1
+                return analysis
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error reading analysis cache: {e}")
+        return None
+
+    def set(self, key, analysis, model_name):
+        self.memory.set(key, analysis)
+        if not self.persistent:
+            return
+
+        try:
+            expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+            entry = AnalysisCacheEntry.query.filter_by(cache_key=key).first()
+            if entry:
+                entry.result = json.dumps(analysis)
+                entry.expires_at = expires_at
+            else:
+                db.session.add(AnalysisCacheEntry(
+                    cache_key=key,
+                    model_name=model_name,
+                    result=json.dumps(analysis),
+                    expires_at=expires_at
+                ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error writing analysis cache: {e}")
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def purge_expired(self):
+        """Delete expired rows from the persistent tier"""
+        if not self.persistent:
+            return 0
+        deleted = AnalysisCacheEntry.query.filter(
+            AnalysisCacheEntry.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def stats(self):
+        stats = self.memory.stats()
+        with self._lock:
+            persistent_hits = self.persistent_hits
+            stats['bypasses'] = self.bypasses
+        # Memory misses that were served from SQL count as hits overall
+        stats['memory_hits'] = stats['hits']
+        stats['persistent_hits'] = persistent_hits
+        stats['hits'] += persistent_hits
+        stats['misses'] -= persistent_hits
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['persistent'] = self.persistent
+        return stats
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'done_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    Callers arriving while a call is in flight wait for and share its result.
+    Successful (truthy) results are also reused for reuse_window seconds after
+    completion to absorb bursts.
+    """
+
+    def __init__(self, reuse_window=0):
+        self.reuse_window = reuse_window
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.reused = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done_at is not None:
+                if time.monotonic() - call.done_at <= self.reuse_window:
+                    self.reused += 1
+                    return call.result
+                del self._calls[key]
+                call = None
+
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                call.done_at = time.monotonic()
+                if call.error is not None or not call.result or not self.reuse_window:
+                    self._calls.pop(key, None)
+                self._prune()
+            call.event.set()
+        return call.result
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.reuse_window
+        expired = [key for key, call in self._calls.items()
+                   if call.done_at is not None and call.done_at < cutoff]
+        for key in expired:
+            del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'reused': self.reused,
+                'in_flight': sum(1 for call in self._calls.values() if call.done_at is None),
+            }
+
+
+class RecommendationCache:
+    """Per-user cache of recommended content ids keyed by (user_id, limit).
+
+    Entries are dropped explicitly when a user's interests change and
+    otherwise expire after the TTL. Each invalidation bumps the user's
+    generation; a result computed under an older generation is not stored.
+    Generations are forgotten ttl seconds after the invalidation.
+    """
+
+    def __init__(self, max_size=4096, ttl=600):
+        self.entries = TTLCache(max_size=max_size, ttl=ttl, on_remove=self._forget)
+        self.ttl = ttl
+        self._limits = {}
+        self._generations = {}
+        self._sequence = 0
+        self._pruned_at = time.monotonic()
+        # Reentrant: entries.set may evict and call _forget while set holds it
+        self._lock = threading.RLock()
+        self.invalidations = 0
+        self.stale_discards = 0
+
+    def get(self, user_id, limit):
+        return self.entries.get((user_id, limit))
+
+    def generation(self, user_id):
+        """Capture before computing and pass to set()"""
+        with self._lock:
+            return self._generations.get(user_id, (0, None, None))[0]
+
+    def last_invalidated(self, user_id):
+        """UTC time of the user's last invalidation, if within the last ttl seconds"""
+        with self._lock:
+            return self._generations.get(user_id, (0, None, None))[2]
+
+    def set(self, user_id, limit, content_ids, generation=None):
+        with self._lock:
+            if generation is not None and self._generations.get(user_id, (0, None, None))[0] != generation:
+                self.stale_discards += 1
+                return False
+            self.entries.set((user_id, limit), tuple(content_ids))
+            self._limits.setdefault(user_id, set()).add(limit)
+        return True
+
+    def invalidate_user(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            self._sequence += 1
+            self._generations[user_id] = (self._sequence, now, datetime.utcnow())
+            self.invalidations += 1
+            for limit in self._limits.pop(user_id, set()):
+                self.entries.delete((user_id, limit))
+            if now - self._pruned_at > self.ttl:
+                self._pruned_at = now
+                self._generations = {user: entry for user, entry in self._generations.items()
+                                     if now - entry[1] <= self.ttl}
+
+    def _forget(self, key):
+        user_id, limit = key
+        with self._lock:
+            limits = self._limits.get(user_id)
+            if limits is not None:
+                limits.discard(limit)
+                if not limits:
+                    del self._limits[user_id]
+
+    def clear(self):
+        with self._lock:
+            self._limits.clear()
+            self.entries.clear()
+
+    def memory_bytes(self):
+        """Approximate memory held by cached keys and id tuples"""
+        with self.entries._lock:
+            items = list(self.entries._data.items())
+        total = sys.getsizeof(self.entries._data)
+        for key, (content_ids, _) in items:
+            total += sys.getsizeof(key) + sys.getsizeof(content_ids)
+            total += sum(sys.getsizeof(content_id) for content_id in content_ids)
+        return total
+
+    def stats(self):
+        self.entries.purge_expired()
+        stats = self.entries.stats()
+        with self._lock:
+            stats['invalidations'] = self.invalidations
+            stats['stale_discards'] = self.stale_discards
+            stats['users'] = len(self._limits)
+        stats['memory_bytes'] = self.memory_bytes()
+        return stats
@@ -0,0 +1,260 @@
+"""
+Process-local, versioned snapshot of the HealthContent catalog.
+
+The catalog is small and rarely edited, so recommendation, featured, related
+and category listings are answered from an immutable in-memory snapshot.
+Committed HealthContent writes mark the snapshot stale and the next reader
+rebuilds it; the new snapshot replaces the old one with a single reference
+swap.
+"""
+
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import namedtuple, defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from app import db, CATALOG_MAX_AGE
+from models import HealthContent
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'catalog_changed'
+
+CONTENT_COLUMNS = [column.name for column in HealthContent.__table__.columns]
+
+# Compact read-only stand-in for a HealthContent row
+ContentRecord = namedtuple('ContentRecord', CONTENT_COLUMNS)
+
+
+class AgeIntervalIndex:
+    """Maps an age to the ids of content whose target age range contains it.
+
+    Range endpoints split the age axis into elementary segments; each segment
+    stores the frozenset of ids valid anywhere inside it, so a lookup is a
+    single bisect.
+    """
+
+    def __init__(self, records):
+        bounds = set()
+        for record in records:
+            if record.target_age_min is not None:
+                bounds.add(record.target_age_min)
+            if record.target_age_max is not None:
+                bounds.add(record.target_age_max + 1)
+        self._starts = sorted(bounds)
+
+        segments = [set() for _ in range(len(self._starts) + 1)]
+        for record in records:
+            low = 0 if record.target_age_min is None else \
+                bisect.bisect_right(self._starts, record.target_age_min)
+            high = len(self._starts) if record.target_age_max is None else \
+                bisect.bisect_right(self._starts, record.target_age_max)
+            for index in range(low, high + 1):
+                segments[index].add(record.id)
+        self._segments = [frozenset(segment) for segment in segments]
+
+    def ids_for_age(self, age):
+        return self._segments[bisect.bisect_right(self._starts, age)]
+
+
+def _rank_key(record):
+    return (-(record.popularity_score or 0.0),
+            -(record.created_at.timestamp() if record.created_at else 0.0),
+            record.id)
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog with popularity-ordered secondary lists.
+
+    Only Catalog.update_scores touches it after construction, and only in
+    ways that leave every ordering unchanged.
+    """
+
+    def __init__(self, records, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.by_id = {record.id: record for record in records}
+
+        ordered = sorted(records, key=_rank_key)
+        self.ranked_ids = tuple(record.id for record in ordered)
+        self.rank = {content_id: position for position, content_id in enumerate(self.ranked_ids)}
+
+        by_category = defaultdict(list)
+        by_type = defaultdict(list)
+        for record in ordered:
+            by_category[record.category].append(record.id)
+            by_type[record.content_type].append(record.id)
+        self.by_category = {key: tuple(ids) for key, ids in by_category.items()}
+        self.by_type = {key: tuple(ids) for key, ids in by_type.items()}
+        self.categories = sorted(self.by_category)
+        self.content_types = sorted(self.by_type)
+        self.age_index = AgeIntervalIndex(records)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, content_id):
+        return self.by_id.get(content_id)
+
+    def records(self, content_ids):
+        return [self.by_id[content_id] for content_id in content_ids if content_id in self.by_id]
+
+    def top(self, limit, category=None, content_type=None):
+        if category is not None:
+            ids = self.by_category.get(category, ())
+        elif content_type is not None:
+            ids = self.by_type.get(content_type, ())
+        else:
+            ids = self.ranked_ids
+        return self.records(ids[:limit])
+
+    def related(self, content_id, limit=4):
+        record = self.by_id.get(content_id)
+        if record is None:
+            return []
+        ids = [other for other in self.by_category.get(record.category, ()) if other != content_id]
+        return self.records(ids[:limit])
+
+    def iter_ranked(self, categories=None):
+        """Yield ids in popularity order, optionally restricted to categories"""
+        if not categories:
+            yield from self.ranked_ids
+            return
+        lists = [self.by_category[category] for category in dict.fromkeys(categories)
+                 if category in self.by_category]
+        yield from heapq.merge(*lists, key=self.rank.__getitem__)
+
+    def recommend(self, limit, categories=None, age=None, exclude=None):
+        """Top ids by popularity filtered by category, target age and an exclusion set"""
+        eligible = self.age_index.ids_for_age(age) if age else None
+        results = []
+        for content_id in self.iter_ranked(categories):
+            if eligible is not None and content_id not in eligible:
+                continue
+            if exclude and content_id in exclude:
+                continue
+            results.append(content_id)
+            if len(results) >= limit:
+                break
+        return results
+
+
+class Catalog:
+    """Holds the current snapshot and rebuilds it when content changes"""
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._snapshot = None
+        self._version = 0
+        self._stale = True
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def mark_stale(self):
+        self._stale = True
+
+    def update_scores(self, scores):
+        """Apply committed popularity scores ({content_id: score}) to the snapshot.
+
+        Records are swapped in place when no item changes its place in the
+        ranking; otherwise the snapshot is marked stale and rebuilt.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or self._stale:
+            return False
+        updated = {}
+        for content_id, score in scores.items():
+            record = snapshot.by_id.get(content_id)
+            if record is None:
+                self.mark_stale()
+                return False
+            if record.popularity_score != score:
+                updated[content_id] = record._replace(popularity_score=score)
+        if not updated:
+            return True
+
+        def key(content_id):
+            return _rank_key(updated.get(content_id) or snapshot.by_id[content_id])
+
+        ranked = snapshot.ranked_ids
+        for content_id in updated:
+            position = snapshot.rank[content_id]
+            if (position > 0 and key(ranked[position - 1]) >= key(content_id)) or \
+                    (position + 1 < len(ranked) and key(content_id) >= key(ranked[position + 1])):
+                self.mark_stale()
+                return False
+        # Category and type lists are subsequences of the ranking, so they keep their order too
+        snapshot.by_id.update(updated)
+        return True
+
+    def is_current(self, version):
+        """Whether a snapshot of this version would be served without a reload"""
+        snapshot = self._snapshot
+        return (snapshot is not None and snapshot.version == version and not self._stale
+                and time.monotonic() - snapshot.loaded_at <= self.max_age)
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        expired = snapshot is not None and time.monotonic() - snapshot.loaded_at > self.max_age
+        if snapshot is not None and not self._stale and not expired:
+            return snapshot
+
+        # Only one reader rebuilds; others keep serving the previous snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is snapshot:
+                self.reload()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        start = time.monotonic()
+        self._stale = False
+        rows = db.session.query(*HealthContent.__table__.columns).all()
+        records = [ContentRecord(*row) for row in rows]
+        self._version += 1
+        self._snapshot = CatalogSnapshot(records, self._version)
+        self.reloads += 1
+        logger.info(f"Loaded catalog v{self._version} with {len(records)} items "
+                    f"in {(time.monotonic() - start) * 1000:.1f}ms")
+        return self._snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': self._version,
+            'items': len(snapshot) if snapshot else 0,
+            'stale': self._stale,
+            'reloads': self.reloads,
+        }
+
+
+def _record_catalog_change(mapper, connection, target):
+    # Flushed rows are not visible to other sessions until commit
+    session = object_session(target)
+    if session is not None:
+        session.info[SESSION_KEY] = True
+
+
+def _mark_catalog_stale(session):
+    if session.info.pop(SESSION_KEY, False):
+        catalog.mark_stale()
+
+
+def _discard_catalog_change(session, previous_transaction):
+    session.info.pop(SESSION_KEY, None)
+
+
+catalog = Catalog(max_age=CATALOG_MAX_AGE)
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(HealthContent, _event_name, _record_catalog_change)
+event.listen(db.session, 'after_commit', _mark_catalog_stale)
+event.listen(db.session, 'after_soft_rollback', _discard_catalog_change)
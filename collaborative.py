@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Collaborative filtering recommender trained offline.
+
+Explicit ratings and implicit view/bookmark activity are folded into a sparse
+user x item matrix, which is factorized with a truncated SVD. The user and
+item factors are written to a single compact binary file that the web process
+memory-maps, so scoring a user is one small dense matrix-vector product.
+
+Train (and optionally benchmark) from the command line:
+    python collaborative.py train --factors 64
+    python collaborative.py benchmark --users 200000 --items 20000 --interactions 3000000
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HCF1'
+HEADER = struct.Struct('<4sIII')  # magic, users, items, factors
+
+# Interaction weights
+VIEW_WEIGHT = 1.0
+BOOKMARK_WEIGHT = 3.0
+RATING_CENTER = 3.0
+
+
+def build_matrix(rows, cols, values):
+    """Sum (user_id, content_id, weight) triples into a CSR matrix with id maps"""
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    user_ids, user_index = np.unique(rows, return_inverse=True)
+    item_ids, item_index = np.unique(cols, return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (np.asarray(values, dtype=np.float32), (user_index, item_index)),
+        shape=(len(user_ids), len(item_ids))
+    ).tocsr()
+    matrix.sum_duplicates()
+    return matrix, user_ids, item_ids
+
+
+def train(matrix, factors=64):
+    """Factorize the interaction matrix; returns (user_factors, item_factors)"""
+    factors = max(1, min(factors, min(matrix.shape) - 1))
+    u, s, vt = svds(matrix.astype(np.float64), k=factors)
+    root = np.sqrt(s)
+    user_factors = (u * root).astype(np.float32)
+    item_factors = (vt.T * root).astype(np.float32)
+    return user_factors, item_factors
+
+
+def save_model(path, user_ids, item_ids, user_factors, item_factors):
+    """Write ids and factors to one binary file, replacing any previous model atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(user_ids), len(item_ids), user_factors.shape[1]))
+        f.write(np.ascontiguousarray(user_ids, dtype='<i8').tobytes())
+        f.write(np.ascontiguousarray(item_ids, dtype='<i8').tobytes())
+        f.write(np.ascontiguousarray(user_factors, dtype='<f4').tobytes())
+        f.write(np.ascontiguousarray(item_factors, dtype='<f4').tobytes())
+    os.replace(tmp_path, path)
+
+
+class CollaborativeModel:
+    """Memory-mapped factor model with per-user top-k scoring"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, users, items, factors = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a collaborative filtering model")
+
+        offset = HEADER.size
+        self.user_ids = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(users,))
+        offset += users * 8
+        self.item_ids = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(items,))
+        offset += items * 8
+        self.user_factors = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(users, factors))
+        offset += users * factors * 4
+        self.item_factors = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(items, factors))
+
+        self.mtime = os.path.getmtime(path)
+        self._item_positions = {int(item_id): row for row, item_id in enumerate(self.item_ids)}
+
+    def has_user(self, user_id):
+        return self._user_row(user_id) is not None
+
+    def _user_row(self, user_id):
+        # user_ids are sorted by np.unique, so a binary search finds the row
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return None
+
+    def recommend(self, user_id, k=10, exclude=None, allowed=None):
+        """Return [(content_id, score)] for the user's k highest scoring items"""
+        row = self._user_row(user_id)
+        if row is None or not len(self.item_ids):
+            return []
+        scores = self.item_factors @ self.user_factors[row]
+
+        if exclude:
+            for content_id in exclude:
+                position = self._item_positions.get(content_id)
+                if position is not None:
+                    scores[position] = -np.inf
+
+        # Over-fetch so filtering by allowed ids rarely needs a full sort
+        pool = len(scores) if allowed is not None and len(allowed) < k * 4 else min(len(scores), k * 4)
+        while True:
+            candidates = np.argpartition(-scores, pool - 1)[:pool]
+            ordered = candidates[np.argsort(-scores[candidates], kind='stable')]
+            results = []
+            for position in ordered:
+                if not np.isfinite(scores[position]):
+                    break
+                content_id = int(self.item_ids[position])
+                if allowed is None or content_id in allowed:
+                    results.append((content_id, float(scores[position])))
+                    if len(results) >= k:
+                        return results
+            if pool >= len(scores):
+                return results
+            pool = len(scores)
+
+
+class ModelLoader:
+    """Lazily loads the model file and reloads it when retraining replaces it"""
+
+    def __init__(self, path):
+        self.path = path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        model = self._model
+        if model is not None and os.path.getmtime(self.path) == model.mtime:
+            return model
+        with self._lock:
+            try:
+                if self._model is None or os.path.getmtime(self.path) != self._model.mtime:
+                    self._model = CollaborativeModel(self.path)
+                    logger.info(f"Loaded collaborative model from {self.path}")
+            except Exception as e:
+                logger.error(f"Error loading collaborative model: {e}")
+            return self._model
+
+    def stats(self):
+        model = self._model
+        return {
+            'backend_path': self.path,
+            'loaded': model is not None,
+            'users': len(model.user_ids) if model is not None else 0,
+            'items': len(model.item_ids) if model is not None else 0,
+            'factors': model.user_factors.shape[1] if model is not None else 0,
+        }
+
+
+def load_interactions():
+    """Aggregate ratings, views and bookmarks into (rows, cols, weights) arrays"""
+    from app import db
+    from models import UserActivity, UserRating, UserBookmark
+
+    rows, cols, values = [], [], []
+
+    views = db.session.query(
+        UserActivity.user_id, UserActivity.content_id, db.func.count(UserActivity.id)
+    ).filter(UserActivity.activity_type == 'view', UserActivity.content_id.isnot(None))\
+     .group_by(UserActivity.user_id, UserActivity.content_id)
+    for user_id, content_id, count in views.yield_per(10000):
+        rows.append(user_id)
+        cols.append(content_id)
+        values.append(VIEW_WEIGHT * np.log1p(count))
+
+    for user_id, content_id in db.session.query(UserBookmark.user_id, UserBookmark.content_id).yield_per(10000):
+        rows.append(user_id)
+        cols.append(content_id)
+        values.append(BOOKMARK_WEIGHT)
+
+    ratings = db.session.query(UserRating.user_id, UserRating.content_id, UserRating.rating)
+    for user_id, content_id, rating in ratings.yield_per(10000):
+        rows.append(user_id)
+        cols.append(content_id)
+        values.append(float(rating) - RATING_CENTER)
+
+    return rows, cols, values
+
+
+def train_from_database(path, factors=64):
+    start = time.monotonic()
+    rows, cols, values = load_interactions()
+    if not rows:
+        logger.warning("No interactions to train on")
+        return None
+    matrix, user_ids, item_ids = build_matrix(rows, cols, values)
+    if min(matrix.shape) < 2:
+        logger.warning("Not enough users or items to train on")
+        return None
+    user_factors, item_factors = train(matrix, factors)
+    save_model(path, user_ids, item_ids, user_factors, item_factors)
+    return {
+        'interactions': len(values),
+        'users': len(user_ids),
+        'items': len(item_ids),
+        'factors': user_factors.shape[1],
+        'seconds': round(time.monotonic() - start, 2),
+    }
+
+
+def benchmark(users, items, interactions, factors=64, path='/tmp/collaborative_benchmark.bin'):
+    rng = np.random.default_rng(3)
+    # Zipf-like popularity so the matrix resembles real engagement
+    item_popularity = 1.0 / np.arange(1, items + 1) ** 0.8
+    item_popularity /= item_popularity.sum()
+    rows = rng.integers(1, users + 1, size=interactions)
+    cols = rng.choice(np.arange(1, items + 1), size=interactions, p=item_popularity)
+    values = rng.choice([VIEW_WEIGHT, BOOKMARK_WEIGHT, 2.0, -1.0], size=interactions, p=[0.8, 0.1, 0.07, 0.03])
+
+    start = time.monotonic()
+    matrix, user_ids, item_ids = build_matrix(rows, cols, values)
+    user_factors, item_factors = train(matrix, factors)
+    save_model(path, user_ids, item_ids, user_factors, item_factors)
+    train_seconds = time.monotonic() - start
+
+    model = CollaborativeModel(path)
+    sample = rng.choice(user_ids, size=min(1000, len(user_ids)), replace=False)
+    latencies = []
+    for user_id in sample:
+        query_start = time.perf_counter()
+        model.recommend(int(user_id), k=10)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    latencies.sort()
+    return {
+        'interactions': interactions,
+        'users': len(user_ids),
+        'items': len(item_ids),
+        'train_seconds': round(train_seconds, 2),
+        'model_bytes': os.path.getsize(path),
+        'score_p50_ms': round(latencies[len(latencies) // 2], 4),
+        'score_p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 4),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train or benchmark the collaborative recommender')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train')
+    train_parser.add_argument('--factors', type=int, default=64)
+    train_parser.add_argument('--output', default=None)
+    bench_parser = subparsers.add_parser('benchmark')
+    bench_parser.add_argument('--users', type=int, default=200000)
+    bench_parser.add_argument('--items', type=int, default=20000)
+    bench_parser.add_argument('--interactions', type=int, default=3000000)
+    bench_parser.add_argument('--factors', type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        print(json.dumps(benchmark(args.users, args.items, args.interactions, args.factors), indent=2))
+    else:
+        from app import app, COLLABORATIVE_MODEL_PATH
+        with app.app_context():
+            print("🤝 Training collaborative filtering model...")
+            summary = train_from_database(args.output or COLLABORATIVE_MODEL_PATH, args.factors)
+            print(f"✅ Done: {json.dumps(summary)}")
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Full-text search over health content.
+
+On SQLite the catalog is mirrored into an FTS5 table (porter stemming,
+unicode61 tokenizer) kept current by triggers on health_content, and
+matches are ranked with bm25 weighted towards title, tags and category.
+On PostgreSQL a generated, weighted tsvector column with a GIN index plays
+the same role and is ranked with ts_rank_cd. Either way the relevance is
+boosted by popularity_score, saturating so popularity reorders comparable
+matches without burying the best textual ones. Triggers and the generated
+column maintain the index on every write, including bulk ones. Databases
+where neither is available fall back to the old ILIKE scan.
+
+    python content_search.py rebuild
+    python content_search.py benchmark --items 100000
+"""
+
+import argparse
+import logging
+import random
+import re
+import threading
+import time
+
+from sqlalchemy import create_engine, insert, text
+
+from app import app, db, SEARCH_RESULT_LIMIT, SEARCH_POPULARITY_WEIGHT
+from models import HealthContent
+from catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'health_content_fts'
+
+# bm25 column weights for title, description, tags, category
+BM25_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+
+# Popularity at which the boost reaches half its maximum
+POPULARITY_HALF_BOOST = 5.0
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, description, tags, category, tokenize='porter unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON health_content BEGIN "
+    f"INSERT INTO {FTS_TABLE} (rowid, title, description, tags, category) "
+    "VALUES (new.id, new.title, coalesce(new.description, ''), coalesce(new.tags, ''), new.category); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON health_content BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+    # Only text columns: popularity flushes rewrite scores constantly and must not touch the index
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description, tags, category "
+    f"ON health_content BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+    f"INSERT INTO {FTS_TABLE} (rowid, title, description, tags, category) "
+    "VALUES (new.id, new.title, coalesce(new.description, ''), coalesce(new.tags, ''), new.category); END",
+]
+
+POSTGRES_DDL = [
+    "ALTER TABLE health_content ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', replace(coalesce(category, ''), '_', ' ') || ' ' || coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_health_content_search_vector ON health_content USING GIN (search_vector)",
+]
+
+
+def terms(query):
+    """Lower-cased word tokens of a user query"""
+    return re.findall(r'\w+', query.lower())
+
+
+def sqlite_match(words, any_term=False):
+    """FTS5 MATCH expression; the last word is a prefix so partial input still matches"""
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return (' OR ' if any_term else ' AND ').join(quoted)
+
+
+def postgres_tsquery(words, any_term=False):
+    parts = list(words)
+    parts[-1] += ':*'
+    return (' | ' if any_term else ' & ').join(parts)
+
+
+def _filters(category, content_type):
+    clauses, params = [], {}
+    if category:
+        clauses.append('AND health_content.category = :category')
+        params['category'] = category
+    if content_type:
+        clauses.append('AND health_content.content_type = :content_type')
+        params['content_type'] = content_type
+    return ' '.join(clauses), params
+
+
+def _boost():
+    popularity = 'coalesce(health_content.popularity_score, 0.0)'
+    return f'(1.0 + :weight * {popularity} / ({popularity} + {POPULARITY_HALF_BOOST}))'
+
+
+def search_ids_sqlite(connection, words, category=None, content_type=None, limit=SEARCH_RESULT_LIMIT, any_term=False):
+    filters, params = _filters(category, content_type)
+    bm25 = f"bm25({FTS_TABLE}, {', '.join(str(weight) for weight in BM25_WEIGHTS)})"
+    # bm25 is lower-is-better, so the boosted score sorts ascending
+    statement = text(
+        f"SELECT health_content.id FROM {FTS_TABLE} "
+        f"JOIN health_content ON health_content.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH :match {filters} "
+        f"ORDER BY {bm25} * {_boost()} LIMIT :limit"
+    )
+    params.update(match=sqlite_match(words, any_term), weight=SEARCH_POPULARITY_WEIGHT, limit=limit)
+    return [row[0] for row in connection.execute(statement, params)]
+
+
+def search_ids_postgres(connection, words, category=None, content_type=None, limit=SEARCH_RESULT_LIMIT, any_term=False):
+    filters, params = _filters(category, content_type)
+    statement = text(
+        "SELECT health_content.id FROM health_content, to_tsquery('english', :tsquery) AS query "
+        f"WHERE health_content.search_vector @@ query {filters} "
+        f"ORDER BY ts_rank_cd(health_content.search_vector, query, 32) * {_boost()} DESC LIMIT :limit"
+    )
+    params.update(tsquery=postgres_tsquery(words, any_term), weight=SEARCH_POPULARITY_WEIGHT, limit=limit)
+    return [row[0] for row in connection.execute(statement, params)]
+
+
+def search_ids_like(connection, query, category=None, content_type=None, limit=SEARCH_RESULT_LIMIT):
+    filters, params = _filters(category, content_type)
+    statement = text(
+        "SELECT health_content.id FROM health_content "
+        "WHERE (lower(health_content.title) LIKE :pattern OR lower(health_content.description) LIKE :pattern) "
+        f"{filters} ORDER BY health_content.popularity_score DESC LIMIT :limit"
+    )
+    params.update(pattern=f'%{query.lower()}%', limit=limit)
+    return [row[0] for row in connection.execute(statement, params)]
+
+
+def create_index(connection):
+    """Create the dialect's full-text structures; returns the backend name or None"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                    {'name': FTS_TABLE}).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not exists:
+            populate_sqlite(connection)
+        return 'fts5'
+    if dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+        return 'tsvector'
+    return None
+
+
+def populate_sqlite(connection):
+    """Reindex every row from health_content"""
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    connection.execute(text(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, description, tags, category) "
+        "SELECT id, title, coalesce(description, ''), coalesce(tags, ''), category FROM health_content"
+    ))
+    connection.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"))
+
+
+class ContentSearch:
+    """Dialect-specific full-text search with a lazily created index"""
+
+    def __init__(self, limit=SEARCH_RESULT_LIMIT):
+        self.limit = limit
+        self.backend = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.fallbacks = 0
+        self.total_ms = 0.0
+
+    def ensure_index(self):
+        if self._ready:
+            return self.backend
+        with self._lock:
+            if not self._ready:
+                try:
+                    with db.engine.begin() as connection:
+                        self.backend = create_index(connection)
+                except Exception as e:
+                    logger.error(f"Full-text index unavailable, searching with ILIKE: {e}")
+                    self.backend = None
+                self._ready = True
+        return self.backend
+
+    def search_ids(self, query, category=None, content_type=None, limit=None):
+        """Content ids matching query, best first"""
+        limit = limit or self.limit
+        backend = self.ensure_index()
+        words = terms(query)
+        start = time.perf_counter()
+        connection = db.session.connection()
+        if not words:
+            ids = []
+        elif backend == 'fts5':
+            ids = search_ids_sqlite(connection, words, category, content_type, limit)
+            if not ids and len(words) > 1:
+                ids = search_ids_sqlite(connection, words, category, content_type, limit, any_term=True)
+        elif backend == 'tsvector':
+            ids = search_ids_postgres(connection, words, category, content_type, limit)
+            if not ids and len(words) > 1:
+                ids = search_ids_postgres(connection, words, category, content_type, limit, any_term=True)
+        else:
+            ids = search_ids_like(connection, query, category, content_type, limit)
+        with self._lock:
+            self.queries += 1
+            self.fallbacks += backend is None
+            self.total_ms += (time.perf_counter() - start) * 1000
+        return ids
+
+    def search(self, query, category=None, content_type=None, limit=None):
+        """Matching content records, best first; without a query, the most popular in the filters"""
+        limit = limit or self.limit
+        if not query.strip():
+            search_query = HealthContent.query
+            if category:
+                search_query = search_query.filter(HealthContent.category == category)
+            if content_type:
+                search_query = search_query.filter(HealthContent.content_type == content_type)
+            return search_query.order_by(HealthContent.popularity_score.desc()).limit(limit).all()
+
+        ids = self.search_ids(query, category, content_type, limit)
+        snapshot = catalog.snapshot()
+        records = {content_id: snapshot.get(content_id) for content_id in ids}
+        missing = [content_id for content_id, record in records.items() if record is None]
+        if missing:
+            # Written since the snapshot was taken
+            records.update((content.id, content) for content in
+                           HealthContent.query.filter(HealthContent.id.in_(missing)))
+        return [records[content_id] for content_id in ids if records.get(content_id) is not None]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend or ('ilike' if self._ready else None),
+                'queries': self.queries,
+                'fallback_queries': self.fallbacks,
+                'avg_ms': round(self.total_ms / self.queries, 3) if self.queries else None,
+            }
+
+
+def benchmark(items=100000, queries=200):
+    from similarity import synthetic_catalog
+
+    engine = create_engine('sqlite://')
+    HealthContent.__table__.create(engine)
+    rng = random.Random(5)
+    records = synthetic_catalog(items)
+    with engine.begin() as connection:
+        connection.execute(insert(HealthContent.__table__), [
+            {'id': record.id, 'title': record.title, 'description': record.description, 'tags': record.tags,
+             'category': record.category, 'content_type': 'article', 'popularity_score': rng.uniform(0, 10)}
+            for record in records
+        ])
+
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        create_index(connection)
+    index_seconds = time.perf_counter() - start
+
+    samples = [rng.choice(records) for _ in range(queries)]
+    phrases = [' '.join(rng.sample(record.title.split(), 2)) for record in samples]
+    single = [rng.choice(record.title.split()) for record in samples]
+
+    def timed(search, inputs):
+        latencies = []
+        with engine.connect() as connection:
+            for value in inputs:
+                start = time.perf_counter()
+                search(connection, value)
+                latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return sum(latencies) / len(latencies), latencies[int(len(latencies) * 0.95)]
+
+    fts_single = timed(lambda connection, value: search_ids_sqlite(connection, terms(value)), single)
+    fts_phrase = timed(lambda connection, value: search_ids_sqlite(connection, terms(value)), phrases)
+    like_single = timed(lambda connection, value: search_ids_like(connection, value), single[:20])
+
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for record in records[:1000]:
+            connection.execute(text("UPDATE health_content SET title = :title WHERE id = :id"),
+                               {'title': record.title + ' revised', 'id': record.id})
+    update_ms = (time.perf_counter() - start) * 1000 / 1000
+
+    return {
+        'items': items,
+        'index_seconds': round(index_seconds, 2),
+        'fts_single_term_ms': [round(value, 3) for value in fts_single],
+        'fts_two_terms_ms': [round(value, 3) for value in fts_phrase],
+        'ilike_single_term_ms': [round(value, 3) for value in like_single],
+        'indexed_update_ms': round(update_ms, 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain and benchmark the content full-text index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild')
+    benchmark_parser = subparsers.add_parser('benchmark')
+    benchmark_parser.add_argument('--items', type=int, default=100000)
+    benchmark_parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        with app.app_context():
+            print("🔎 Rebuilding the full-text index...")
+            with db.engine.begin() as connection:
+                backend = create_index(connection)
+                if backend == 'fts5':
+                    populate_sqlite(connection)
+            print(f"✅ Index ready ({backend or 'not supported on this database'})")
+    else:
+        print(f"🧪 Benchmarking search over {args.items} synthetic items (mean, p95 in ms)...")
+        for key, value in benchmark(args.items, args.queries).items():
+            print(f"  {key}: {value}")
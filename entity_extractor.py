@@ -0,0 +1,224 @@
+"""
+Offline dictionary-based medical entity extraction.
+
+A medical lexicon is compiled into an Aho-Corasick automaton so every term in
+the lexicon is matched in a single pass over the input text. Results use the
+same {'text', 'label', 'confidence'} shape as the Hugging Face NER model.
+"""
+
+import json
+import logging
+import re
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Labels follow the d4data/biomedical-ner-all tag set
+DEFAULT_LEXICON = {
+    'Sign_symptom': [
+        'headache', 'migraine', 'fever', 'cough', 'dry cough', 'sore throat', 'runny nose',
+        'congestion', 'nausea', 'vomiting', 'diarrhea', 'constipation', 'fatigue', 'tiredness',
+        'dizziness', 'lightheadedness', 'fainting', 'chest pain', 'chest tightness',
+        'shortness of breath', 'wheezing', 'palpitations', 'abdominal pain', 'stomach ache',
+        'back pain', 'joint pain', 'muscle pain', 'muscle aches', 'neck pain', 'rash', 'itching',
+        'swelling', 'numbness', 'tingling', 'weakness', 'chills', 'night sweats', 'sweating',
+        'insomnia', 'anxiety', 'panic attack', 'low mood', 'weight loss', 'weight gain',
+        'blurred vision', 'loss of appetite', 'loss of smell', 'loss of taste', 'bloating',
+        'heartburn', 'frequent urination', 'excessive thirst', 'confusion', 'memory loss',
+        'tremor', 'bleeding', 'bruising', 'pain',
+    ],
+    'Disease_disorder': [
+        'diabetes', 'type 1 diabetes', 'type 2 diabetes', 'hypertension', 'high blood pressure',
+        'low blood pressure', 'heart disease', 'coronary artery disease', 'heart failure',
+        'arrhythmia', 'atrial fibrillation', 'stroke', 'asthma', 'copd', 'bronchitis',
+        'pneumonia', 'influenza', 'flu', 'common cold', 'covid-19', 'covid', 'sinusitis',
+        'allergy', 'allergies', 'depression', 'anxiety disorder', 'bipolar disorder', 'ptsd',
+        'adhd', 'arthritis', 'osteoarthritis', 'rheumatoid arthritis', 'osteoporosis', 'gout',
+        'obesity', 'anemia', 'hypothyroidism', 'hyperthyroidism', 'high cholesterol',
+        'kidney disease', 'kidney stones', 'urinary tract infection', 'uti', 'gerd',
+        'acid reflux', 'irritable bowel syndrome', 'ibs', 'migraine disorder', 'epilepsy',
+        'eczema', 'psoriasis', 'cancer', 'infection', 'dehydration', 'concussion',
+    ],
+    'Medication': [
+        'aspirin', 'ibuprofen', 'acetaminophen', 'paracetamol', 'naproxen', 'metformin',
+        'insulin', 'lisinopril', 'amlodipine', 'losartan', 'metoprolol', 'atorvastatin',
+        'simvastatin', 'rosuvastatin', 'warfarin', 'clopidogrel', 'levothyroxine',
+        'omeprazole', 'pantoprazole', 'albuterol', 'prednisone', 'amoxicillin',
+        'azithromycin', 'ciprofloxacin', 'sertraline', 'fluoxetine', 'escitalopram',
+        'citalopram', 'bupropion', 'gabapentin', 'cetirizine', 'loratadine',
+        'diphenhydramine', 'hydrochlorothiazide', 'furosemide', 'antibiotics',
+        'antihistamine', 'antidepressants', 'painkillers',
+    ],
+    'Biological_structure': [
+        'head', 'chest', 'heart', 'lungs', 'lung', 'throat', 'stomach', 'abdomen', 'back',
+        'lower back', 'neck', 'shoulder', 'knee', 'hip', 'ankle', 'wrist', 'elbow', 'skin',
+        'eyes', 'eye', 'ears', 'ear', 'nose', 'liver', 'kidney', 'kidneys', 'bladder',
+        'joints', 'muscles', 'arm', 'leg', 'legs', 'foot', 'feet', 'hand', 'hands',
+    ],
+    'Duration': [
+        'for a day', 'for two days', 'for three days', 'for a week', 'for two weeks',
+        'for a month', 'since yesterday', 'since last week', 'chronic', 'acute',
+    ],
+    'Severity': [
+        'mild', 'moderate', 'severe', 'intense', 'sharp', 'dull', 'throbbing', 'persistent',
+        'worsening', 'sudden',
+    ],
+}
+
+STOPWORDS = {
+    'the', 'and', 'for', 'but', 'with', 'have', 'has', 'had', 'been', 'was', 'were', 'are',
+    'that', 'this', 'from', 'into', 'about', 'also', 'very', 'some', 'any', 'feel', 'feeling',
+    'felt', 'days', 'day', 'week', 'weeks', 'since', 'when', 'then', 'after', 'before',
+    'my', 'i', 'me', 'a', 'an', 'of', 'in', 'on', 'at', 'to', 'is', 'it', 'its', 'not',
+    'get', 'got', 'getting', 'really', 'lot', 'bit', 'little', 'like', 'just', 'having',
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-']*")
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over lowercase text.
+
+    States are stored as parallel lists: goto transitions, failure links and
+    the patterns that end at each state (including those reached through
+    failure links, so matching never walks the failure chain for output).
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._compiled = False
+
+    def add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), value))
+        self._compiled = False
+
+    def compile(self):
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._compiled = True
+
+    def iter_matches(self, text):
+        """Yield (start, end, value) for every pattern occurrence in text"""
+        if not self._compiled:
+            self.compile()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield index - length + 1, index + 1, value
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class MedicalEntityExtractor:
+    """Lexicon-backed entity extractor built on an Aho-Corasick automaton"""
+
+    def __init__(self, lexicon=None, confidence=0.95):
+        self.confidence = confidence
+        self.automaton = AhoCorasick()
+        self.term_count = 0
+        for label, terms in (lexicon or DEFAULT_LEXICON).items():
+            for term in terms:
+                term = term.strip().lower()
+                if term:
+                    self.automaton.add(term, label)
+                    self.term_count += 1
+        self.automaton.compile()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load a lexicon JSON file of the form {"Label": ["term", ...]}"""
+        with open(path, encoding='utf-8') as f:
+            lexicon = json.load(f)
+        return cls(lexicon, **kwargs)
+
+    @staticmethod
+    def _is_boundary(text, index):
+        return index < 0 or index >= len(text) or not text[index].isalnum()
+
+    def extract(self, text):
+        """Return (entities, coverage) for the given text.
+
+        Overlapping matches are resolved leftmost-longest. Coverage is the
+        share of content tokens (ignoring stopwords) that fall inside a match.
+        """
+        if not text:
+            return [], 1.0
+
+        lowered = text.lower()
+        candidates = [
+            (start, end, label)
+            for start, end, label in self.automaton.iter_matches(lowered)
+            if self._is_boundary(lowered, start - 1) and self._is_boundary(lowered, end)
+        ]
+        candidates.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+
+        entities = []
+        spans = []
+        last_end = -1
+        for start, end, label in candidates:
+            if start < last_end:
+                continue
+            entities.append({
+                'text': text[start:end],
+                'label': label,
+                'confidence': self.confidence
+            })
+            spans.append((start, end))
+            last_end = end
+
+        return entities, self._coverage(lowered, spans)
+
+    @staticmethod
+    def _coverage(lowered, spans):
+        tokens = [match for match in TOKEN_PATTERN.finditer(lowered)
+                  if match.group() not in STOPWORDS and len(match.group()) > 2]
+        if not tokens:
+            return 1.0
+        covered = 0
+        span_index = 0
+        for token in tokens:
+            while span_index < len(spans) and spans[span_index][1] <= token.start():
+                span_index += 1
+            if span_index < len(spans) and spans[span_index][0] <= token.start() < spans[span_index][1]:
+                covered += 1
+        return covered / len(tokens)
+
+
+def merge_entities(primary, secondary):
+    """Combine entity lists, dropping secondary entities whose text is already present"""
+    seen = {entity['text'].lower() for entity in primary}
+    merged = list(primary)
+    for entity in secondary:
+        key = entity.get('text', '').lower()
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(entity)
+    return merged
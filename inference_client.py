@@ -0,0 +1,233 @@
+"""
+Shared HTTP client for the Hugging Face inference API.
+
+Keeps a pooled keep-alive session, applies per-model (connect, read) timeouts,
+retries transient failures with jittered exponential backoff and caps the
+number of in-flight requests per model.
+
+Run as a script to benchmark against a local stub server (no network needed):
+
+    python inference_client.py --requests 500 --concurrency 32 --latency 50
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying; 503 is returned while a model is loading
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class InferenceUnavailable(Exception):
+    """Raised when a model has too many requests in flight"""
+
+
+class InferenceClient:
+    """Pooled, timeout-bounded client for Hugging Face model endpoints"""
+
+    def __init__(self, base_url, headers=None, pool_size=10, default_timeout=(3.05, 15),
+                 model_timeouts=None, max_retries=2, backoff_base=0.25, backoff_cap=4.0,
+                 max_in_flight=8, queue_timeout=None):
+        self.base_url = base_url.rstrip('/')
+        self.default_timeout = default_timeout
+        self.model_timeouts = dict(model_timeouts or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_in_flight = max_in_flight
+        # How long to wait for a free in-flight slot before giving up
+        self.queue_timeout = queue_timeout if queue_timeout is not None else default_timeout[0]
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    def _limiter(self, model):
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = threading.BoundedSemaphore(self.max_in_flight)
+                self._limiters[model] = limiter
+            return limiter
+
+    def _count(self, model, key):
+        with self._lock:
+            self._stats[model][key] += 1
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff delay for the given retry attempt"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def timeout_for(self, model):
+        return self.model_timeouts.get(model, self.default_timeout)
+
+    def post(self, model, payload):
+        """POST a JSON payload to a model endpoint and return the response.
+
+        Transient errors are retried up to max_retries times. The last
+        retryable response is returned once retries are exhausted; connection
+        errors and timeouts are re-raised.
+        """
+        limiter = self._limiter(model)
+        if not limiter.acquire(timeout=self.queue_timeout):
+            self._count(model, 'rejected')
+            raise InferenceUnavailable(f"Too many in-flight requests for {model}")
+
+        try:
+            url = f"{self.base_url}/{model}"
+            timeout = self.timeout_for(model)
+            attempt = 0
+            while True:
+                self._count(model, 'requests')
+                try:
+                    response = self.session.post(url, json=payload, timeout=timeout)
+                    if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                        return response
+                    logger.warning(f"Inference API {model} returned {response.status_code}, retrying")
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self._count(model, 'errors')
+                    if attempt >= self.max_retries:
+                        raise
+                    logger.warning(f"Inference API {model} failed ({e.__class__.__name__}), retrying")
+
+                self._count(model, 'retries')
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+        finally:
+            limiter.release()
+
+    def stats(self):
+        """Per-model request, retry, error and rejection counters"""
+        with self._lock:
+            return {model: dict(counters) for model, counters in self._stats.items()}
+
+    def close(self):
+        self.session.close()
+
+
+# Local stub server for benchmarking
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.05
+    jitter = 0.01
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        inputs = body.get('inputs')
+        if isinstance(inputs, dict):
+            result = {'answer': 'stub answer', 'score': 0.9, 'start': 0, 'end': 4}
+        elif 'ner' in self.path:
+            result = [{'entity': 'Sign_symptom', 'word': word, 'score': 0.95}
+                      for word in str(inputs).split()[:3]]
+        else:
+            result = [{'label': 'general', 'score': 0.5}]
+
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_stub_server(host='127.0.0.1', port=0, latency_ms=50, jitter_ms=10):
+    """Start a stub inference server in a background thread and return it"""
+    handler = type('StubHandler', (_StubHandler,), {
+        'latency': latency_ms / 1000.0,
+        'jitter': jitter_ms / 1000.0,
+    })
+    server_class = type('StubServer', (ThreadingHTTPServer,), {'request_queue_size': 128})
+    server = server_class((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def benchmark(client, model, payload, total_requests=200, concurrency=16):
+    """Issue requests concurrently and report latency percentiles in milliseconds"""
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def one_call(_):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            client.post(model, payload).raise_for_status()
+        except Exception:
+            with lock:
+                failures += 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_call, range(total_requests)))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        'requests': total_requests,
+        'failures': failures,
+        'p50_ms': round(_percentile(latencies, 50), 2),
+        'p99_ms': round(_percentile(latencies, 99), 2),
+        'throughput_rps': round(total_requests / wall, 1) if wall else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the inference client against a local stub server')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=50, help='stub latency in ms')
+    parser.add_argument('--jitter', type=float, default=10, help='stub latency jitter in ms')
+    parser.add_argument('--max-in-flight', type=int, default=8)
+    args = parser.parse_args()
+
+    server = run_stub_server(latency_ms=args.latency, jitter_ms=args.jitter)
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}/models"
+    model = 'd4data/biomedical-ner-all'
+
+    client = InferenceClient(base_url, pool_size=args.concurrency, max_in_flight=args.max_in_flight,
+                             queue_timeout=60)
+    print(json.dumps(benchmark(client, model, {'inputs': 'headache and fever'},
+                               args.requests, args.concurrency), indent=2))
+    print(json.dumps(client.stats(), indent=2))
+    client.close()
+    server.shutdown()
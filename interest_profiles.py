@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Materialized per-user interest profiles.
+
+UserInterestCounter keeps daily counts of each user's content interactions
+by category and content type. Counters are bumped as activities are written,
+so reading a user's interests over a window is one indexed aggregate over a
+handful of rows instead of one content lookup per activity. Days before a
+user's first counter (users active before the counters existed, or never
+rebuilt) are aggregated from UserActivity instead, so running the rebuild
+below is an optimization, not a requirement.
+
+Run this script to rebuild the counters from UserActivity:
+    python interest_profiles.py [--user-id ID] [--days 90]
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import HealthContent, UserActivity, UserInterestCounter
+from catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('category', 'content_type')
+
+# Profile condition keywords mapped to the content category they suggest
+CONDITION_CATEGORIES = [
+    (('diabetes',), 'endocrinology'),
+    (('heart', 'cardiac'), 'cardiology'),
+    (('mental', 'anxiety', 'depression'), 'mental_health'),
+    (('weight', 'obesity'), 'nutrition'),
+]
+
+
+def condition_categories(medical_conditions):
+    """Categories implied by a free-text medical conditions field"""
+    if not medical_conditions:
+        return []
+    conditions = medical_conditions.lower()
+    return [category for keywords, category in CONDITION_CATEGORIES
+            if any(keyword in conditions for keyword in keywords)]
+
+
+def _increment(user_id, day, dimension, value, amount=1):
+    updated = UserInterestCounter.query.filter_by(
+        user_id=user_id, day=day, dimension=dimension, value=value
+    ).update({'count': UserInterestCounter.count + amount}, synchronize_session=False)
+    if updated:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserInterestCounter(
+                user_id=user_id, day=day, dimension=dimension, value=value, count=amount
+            ))
+    except IntegrityError:
+        # Another request created the row first
+        UserInterestCounter.query.filter_by(
+            user_id=user_id, day=day, dimension=dimension, value=value
+        ).update({'count': UserInterestCounter.count + amount}, synchronize_session=False)
+
+
+def record_content_interaction(user_id, content_id, when=None):
+    """Bump the user's counters for a content interaction (caller commits)"""
+    record_content_interactions([(user_id, content_id, when)])
+
+
+def record_content_interactions(interactions):
+    """Bump counters for (user_id, content_id, when) triples, one update per counter row"""
+    snapshot = catalog.snapshot()
+    amounts = defaultdict(int)
+    for user_id, content_id, when in interactions:
+        content = snapshot.get(content_id)
+        if content is None:
+            content = db.session.get(HealthContent, content_id)
+            if content is None:
+                continue
+        day = (when or datetime.utcnow()).date()
+        amounts[(user_id, day, 'category', content.category)] += 1
+        amounts[(user_id, day, 'content_type', content.content_type)] += 1
+    for (user_id, day, dimension, value), amount in amounts.items():
+        _increment(user_id, day, dimension, value, amount)
+
+
+def _activity_counts(user_id, since, until=None):
+    """(dimension, value, count) aggregated from UserActivity for days in [since, until)"""
+    rows = []
+    for dimension in DIMENSIONS:
+        column = getattr(HealthContent, dimension)
+        query = db.session.query(column, db.func.count(UserActivity.id))\
+            .join(HealthContent, HealthContent.id == UserActivity.content_id)\
+            .filter(UserActivity.user_id == user_id,
+                    UserActivity.timestamp >= datetime.combine(since, datetime.min.time()))
+        if until is not None:
+            query = query.filter(UserActivity.timestamp < datetime.combine(until, datetime.min.time()))
+        rows.extend((dimension, value, count) for value, count in query.group_by(column))
+    return rows
+
+
+def get_interest_counts(user_id, days=30):
+    """Return {'category': {...}, 'content_type': {...}} counts over the window"""
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    rows = db.session.query(
+        UserInterestCounter.dimension,
+        UserInterestCounter.value,
+        db.func.sum(UserInterestCounter.count)
+    ).filter(
+        UserInterestCounter.user_id == user_id,
+        UserInterestCounter.day >= since
+    ).group_by(UserInterestCounter.dimension, UserInterestCounter.value).all()
+
+    # Counters only start at the user's first counted day; older activity is read directly
+    first_day = db.session.query(db.func.min(UserInterestCounter.day))\
+        .filter(UserInterestCounter.user_id == user_id).scalar()
+    if isinstance(first_day, str):
+        first_day = datetime.strptime(first_day, '%Y-%m-%d').date()
+    if first_day is None or first_day > since:
+        rows = rows + _activity_counts(user_id, since, first_day)
+
+    counts = {dimension: {} for dimension in DIMENSIONS}
+    for dimension, value, total in rows:
+        bucket = counts.setdefault(dimension, {})
+        bucket[value] = bucket.get(value, 0) + int(total)
+    return counts
+
+
+def rebuild(user_id=None, days=90):
+    """Recompute counters from UserActivity with one aggregated join per dimension"""
+    since = datetime.utcnow() - timedelta(days=days)
+
+    delete_query = UserInterestCounter.query
+    if user_id is not None:
+        delete_query = delete_query.filter_by(user_id=user_id)
+    delete_query.delete(synchronize_session=False)
+
+    day = db.func.date(UserActivity.timestamp)
+    inserted = 0
+    for dimension in DIMENSIONS:
+        column = getattr(HealthContent, dimension)
+        query = db.session.query(
+            UserActivity.user_id, day, column, db.func.count(UserActivity.id)
+        ).join(HealthContent, HealthContent.id == UserActivity.content_id)\
+         .filter(UserActivity.timestamp > since)
+        if user_id is not None:
+            query = query.filter(UserActivity.user_id == user_id)
+
+        rows = []
+        for row_user_id, row_day, value, count in query.group_by(UserActivity.user_id, day, column):
+            if isinstance(row_day, str):
+                row_day = datetime.strptime(row_day, '%Y-%m-%d').date()
+            rows.append({'user_id': row_user_id, 'day': row_day, 'dimension': dimension,
+                         'value': value, 'count': count})
+        if rows:
+            db.session.execute(UserInterestCounter.__table__.insert(), rows)
+        inserted += len(rows)
+
+    db.session.commit()
+    return inserted
+
+
+def prune(days=90):
+    """Delete counters older than the longest window we read"""
+    cutoff = (datetime.utcnow() - timedelta(days=days)).date()
+    deleted = UserInterestCounter.query.filter(UserInterestCounter.day < cutoff)\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild materialized user interest profiles')
+    parser.add_argument('--user-id', type=int, default=None)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    with app.app_context():
+        print("📊 Rebuilding user interest profiles...")
+        count = rebuild(args.user_id, args.days)
+        print(f"✅ Wrote {count} interest counters")
@@ -0,0 +1,113 @@
+"""
+In-process background job queue.
+
+Jobs are identified by a key; submitting a key that is already pending or
+running is a no-op, so repeated page views collapse into one job. Workers are
+plain threads, which become green threads under eventlet's monkey patching.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Bounded worker pool that runs deduplicated jobs inside an app context"""
+
+    def __init__(self, app, workers=2, max_pending=1000):
+        self.app = app
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) unless a job with the same key is pending.
+
+        Returns True if the job was queued.
+        """
+        with self._lock:
+            if self._stopping:
+                return False
+            if key in self._pending:
+                self.deduplicated += 1
+                return False
+            self._ensure_started()
+            try:
+                self._queue.put_nowait((key, func, args, kwargs))
+            except queue.Full:
+                self.rejected += 1
+                logger.warning(f"Job queue full, dropping job {key}")
+                return False
+            self._pending.add(key)
+            self.submitted += 1
+            return True
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            key, func, args, kwargs = item
+            start = time.monotonic()
+            try:
+                with self.app.app_context():
+                    func(*args, **kwargs)
+                with self._lock:
+                    self.completed += 1
+                logger.debug(f"Job {key} finished in {time.monotonic() - start:.2f}s")
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"Job {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and let workers drain the queue"""
+        with self._lock:
+            self._stopping = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self._queue.qsize(),
+                'pending': len(self._pending),
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
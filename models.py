@@ -58,6 +58,10 @@ class HealthContent(db.Model):
     ratings = db.relationship('UserRating', backref='content', lazy=True)
     activities = db.relationship('UserActivity', backref='content', lazy=True)
     bookmarks = db.relationship('UserBookmark', backref='content', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_health_content_category_popularity', 'category', 'popularity_score'),
+    )
 
 class UserActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -68,6 +72,11 @@ class UserActivity(db.Model):
     duration = db.Column(db.Integer, nullable=True)  # time spent in seconds
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     activity_metadata = db.Column(db.Text, nullable=True)  # JSON for additional context
+    
+    __table_args__ = (
+        db.Index('ix_user_activity_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_user_activity_user_type_content', 'user_id', 'activity_type', 'content_id'),
+    )
 
 class UserRating(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,12 +85,20 @@ class UserRating(db.Model):
     rating = db.Column(db.Integer, nullable=False)  # 1-5 scale
     review = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_user_rating_user_content', 'user_id', 'content_id'),
+    )
 
 class UserBookmark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content_id = db.Column(db.Integer, db.ForeignKey('health_content.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_user_bookmark_user_content', 'user_id', 'content_id'),
+    )
 
 class Consultation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -93,6 +110,10 @@ class Consultation(db.Model):
     severity_level = db.Column(db.String(20), nullable=True)
     confidence_score = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_consultation_user_created', 'user_id', 'created_at'),
+    )
 
 class PredictiveInsight(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -106,3 +127,84 @@ class PredictiveInsight(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref=db.backref('insights', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_predictive_insight_user_active_created', 'user_id', 'is_active', 'created_at'),
+    )
+
+class AnalysisCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of normalized prompt inputs
+    model_name = db.Column(db.String(100), nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON analysis
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class UserInterestCounter(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # 'category' or 'content_type'
+    value = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)  # content interactions that day
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'dimension', 'value', name='uq_user_interest_counter'),
+    )
+
+class RelatedContent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    content_id = db.Column(db.Integer, db.ForeignKey('health_content.id', ondelete='CASCADE'), nullable=False)
+    related_id = db.Column(db.Integer, db.ForeignKey('health_content.id', ondelete='CASCADE'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 0 = most similar
+    score = db.Column(db.Float, nullable=False)  # TF-IDF cosine similarity
+    
+    __table_args__ = (
+        db.Index('ix_related_content_content_rank', 'content_id', 'rank'),
+        db.Index('ix_related_content_related', 'related_id'),
+    )
+
+class ContentEngagement(db.Model):
+    content_id = db.Column(db.Integer, db.ForeignKey('health_content.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)  # exponentially decayed engagement as of updated_at
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class RecommendationGeneration(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='running')  # 'running', 'complete', 'failed'
+    users = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_recommendation_generation_status', 'status', 'id'),
+    )
+
+class PrecomputedRecommendation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    generation_id = db.Column(db.Integer, db.ForeignKey('recommendation_generation.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('health_content.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_precomputed_recommendation_lookup', 'generation_id', 'user_id', 'rank'),
+    )
+
+class UserSeenContent(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    bitmap = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed bit array indexed by content id
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ActivityRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # 'activity_type', 'category' or 'consultation'
+    value = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'dimension', 'value', name='uq_activity_rollup'),
+    )
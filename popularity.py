@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Engagement-driven popularity scores.
+
+Views, ratings and bookmarks add weighted increments to a per-item score that
+decays exponentially with a configurable half-life. Increments are buffered
+in process and flushed in batches: a flush decays the touched
+ContentEngagement rows to the current time, adds the buffered weight and
+writes the result to HealthContent.popularity_score with bulk UPDATEs. A
+periodic decay pass brings untouched items forward so idle content sinks.
+
+Items start from their existing popularity_score, so seeded values act as a
+prior that fades as real engagement accumulates.
+
+    python popularity.py decay
+"""
+
+import argparse
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import update, insert, select
+
+from app import app, db
+from models import HealthContent, ContentEngagement
+from catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+VIEW_WEIGHT = 1.0
+BOOKMARK_WEIGHT = 3.0
+RATING_WEIGHT = 0.5  # per star
+
+
+def engagement_weight(activity_type, metadata=None):
+    """Score increment for one tracked activity"""
+    metadata = metadata or {}
+    if activity_type == 'view':
+        return VIEW_WEIGHT
+    if activity_type == 'bookmark':
+        return -BOOKMARK_WEIGHT if metadata.get('action') == 'removed' else BOOKMARK_WEIGHT
+    if activity_type == 'rating':
+        # A re-rating only moves the score by the change from the user's previous rating
+        previous = metadata.get('previous_rating')
+        return RATING_WEIGHT * (float(metadata.get('rating') or 3) - float(previous or 0))
+    return 0.0
+
+
+class PopularityTracker:
+    """Buffers engagement increments and flushes them as decayed scores"""
+
+    def __init__(self, job_queue, half_life_days=7, flush_interval=60, flush_batch=500,
+                 decay_interval=3600):
+        self.job_queue = job_queue
+        self.half_life = half_life_days * 86400
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.decay_interval = decay_interval
+        self._pending = defaultdict(float)
+        self._pending_events = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._ticker = None
+        self._last_decay = time.monotonic()
+        self.events = 0
+        self.flushes = 0
+        self.items_flushed = 0
+        self.decay_passes = 0
+        self.failures = 0
+
+    def decay_factor(self, seconds):
+        return 0.5 ** (max(seconds, 0.0) / self.half_life)
+
+    def record(self, content_id, activity_type, metadata=None):
+        weight = engagement_weight(activity_type, metadata)
+        if not content_id or not weight:
+            return
+        with self._lock:
+            self._pending[content_id] += weight
+            self._pending_events += 1
+            self.events += 1
+            full = self._pending_events >= self.flush_batch
+            self._ensure_started()
+        if full:
+            self.job_queue.submit('popularity:flush', self.flush)
+
+    def _ensure_started(self):
+        if self._ticker is not None:
+            return
+        self._ticker = threading.Thread(target=self._tick, name='popularity-flush', daemon=True)
+        self._ticker.start()
+        atexit.register(self._flush_at_exit)
+
+    def _tick(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.job_queue.submit('popularity:flush', self.flush)
+            if time.monotonic() - self._last_decay >= self.decay_interval:
+                self._last_decay = time.monotonic()
+                self.job_queue.submit('popularity:decay', self.decay_all)
+
+    def _flush_at_exit(self):
+        try:
+            with self.job_queue.app.app_context():
+                self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing popularity at exit: {e}")
+
+    def flush(self):
+        """Write buffered increments; failed batches are kept for the next flush"""
+        with self._lock:
+            deltas = self._pending
+            self._pending = defaultdict(float)
+            self._pending_events = 0
+        if not deltas:
+            return 0
+
+        try:
+            written = self.apply(deltas)
+        except Exception as e:
+            db.session.rollback()
+            with self._lock:
+                for content_id, delta in deltas.items():
+                    self._pending[content_id] += delta
+                self.failures += 1
+            logger.error(f"Error flushing popularity scores: {e}")
+            return 0
+
+        with self._lock:
+            self.flushes += 1
+            self.items_flushed += written
+        return written
+
+    def apply(self, deltas, now=None):
+        """Decay the touched items to now, add their deltas and persist both tables"""
+        now = now or datetime.utcnow()
+        content_ids = sorted(deltas)
+        with self._write_lock:
+            current = {content_id: (score, updated_at) for content_id, score, updated_at in
+                       db.session.query(ContentEngagement.content_id, ContentEngagement.score,
+                                        ContentEngagement.updated_at)
+                       .filter(ContentEngagement.content_id.in_(content_ids))
+                       .with_for_update()}
+            missing = [content_id for content_id in content_ids if content_id not in current]
+            priors = {}
+            if missing:
+                priors = dict(db.session.query(HealthContent.id, HealthContent.popularity_score)
+                              .filter(HealthContent.id.in_(missing)))
+
+            engagement_rows, new_rows, content_rows = [], [], []
+            for content_id in content_ids:
+                if content_id in current:
+                    score, updated_at = current[content_id]
+                    score = score * self.decay_factor((now - updated_at).total_seconds())
+                    target = engagement_rows
+                elif content_id in priors:
+                    score = priors[content_id] or 0.0
+                    target = new_rows
+                else:
+                    continue  # content was deleted
+                score = max(score + deltas[content_id], 0.0)
+                target.append({'content_id': content_id, 'score': score, 'updated_at': now})
+                content_rows.append({'id': content_id, 'popularity_score': round(score, 4)})
+
+            if engagement_rows:
+                db.session.execute(update(ContentEngagement), engagement_rows)
+            if new_rows:
+                db.session.execute(insert(ContentEngagement), new_rows)
+            if content_rows:
+                db.session.execute(update(HealthContent), content_rows)
+            db.session.commit()
+
+        # Bulk updates skip mapper events, so the catalog must be told directly
+        if content_rows:
+            catalog.update_scores({row['id']: row['popularity_score'] for row in content_rows})
+        return len(content_rows)
+
+    def decay_all(self, now=None, batch_size=1000):
+        """Decay every item to now, seeding rows for content never engaged with"""
+        now = now or datetime.utcnow()
+        with self._write_lock:
+            seeded = db.session.execute(
+                insert(ContentEngagement).from_select(
+                    ['content_id', 'score', 'updated_at'],
+                    select(HealthContent.id, db.func.coalesce(HealthContent.popularity_score, 0.0),
+                           db.literal(now))
+                    .where(~HealthContent.id.in_(select(ContentEngagement.content_id)))
+                )
+            ).rowcount
+
+            decayed = 0
+            last_id = 0
+            scores = {}
+            while True:
+                batch = db.session.query(ContentEngagement.content_id, ContentEngagement.score,
+                                         ContentEngagement.updated_at)\
+                    .filter(ContentEngagement.content_id > last_id)\
+                    .order_by(ContentEngagement.content_id).limit(batch_size)\
+                    .with_for_update().all()
+                if not batch:
+                    break
+                engagement_rows, content_rows = [], []
+                for content_id, score, updated_at in batch:
+                    score = score * self.decay_factor((now - updated_at).total_seconds())
+                    engagement_rows.append({'content_id': content_id, 'score': score, 'updated_at': now})
+                    content_rows.append({'id': content_id, 'popularity_score': round(score, 4)})
+                db.session.execute(update(ContentEngagement), engagement_rows)
+                db.session.execute(update(HealthContent), content_rows)
+                db.session.commit()
+                scores.update((row['id'], row['popularity_score']) for row in content_rows)
+                decayed += len(batch)
+                last_id = batch[-1][0]
+
+        catalog.update_scores(scores)
+        with self._lock:
+            self.decay_passes += 1
+        logger.info(f"Decayed popularity for {decayed} items ({seeded} newly tracked)")
+        return decayed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending_items': len(self._pending),
+                'pending_events': self._pending_events,
+                'events': self.events,
+                'flushes': self.flushes,
+                'items_flushed': self.items_flushed,
+                'decay_passes': self.decay_passes,
+                'failures': self.failures,
+            }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain engagement-based popularity scores')
+    parser.add_argument('command', choices=['decay'])
+    args = parser.parse_args()
+
+    from ai_services import popularity_tracker
+    with app.app_context():
+        db.create_all()
+        print("📈 Decaying popularity scores...")
+        count = popularity_tracker.decay_all()
+        print(f"✅ Updated {count} items")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Schema index migration and query-plan regression check.
+
+`migrate` creates any index declared in models.py that an existing database
+is missing (db.create_all only creates whole tables) and, on PostgreSQL,
+refreshes planner statistics for the affected tables.
+
+`check` drives the request handlers and the database-only recommendation
+helpers with a test client, records every SELECT/UPDATE/DELETE they issue,
+and EXPLAINs each one. It fails when a query that filters a table scans it
+in full. On PostgreSQL plans are taken with enable_seqscan off, so a Seq Scan
+means no usable index exists, not that the table is too small to bother.
+SQLite databases should not have been ANALYZEd, for the same reason.
+Whole-table reads (the catalog snapshot, existence probes) and the scans in
+EXPECTED_SCANS are allowed. Handlers that call Gemini (consultation POST,
+/api/generate_insights, /api/recommendations/refresh) are not driven.
+
+The check writes a test user and activity, so point it at a throwaway
+database that has sample content:
+    DATABASE_URL=sqlite:////tmp/plans.db python query_plans.py check
+    python query_plans.py migrate [--dry-run]
+"""
+
+import argparse
+import logging
+import re
+import sys
+import time
+
+from sqlalchemy import event, inspect, text
+
+from app import app, db
+from models import Consultation, HealthContent, PredictiveInsight, User
+
+logger = logging.getLogger(__name__)
+
+# Full scans that are expected for now: (table, statement pattern, reason)
+EXPECTED_SCANS = [
+    ('health_content', re.compile(r'lower\(health_content\.title\) LIKE', re.I),
+     'ILIKE search, only used on databases without a full-text index'),
+]
+
+CHECK_USERNAME = 'query_plan_check'
+
+
+def missing_indexes():
+    """Declared (table, index) pairs the connected database does not have"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend((table, index) for index in table.indexes if index.name not in present)
+    return missing
+
+
+def migrate(dry_run=False):
+    """Create missing declared indexes; returns their names"""
+    db.create_all()
+    missing = missing_indexes()
+    if dry_run:
+        return [index.name for table, index in missing]
+
+    with db.engine.begin() as connection:
+        for table, index in missing:
+            start = time.monotonic()
+            index.create(connection, checkfirst=True)
+            logger.info(f"Created {index.name} on {table.name} in {time.monotonic() - start:.2f}s")
+        if connection.dialect.name == 'postgresql':
+            for table_name in sorted({table.name for table, index in missing}):
+                connection.execute(text(f'ANALYZE "{table_name}"'))
+    return [index.name for table, index in missing]
+
+
+def _check_user():
+    user = User.query.filter_by(username=CHECK_USERNAME).first()
+    if user is None:
+        user = User(username=CHECK_USERNAME, email=f'{CHECK_USERNAME}@example.com', password_hash='!',
+                    full_name='Query Plan Check', age=40, gender='other', medical_conditions='heart disease')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Consultation(user_id=user.id, symptoms='chest pain', analysis_result='{}',
+                                    extracted_entities='[]'))
+        db.session.commit()
+    # A fresh active insight keeps /analytics from scheduling a Gemini refresh
+    db.session.add(PredictiveInsight(user_id=user.id, insight_type='wellness_trend', title='Check',
+                                     description='Query plan check', confidence_score=0.5, priority_level='low'))
+    db.session.commit()
+    return user.id
+
+
+def capture_queries():
+    """Run the handlers once and return {statement: parameters} for every query they issued"""
+    import ai_services
+
+    with app.app_context():
+        user_id = _check_user()
+        content = HealthContent.query.order_by(HealthContent.id).first()
+        if content is None:
+            raise RuntimeError('No health content; run populate_data.py first')
+        content_id, category = content.id, content.category
+        consultation_id = Consultation.query.filter_by(user_id=user_id).first().id
+        engine = db.engine
+
+    statements = {}
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+            statements.setdefault(statement, parameters[0] if executemany else parameters)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client = app.test_client()
+        client.post('/login', data={'username': CHECK_USERNAME, 'password': 'wrong'})
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        for url in ['/', '/dashboard', '/profile', '/consultation_history', f'/consultation/{consultation_id}',
+                    f'/content/{content_id}', '/search?q=heart', f'/search?category={category}&type=article',
+                    '/analytics', '/api/content/categories']:
+            response = client.get(url)
+            if response.status_code >= 400:
+                logger.warning(f"{url} returned {response.status_code}")
+        client.post('/api/rate_content', data={'content_id': content_id, 'rating': 4})
+        for _ in range(2):
+            client.post('/api/bookmark_content', data={'content_id': content_id})
+
+        with app.app_context():
+            ai_services.invalidate_user_recommendations(user_id)
+            ai_services.get_content_based_recommendations(user_id, limit=6)
+            ai_services.get_collaborative_recommendations(user_id, limit=6)
+            ai_services.get_user_interests(user_id)
+            ai_services.get_related_content(content_id, limit=4)
+        # Buffered activity is written by a background thread; drain it so its queries are seen
+        ai_services.activity_buffer.shutdown()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+
+def explain(connection, statement, parameters):
+    """Plan lines for one statement"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+        return [row[0] for row in connection.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+    return [row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+def full_scans(plan, dialect):
+    """Tables the plan reads in full"""
+    if dialect == 'postgresql':
+        pattern = re.compile(r'Seq Scan on "?(\w+)"?')
+    else:
+        pattern = re.compile(r'^SCAN (\w+)\b(?! USING| VIRTUAL TABLE)')
+    return [match.group(1) for line in plan for match in [pattern.search(line.strip())] if match]
+
+
+def _filters(statement, table):
+    """Whether the statement restricts rows of table (rather than reading all of it)"""
+    return re.search(r'\b(WHERE|ON)\b[^;]*\b' + table + r'\.', statement, re.I | re.S) is not None
+
+
+def check():
+    """Return (statements checked, [(statement, table, plan)] regressions)"""
+    statements = capture_queries()
+    regressions = []
+    with app.app_context():
+        connection = db.session.connection()
+        dialect = connection.dialect.name
+        for statement, parameters in statements.items():
+            plan = explain(connection, statement, parameters)
+            for table in full_scans(plan, dialect):
+                if not _filters(statement, table):
+                    continue
+                if any(table == expected and pattern.search(statement) for expected, pattern, _ in EXPECTED_SCANS):
+                    continue
+                regressions.append((statement, table, plan))
+        db.session.rollback()
+    return len(statements), regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply schema indexes and check query plans')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate')
+    migrate_parser.add_argument('--dry-run', action='store_true')
+    subparsers.add_parser('check')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        with app.app_context():
+            print("🗂️ Applying schema indexes...")
+            created = migrate(args.dry_run)
+            verb = 'Missing' if args.dry_run else 'Created'
+            print(f"✅ {verb}: {', '.join(created) if created else 'none'}")
+    else:
+        print("🔍 Capturing and explaining queries...")
+        checked, regressions = check()
+        for statement, table, plan in regressions:
+            print(f"❌ Full scan of {table}:\n    {' '.join(statement.split())}\n    " + '\n    '.join(plan))
+        if regressions:
+            print(f"{len(regressions)} of {checked} queries scan a filtered table in full")
+            sys.exit(1)
+        print(f"✅ {checked} queries use indexes for every filtered table")
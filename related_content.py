@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Precomputed related content.
+
+The top-N most similar items for every content id are stored in the
+related_content table, so a content detail page reads one indexed row set.
+A bulk rebuild scores the whole catalog in blocks of sparse TF-IDF products;
+single inserts, text edits and deletes are applied incrementally by
+recomputing only the lists the changed item enters or leaves. The bulk
+rebuild is run from the command line (or cron), never from a request.
+
+    python related_content.py rebuild
+    python related_content.py benchmark --items 100000
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from app import app, db, RELATED_CONTENT_TOP_N
+from models import HealthContent, RelatedContent
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('title', 'description', 'tags', 'target_conditions')
+
+SESSION_KEY = 'related_content_changes'
+
+
+def top_related(index, rows, top_n, transposed=None):
+    """Yield (content_id, [(related_id, score), ...]) for the given index rows.
+
+    Pass the matrix transpose in CSR form when scoring many blocks; building
+    it once is cheaper than transposing per block.
+    """
+    if not len(rows):
+        return
+    if transposed is None:
+        transposed = index.matrix.T.tocsr()
+    block = index.matrix[rows] @ transposed
+    for offset, row in enumerate(rows):
+        start, end = block.indptr[offset], block.indptr[offset + 1]
+        columns = block.indices[start:end]
+        scores = block.data[start:end]
+        keep = (columns != row) & (scores > 0)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top_n:
+            best = np.argpartition(-scores, top_n - 1)[:top_n]
+            columns, scores = columns[best], scores[best]
+        order = np.lexsort((index.ids[columns], -scores))
+        yield int(index.ids[row]), [(int(index.ids[columns[i]]), float(scores[i])) for i in order]
+
+
+def _rows_for(content_id, related):
+    return [{'content_id': content_id, 'related_id': related_id, 'rank': rank, 'score': score}
+            for rank, (related_id, score) in enumerate(related)]
+
+
+class RelatedContentStore:
+    """Reads and maintains the related_content table from a TfidfIndex"""
+
+    def __init__(self, index_provider, top_n=10, batch_size=250):
+        self._index_provider = index_provider
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._checked_empty = False
+        self.rebuilds = 0
+        self.incremental_updates = 0
+        self.lists_recomputed = 0
+        self.last_rebuild_seconds = None
+
+    def get(self, content_id, limit=4):
+        rows = db.session.query(RelatedContent.related_id)\
+            .filter(RelatedContent.content_id == content_id)\
+            .order_by(RelatedContent.rank).limit(limit).all()
+        return [row[0] for row in rows]
+
+    def is_empty(self):
+        return db.session.query(RelatedContent.id).first() is None
+
+    def rebuild(self):
+        """Recompute every list and replace the table contents"""
+        with self._lock:
+            start = time.monotonic()
+            index = self._index_provider()
+            transposed = index.matrix.T.tocsr()
+            RelatedContent.query.delete(synchronize_session=False)
+            written = 0
+            for block_start in range(0, len(index), self.batch_size):
+                rows = np.arange(block_start, min(block_start + self.batch_size, len(index)))
+                params = []
+                for content_id, related in top_related(index, rows, self.top_n, transposed):
+                    params.extend(_rows_for(content_id, related))
+                if params:
+                    db.session.execute(RelatedContent.__table__.insert(), params)
+                written += len(params)
+            db.session.commit()
+            self.rebuilds += 1
+            self.last_rebuild_seconds = round(time.monotonic() - start, 2)
+            logger.info(f"Rebuilt related content for {len(index)} items "
+                        f"({written} rows) in {self.last_rebuild_seconds}s")
+            return written
+
+    def refresh(self, content_ids):
+        """Apply inserts, text edits or deletes of the given content ids"""
+        with self._lock:
+            # Before the first bulk rebuild every list would count as short
+            if self.is_empty():
+                return 0
+            index = self._index_provider()
+            changed = set(content_ids)
+            present = [content_id for content_id in changed if content_id in index.positions]
+            removed = changed - set(present)
+
+            # Lists that currently include a changed item may lose or reorder it
+            affected = {row[0] for row in db.session.query(RelatedContent.content_id)
+                        .filter(RelatedContent.related_id.in_(changed))}
+            affected.update(present)
+
+            # Lists a changed item now scores high enough to enter
+            if present:
+                vectors = index.matrix[[index.positions[content_id] for content_id in present]]
+                best = np.asarray((index.matrix @ vectors.T).max(axis=1).todense()).ravel()
+                candidates = {int(index.ids[row]): float(best[row]) for row in np.flatnonzero(best > 0)}
+                affected.update(self._entered(candidates))
+
+            affected -= removed
+            RelatedContent.query.filter(
+                RelatedContent.content_id.in_(affected | removed)
+            ).delete(synchronize_session=False)
+
+            rows = np.array(sorted(index.positions[content_id] for content_id in affected), dtype=np.int64)
+            params = []
+            for content_id, related in top_related(index, rows, self.top_n):
+                params.extend(_rows_for(content_id, related))
+            if params:
+                db.session.execute(RelatedContent.__table__.insert(), params)
+            db.session.commit()
+
+            self.incremental_updates += 1
+            self.lists_recomputed += len(affected)
+            logger.debug(f"Refreshed related content for {sorted(changed)}: "
+                         f"{len(affected)} lists recomputed")
+            return len(affected)
+
+    def _entered(self, candidates):
+        """Ids whose stored list is short or whose weakest score is beaten"""
+        entered = set()
+        ids = list(candidates)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            thresholds = {content_id: (count, weakest) for content_id, count, weakest in
+                          db.session.query(RelatedContent.content_id,
+                                           db.func.count(RelatedContent.id),
+                                           db.func.min(RelatedContent.score))
+                          .filter(RelatedContent.content_id.in_(chunk))
+                          .group_by(RelatedContent.content_id)}
+            for content_id in chunk:
+                count, weakest = thresholds.get(content_id, (0, 0.0))
+                if count < self.top_n or candidates[content_id] > weakest:
+                    entered.add(content_id)
+        return entered
+
+    def watch(self, job_queue):
+        """Queue incremental refreshes for HealthContent changes after each commit"""
+        def record(target):
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault(SESSION_KEY, set()).add(target.id)
+
+        def record_update(mapper, connection, target):
+            state = inspect(target)
+            if any(state.attrs[field].history.has_changes() for field in TEXT_FIELDS):
+                record(target)
+
+        def schedule(session):
+            changed = session.info.pop(SESSION_KEY, None)
+            if changed:
+                key = 'related-content:' + ','.join(str(content_id) for content_id in sorted(changed))
+                job_queue.submit(key, self.refresh, changed)
+
+        def discard(session, previous_transaction):
+            session.info.pop(SESSION_KEY, None)
+
+        event.listen(HealthContent, 'after_insert', lambda mapper, connection, target: record(target))
+        event.listen(HealthContent, 'after_delete', lambda mapper, connection, target: record(target))
+        event.listen(HealthContent, 'after_update', record_update)
+        event.listen(db.session, 'after_commit', schedule)
+        event.listen(db.session, 'after_soft_rollback', discard)
+
+    def check_built(self):
+        """Warn once per process if the table has never been filled.
+
+        A bulk rebuild scores the whole catalog and would stall a web worker,
+        so it only runs from the command line or cron; readers fall back to
+        on-the-fly scoring until then.
+        """
+        if self._checked_empty:
+            return
+        self._checked_empty = True
+        if self.is_empty():
+            logger.warning("related_content is empty; serving on-the-fly similarity until "
+                           "'python related_content.py rebuild' has run")
+
+    def stats(self):
+        return {
+            'top_n': self.top_n,
+            'rebuilds': self.rebuilds,
+            'last_rebuild_seconds': self.last_rebuild_seconds,
+            'incremental_updates': self.incremental_updates,
+            'lists_recomputed': self.lists_recomputed,
+        }
+
+
+def benchmark(items=100000, top_n=10, lookups=1000):
+    from similarity import TfidfIndex, synthetic_catalog
+
+    records = synthetic_catalog(items)
+    start = time.perf_counter()
+    index = TfidfIndex.build(records)
+    index_seconds = time.perf_counter() - start
+
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE related_content (id INTEGER PRIMARY KEY, content_id INTEGER, '
+                       'related_id INTEGER, rank INTEGER, score REAL)')
+    connection.execute('CREATE INDEX ix_related_content_content_rank ON related_content (content_id, rank)')
+
+    start = time.perf_counter()
+    transposed = index.matrix.T.tocsr()
+    written = 0
+    for block_start in range(0, len(index), 250):
+        rows = np.arange(block_start, min(block_start + 250, len(index)))
+        params = []
+        for content_id, related in top_related(index, rows, top_n, transposed):
+            params.extend((content_id, related_id, rank, score)
+                          for rank, (related_id, score) in enumerate(related))
+        connection.executemany('INSERT INTO related_content (content_id, related_id, rank, score) '
+                               'VALUES (?, ?, ?, ?)', params)
+        written += len(params)
+    connection.commit()
+    rebuild_seconds = time.perf_counter() - start
+
+    sample = np.random.default_rng(5).integers(1, items + 1, size=lookups)
+    latencies = []
+    for content_id in sample:
+        start = time.perf_counter()
+        connection.execute('SELECT related_id FROM related_content WHERE content_id = ? '
+                           'ORDER BY rank LIMIT 4', (int(content_id),)).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'items': items,
+        'rows': written,
+        'index_seconds': round(index_seconds, 2),
+        'rebuild_seconds': round(rebuild_seconds, 2),
+        'items_per_second': round(items / rebuild_seconds),
+        'lookup_p50_ms': round(latencies[len(latencies) // 2], 4),
+        'lookup_p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 4),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild or benchmark precomputed related content')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild')
+    bench_parser = subparsers.add_parser('benchmark')
+    bench_parser.add_argument('--items', type=int, default=100000)
+    bench_parser.add_argument('--top-n', type=int, default=RELATED_CONTENT_TOP_N)
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        print(json.dumps(benchmark(args.items, args.top_n), indent=2))
+    else:
+        from ai_services import related_content_store
+        with app.app_context():
+            db.create_all()
+            print("🔗 Rebuilding related content...")
+            rows = related_content_store.rebuild()
+            print(f"✅ Wrote {rows} related content rows")
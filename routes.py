@@ -599,22 +599,27 @@
 
 import json
 import logging
-from datetime import datetime, timedelta
 from functools import wraps
 
 from flask import render_template, request, redirect, url_for, flash, session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from app import app, db, socketio
+from app import app, db, ADMIN_USERNAMES
 from models import User, HealthContent, UserActivity, UserRating, UserBookmark, Consultation, PredictiveInsight
 from ai_services import (
-    extract_medical_entities, 
-    analyze_symptoms_with_gemini, 
+    analyze_consultation,
     generate_health_recommendations,
     get_content_based_recommendations,
-    generate_predictive_insights
+    invalidate_user_recommendations,
+    get_related_content,
+    generate_predictive_insights,
+    get_latest_insights,
+    content_search,
+    cache_stats
 )
-from websocket_handlers import track_user_activity
+from websocket_handlers import track_user_activity, activity_coalescer
+from catalog import catalog
+from activity_rollups import get_activity_stats, get_category_stats, get_consultation_trends, record_consultation
 
 logger = logging.getLogger(__name__)
 
@@ -627,6 +632,16 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    """Restrict a JSON endpoint to users listed in ADMIN_USERNAMES"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = get_current_user()
+        if user is None or user.username not in ADMIN_USERNAMES:
+            return jsonify({'error': 'Forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
 def get_current_user():
     """Helper function to get current user"""
     user_id = session.get('user_id')
@@ -640,9 +655,7 @@ def index():
     user = get_current_user()
     
     # Get featured content
-    featured_content = HealthContent.query.order_by(
-        HealthContent.popularity_score.desc()
-    ).limit(6).all()
+    featured_content = catalog.snapshot().top(6)
     
     recommendations = []
     if user:
@@ -797,6 +810,7 @@ def profile():
         user.health_goals = request.form.get('health_goals', '')
         
         db.session.commit()
+        invalidate_user_recommendations(user.id)
         flash('Profile updated successfully!', 'success')
         
         # Track profile update
@@ -815,10 +829,6 @@ def consultation():
     if request.method == 'POST':
         symptoms = request.form['symptoms']
         
-        # Extract medical entities
-        entities = extract_medical_entities(symptoms)
-        
-        # Analyze symptoms with Gemini AI
         user_profile = {
             'age': user.age,
             'gender': user.gender,
@@ -827,7 +837,10 @@ def consultation():
             'allergies': user.allergies
         }
         
-        analysis = analyze_symptoms_with_gemini(symptoms, user_profile)
+        # Extract medical entities and analyze symptoms with Gemini AI concurrently
+        entities, analysis, timed_out = analyze_consultation(symptoms, user_profile)
+        if timed_out:
+            flash('Part of the analysis took too long and was skipped. You can retry the consultation later.', 'warning')
         
         # Save consultation
         consultation = Consultation(
@@ -840,6 +853,7 @@ def consultation():
         )
         
         db.session.add(consultation)
+        record_consultation(user.id)
         db.session.commit()
         
         # Track consultation activity
@@ -888,7 +902,8 @@ def view_consultation(consultation_id):
 @app.route('/content/<int:content_id>')
 def content_detail(content_id):
     """View specific health content"""
-    content = HealthContent.query.get_or_404(content_id)
+    snapshot = catalog.snapshot()
+    content = snapshot.get(content_id) or HealthContent.query.get_or_404(content_id)
     user = get_current_user()
     
     user_rating = None
@@ -902,10 +917,7 @@ def content_detail(content_id):
         track_user_activity(user.id, 'view', content_id=content_id)
     
     # Get related content
-    related_content = HealthContent.query.filter(
-        HealthContent.category == content.category,
-        HealthContent.id != content_id
-    ).limit(4).all()
+    related_content = get_related_content(content_id, limit=4)
     
     return render_template('content_detail.html',
                          content=content,
@@ -923,28 +935,11 @@ def search():
     
     user = get_current_user()
     
-    # Build search query
-    search_query = HealthContent.query
-    
-    if query:
-        search_query = search_query.filter(
-            db.or_(
-                HealthContent.title.ilike(f'%{query}%'),
-                HealthContent.description.ilike(f'%{query}%')
-            )
-        )
-    
-    if category:
-        search_query = search_query.filter(HealthContent.category == category)
-    
-    if content_type:
-        search_query = search_query.filter(HealthContent.content_type == content_type)
-    
-    results = search_query.order_by(HealthContent.popularity_score.desc()).all()
+    # Ranked full-text matches, or the most popular content when only filtering
+    results = content_search.search(query, category=category, content_type=content_type)
     
     # Get all categories for filter
-    categories = db.session.query(HealthContent.category.distinct()).all()
-    content_types = db.session.query(HealthContent.content_type.distinct()).all()
+    snapshot = catalog.snapshot()
     
     if user and query:
         # Track search activity
@@ -955,8 +950,8 @@ def search():
                          query=query,
                          category=category,
                          content_type=content_type,
-                         categories=[c[0] for c in categories],
-                         content_types=[c[0] for c in content_types])
+                         categories=snapshot.categories,
+                         content_types=snapshot.content_types)
 
 
 
@@ -967,30 +962,13 @@ def analytics():
     """Advanced analytics dashboard"""
     user = get_current_user()
     
-    # Generate fresh predictive insights
-    insights = generate_predictive_insights(user.id)
-    
-    # Get activity statistics
-    activity_stats = db.session.query(
-        UserActivity.activity_type,
-        db.func.count(UserActivity.id).label('count')
-    ).filter_by(user_id=user.id).group_by(UserActivity.activity_type).all()
-    
-    # Get consultation trends
-    consultation_trends = db.session.query(
-        db.func.date(Consultation.created_at).label('date'),
-        db.func.count(Consultation.id).label('count')
-    ).filter_by(user_id=user.id)\
-     .filter(Consultation.created_at > datetime.utcnow() - timedelta(days=30))\
-     .group_by(db.func.date(Consultation.created_at)).all()
-    
-    # Get category preferences
-    category_stats = db.session.query(
-        HealthContent.category,
-        db.func.count(UserActivity.id).label('views')
-    ).join(UserActivity, UserActivity.content_id == HealthContent.id)\
-     .filter(UserActivity.user_id == user.id)\
-     .group_by(HealthContent.category).all()
+    # Serve the last completed insights; stale ones are refreshed in the background
+    insights = get_latest_insights(user.id)
+    
+    # Statistics come from the daily rollups rather than the raw activity history
+    activity_stats = get_activity_stats(user.id)
+    consultation_trends = get_consultation_trends(user.id, days=30)
+    category_stats = get_category_stats(user.id)
     
     # Track analytics view
     track_user_activity(user.id, 'analytics_view')
@@ -1058,7 +1036,9 @@ def rate_content():
     # Check if user already rated this content
     existing_rating = UserRating.query.filter_by(user_id=user.id, content_id=content_id).first()
     
+    metadata = {'rating': rating}
     if existing_rating:
+        metadata['previous_rating'] = existing_rating.rating
         existing_rating.rating = rating
         existing_rating.review = review
     else:
@@ -1071,9 +1051,10 @@ def rate_content():
         db.session.add(new_rating)
     
     db.session.commit()
+    invalidate_user_recommendations(user.id)
     
     # Track rating activity
-    track_user_activity(user.id, 'rating', content_id=content_id, metadata={'rating': rating})
+    track_user_activity(user.id, 'rating', content_id=content_id, metadata=metadata)
     
     return jsonify({'success': True, 'message': 'Rating saved successfully'})
 
@@ -1099,6 +1080,7 @@ def bookmark_content():
         action = 'added'
     
     db.session.commit()
+    invalidate_user_recommendations(user.id)
     
     # Track bookmark activity
     track_user_activity(user.id, 'bookmark', content_id=content_id, metadata={'action': action})
@@ -1136,11 +1118,17 @@ def refresh_recommendations():
         'content_recommendations': content_recs
     })
 
+@app.route('/api/cache/stats')
+@login_required
+@admin_required
+def get_cache_stats():
+    """Hit ratios and sizes of the caching layers"""
+    return jsonify({**cache_stats(), 'socket_activity': activity_coalescer.stats()})
+
 @app.route('/api/content/categories')
 def get_categories():
     """Get all content categories"""
-    categories = db.session.query(HealthContent.category.distinct()).all()
-    return jsonify([c[0] for c in categories])
+    return jsonify(catalog.snapshot().categories)
 
 # Error handlers
 @app.errorhandler(404)
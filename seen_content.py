@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Per-user "seen content" bitmaps.
+
+Each user's viewed content ids are kept as a packed bit array (bit n set
+means content id n was viewed), stored zlib-compressed in UserSeenContent.
+Bits are set as views are tracked, so excluding seen content is one primary
+key read followed by constant-time membership tests, however long the view
+history grows.
+
+Run this script to rebuild bitmaps from UserActivity:
+    python seen_content.py [--user-id ID]
+"""
+
+import argparse
+import logging
+import zlib
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import UserActivity, UserSeenContent
+
+logger = logging.getLogger(__name__)
+
+
+class SeenSet:
+    """Set-like packed bit array of content ids"""
+
+    __slots__ = ('bits',)
+
+    def __init__(self, content_ids=()):
+        self.bits = bytearray()
+        for content_id in content_ids:
+            self.add(content_id)
+
+    @classmethod
+    def from_bytes(cls, data):
+        seen = cls()
+        if data:
+            seen.bits = bytearray(zlib.decompress(data))
+        return seen
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.bits.rstrip(b'\x00')))
+
+    def add(self, content_id):
+        byte, bit = divmod(content_id, 8)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << bit
+
+    def __contains__(self, content_id):
+        byte, bit = divmod(content_id, 8)
+        return 0 <= byte < len(self.bits) and bool(self.bits[byte] >> bit & 1)
+
+    def __iter__(self):
+        bits = np.unpackbits(np.frombuffer(bytes(self.bits), dtype=np.uint8), bitorder='little')
+        return (int(content_id) for content_id in np.flatnonzero(bits))
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bits if byte)
+
+    def __bool__(self):
+        return any(self.bits)
+
+
+def _activity_views(user_id):
+    return SeenSet(row[0] for row in db.session.query(UserActivity.content_id)
+                   .filter_by(user_id=user_id, activity_type='view')
+                   .filter(UserActivity.content_id.isnot(None))
+                   .distinct())
+
+
+def mark_seen(user_id, *content_ids):
+    """Set the contents' bits in the user's bitmap (caller commits)"""
+    row = UserSeenContent.query.filter_by(user_id=user_id).with_for_update().first()
+    if row is not None:
+        seen = SeenSet.from_bytes(row.bitmap)
+        new_ids = [content_id for content_id in content_ids if content_id not in seen]
+        if new_ids:
+            for content_id in new_ids:
+                seen.add(content_id)
+            row.bitmap = seen.to_bytes()
+            row.updated_at = datetime.utcnow()
+        return
+
+    # First views tracked for this user: seed from history, which includes these views
+    seen = _activity_views(user_id)
+    for content_id in content_ids:
+        seen.add(content_id)
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserSeenContent(user_id=user_id, bitmap=seen.to_bytes()))
+    except IntegrityError:
+        # Another request created the row first
+        mark_seen(user_id, *content_ids)
+
+
+def get_seen(user_id):
+    """The user's SeenSet; users without a bitmap yet are read from activity history"""
+    row = db.session.query(UserSeenContent.bitmap).filter_by(user_id=user_id).first()
+    if row is not None:
+        return SeenSet.from_bytes(row[0])
+    return _activity_views(user_id)
+
+
+def rebuild(user_id=None):
+    """Recompute bitmaps from UserActivity with one ordered scan"""
+    delete_query = UserSeenContent.query
+    if user_id is not None:
+        delete_query = delete_query.filter_by(user_id=user_id)
+    delete_query.delete(synchronize_session=False)
+
+    query = db.session.query(UserActivity.user_id, UserActivity.content_id)\
+        .filter(UserActivity.activity_type == 'view', UserActivity.content_id.isnot(None))
+    if user_id is not None:
+        query = query.filter(UserActivity.user_id == user_id)
+
+    rows = []
+    written = 0
+    current_user, seen = None, None
+    for row_user_id, content_id in query.order_by(UserActivity.user_id).yield_per(10000):
+        if row_user_id != current_user:
+            if seen is not None:
+                rows.append({'user_id': current_user, 'bitmap': seen.to_bytes(), 'updated_at': datetime.utcnow()})
+            current_user, seen = row_user_id, SeenSet()
+        seen.add(content_id)
+        if len(rows) >= 1000:
+            db.session.execute(UserSeenContent.__table__.insert(), rows)
+            written += len(rows)
+            rows = []
+    if seen is not None:
+        rows.append({'user_id': current_user, 'bitmap': seen.to_bytes(), 'updated_at': datetime.utcnow()})
+    if rows:
+        db.session.execute(UserSeenContent.__table__.insert(), rows)
+        written += len(rows)
+    db.session.commit()
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild per-user seen content bitmaps')
+    parser.add_argument('--user-id', type=int, default=None)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        print("👁️ Rebuilding seen content bitmaps...")
+        count = rebuild(args.user_id)
+        print(f"✅ Wrote {count} bitmaps")
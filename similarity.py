@@ -0,0 +1,324 @@
+"""
+TF-IDF similarity engine over HealthContent text.
+
+Each content item is represented by an L2-normalized TF-IDF row built from
+its title, description, tags and target conditions. Cosine similarity for an
+item or a user's interest vector is then a single sparse matrix-vector
+product over the whole catalog.
+
+Run as a script to benchmark against the SQL "same category" path:
+    python similarity.py --items 100000 --queries 200
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9]+")
+
+STOPWORDS = {
+    'the', 'and', 'for', 'with', 'your', 'you', 'this', 'that', 'from', 'are', 'can', 'how',
+    'into', 'our', 'its', 'all', 'has', 'have', 'will', 'more', 'most', 'also', 'about',
+    'learn', 'includes', 'guide', 'complete', 'designed', 'suitable', 'levels', 'level',
+}
+
+# Titles are short but descriptive, so their terms count extra
+TITLE_WEIGHT = 2
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+def _json_terms(value):
+    if not value:
+        return []
+    try:
+        items = json.loads(value)
+    except (TypeError, ValueError):
+        return tokenize(value)
+    if not isinstance(items, list):
+        return []
+    return [token for item in items for token in tokenize(str(item))]
+
+
+def content_terms(record):
+    """Term counts for a HealthContent row or catalog record"""
+    terms = Counter()
+    for token in tokenize(record.title):
+        terms[token] += TITLE_WEIGHT
+    terms.update(tokenize(record.description))
+    terms.update(_json_terms(record.tags))
+    terms.update(_json_terms(record.target_conditions))
+    return terms
+
+
+class TfidfIndex:
+    """Row-normalized TF-IDF matrix with top-k cosine queries"""
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.positions = {}
+
+    @classmethod
+    def build(cls, records):
+        index = cls()
+        term_counts = [content_terms(record) for record in records]
+
+        document_frequency = Counter()
+        for terms in term_counts:
+            document_frequency.update(terms.keys())
+        index.vocabulary = {term: column for column, term in enumerate(sorted(document_frequency))}
+
+        documents = len(records)
+        idf = np.zeros(len(index.vocabulary), dtype=np.float32)
+        for term, column in index.vocabulary.items():
+            idf[column] = math.log((1 + documents) / (1 + document_frequency[term])) + 1.0
+        index.idf = idf
+
+        index.matrix = index._vectorize(term_counts)
+        index.ids = np.array([record.id for record in records], dtype=np.int64)
+        index.positions = {int(content_id): row for row, content_id in enumerate(index.ids)}
+        return index
+
+    def _vectorize(self, term_counts):
+        indptr = [0]
+        indices = []
+        data = []
+        for terms in term_counts:
+            for term, count in terms.items():
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    indices.append(column)
+                    data.append((1.0 + math.log(count)) * self.idf[column])
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(term_counts), len(self.vocabulary))
+        )
+        return _normalize_rows(matrix)
+
+    def add(self, record):
+        """Append one item without recomputing IDF for existing rows.
+
+        Terms not seen at build time get the IDF of a term that appears in a
+        single document; a full rebuild restores exact weights.
+        """
+        terms = content_terms(record)
+        new_terms = [term for term in terms if term not in self.vocabulary]
+        if new_terms:
+            documents = self.matrix.shape[0] + 1
+            for term in new_terms:
+                self.vocabulary[term] = len(self.vocabulary)
+            rare_idf = math.log((1 + documents) / 2) + 1.0
+            self.idf = np.concatenate([self.idf, np.full(len(new_terms), rare_idf, dtype=np.float32)])
+            self.matrix = sparse.csr_matrix(
+                (self.matrix.data, self.matrix.indices, self.matrix.indptr),
+                shape=(self.matrix.shape[0], len(self.vocabulary))
+            )
+
+        row = self._vectorize([terms])
+        self.matrix = sparse.vstack([self.matrix, row], format='csr')
+        self.positions[int(record.id)] = len(self.ids)
+        self.ids = np.append(self.ids, np.int64(record.id))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vector_for(self, content_id):
+        row = self.positions.get(content_id)
+        if row is None:
+            return None
+        return self.matrix[row]
+
+    def interest_vector(self, weighted_ids):
+        """Normalized sum of item vectors, weighted by interaction strength"""
+        rows = []
+        weights = []
+        for content_id, weight in weighted_ids.items():
+            row = self.positions.get(content_id)
+            if row is not None:
+                rows.append(row)
+                weights.append(weight)
+        if not rows:
+            return None
+        vector = sparse.csr_matrix(np.asarray(weights, dtype=np.float32)) @ self.matrix[rows]
+        return _normalize_rows(vector)
+
+    def scores(self, vector):
+        """Cosine similarity of every item to a normalized query vector"""
+        return self.matrix @ np.asarray(vector.todense()).ravel()
+
+    def top_k(self, vector, k, exclude=None):
+        """Return [(content_id, score)] for the k most similar items"""
+        if vector is None or not len(self.ids):
+            return []
+        scores = self.scores(vector)
+        if exclude:
+            for content_id in exclude:
+                row = self.positions.get(content_id)
+                if row is not None:
+                    scores[row] = -1.0
+
+        k = min(k, len(scores))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ordered = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(self.ids[row]), float(scores[row])) for row in ordered if scores[row] > 0]
+
+    def similar_to(self, content_id, k=4):
+        return self.top_k(self.vector_for(content_id), k, exclude={content_id})
+
+
+class SimilarityEngine:
+    """Keeps a TfidfIndex in step with the catalog snapshot version.
+
+    When a new snapshot only adds items and leaves existing text untouched,
+    the new items are appended incrementally; any other change rebuilds.
+    """
+
+    def __init__(self, snapshot_provider, max_incremental=100):
+        self._snapshot_provider = snapshot_provider
+        self.max_incremental = max_incremental
+        self._index = None
+        self._version = None
+        self._texts = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.incremental_adds = 0
+
+    def index(self):
+        snapshot = self._snapshot_provider()
+        if self._version != snapshot.version:
+            with self._lock:
+                if self._version != snapshot.version:
+                    self._refresh(snapshot)
+        return self._index
+
+    def _refresh(self, snapshot):
+        texts = {content_id: _text_fields(record) for content_id, record in snapshot.by_id.items()}
+        added = [content_id for content_id in texts if content_id not in self._texts]
+        unchanged = all(texts.get(content_id) == text for content_id, text in self._texts.items())
+
+        if self._index is not None and unchanged and len(added) <= self.max_incremental:
+            for content_id in added:
+                self._index.add(snapshot.by_id[content_id])
+            self.incremental_adds += len(added)
+        else:
+            self._index = TfidfIndex.build(list(snapshot.by_id.values()))
+            self.rebuilds += 1
+        self._texts = texts
+        self._version = snapshot.version
+
+    def stats(self):
+        index = self._index
+        return {
+            'catalog_version': self._version,
+            'items': len(index) if index is not None else 0,
+            'vocabulary': len(index.vocabulary) if index is not None else 0,
+            'rebuilds': self.rebuilds,
+            'incremental_adds': self.incremental_adds,
+        }
+
+
+def _text_fields(record):
+    return (record.title, record.description, record.tags, record.target_conditions)
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms).dot(matrix), dtype=np.float32)
+
+
+# Benchmark
+
+class _SyntheticRecord:
+    __slots__ = ('id', 'title', 'description', 'tags', 'target_conditions', 'category')
+
+    def __init__(self, content_id, title, description, tags, target_conditions, category):
+        self.id = content_id
+        self.title = title
+        self.description = description
+        self.tags = tags
+        self.target_conditions = target_conditions
+        self.category = category
+
+
+def synthetic_catalog(items, seed=7):
+    rng = random.Random(seed)
+    categories = ['cardiology', 'nutrition', 'fitness', 'mental_health', 'endocrinology',
+                  'preventive_care', 'lifestyle', 'sleep', 'dermatology', 'pediatrics']
+    words = [f"term{index}" for index in range(20000)]
+    records = []
+    for content_id in range(1, items + 1):
+        category = rng.choice(categories)
+        records.append(_SyntheticRecord(
+            content_id,
+            ' '.join(rng.choices(words, k=6)),
+            ' '.join(rng.choices(words, k=40)),
+            json.dumps([category] + rng.choices(words, k=3)),
+            json.dumps(rng.choices(words, k=2)),
+            category
+        ))
+    return records
+
+
+def benchmark(items=100000, queries=200, k=4):
+    records = synthetic_catalog(items)
+
+    start = time.perf_counter()
+    index = TfidfIndex.build(records)
+    build_seconds = time.perf_counter() - start
+
+    query_ids = random.Random(11).sample(range(1, items + 1), min(queries, items))
+    latencies = []
+    for content_id in query_ids:
+        start = time.perf_counter()
+        index.similar_to(content_id, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE health_content (id INTEGER PRIMARY KEY, category TEXT)')
+    connection.executemany('INSERT INTO health_content VALUES (?, ?)',
+                           [(record.id, record.category) for record in records])
+    sql_latencies = []
+    for content_id in query_ids:
+        start = time.perf_counter()
+        category = connection.execute('SELECT category FROM health_content WHERE id = ?',
+                                      (content_id,)).fetchone()[0]
+        connection.execute('SELECT id FROM health_content WHERE category = ? AND id != ? LIMIT ?',
+                           (category, content_id, k)).fetchall()
+        sql_latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    sql_latencies.sort()
+    return {
+        'items': items,
+        'vocabulary': len(index.vocabulary),
+        'build_seconds': round(build_seconds, 2),
+        'tfidf_p50_ms': round(latencies[len(latencies) // 2], 3),
+        'tfidf_p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        'sql_p50_ms': round(sql_latencies[len(sql_latencies) // 2], 3),
+        'sql_p99_ms': round(sql_latencies[int(len(sql_latencies) * 0.99) - 1], 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark TF-IDF related-content queries')
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.items, args.queries), indent=2))
@@ -0,0 +1,210 @@
+"""
+Coalescing and rate limiting for socket activity events.
+
+Each connection collects track_activity events for window seconds before
+they are tracked. Repeats of an event already waiting in the window (same
+type, content and search query) are merged into it: durations are summed
+and the merge count is recorded in the metadata. New events spend a token
+from a per-user bucket refilled at rate per second up to burst, and are
+dropped when it is empty. After a flush that contains a significant event
+the connection gets a quick_recommendations push, at most once per
+push_interval; a push that falls inside the interval is deferred to its end
+rather than lost.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SIGNIFICANT_ACTIVITIES = ('view', 'rating', 'bookmark')
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Connection:
+    __slots__ = ('user_id', 'pending', 'opened', 'last_push', 'push_due')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.pending = {}
+        self.opened = None
+        self.last_push = None
+        self.push_due = False
+
+
+class ActivityCoalescer:
+    """Per-connection event windows flushed by one background thread"""
+
+    def __init__(self, app, track, push, window=1.0, rate=5.0, burst=20, push_interval=5.0):
+        self.app = app
+        self.track = track
+        self.push = push
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.push_interval = push_interval
+        self._connections = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._ticker = None
+        self.received = 0
+        self.merged = 0
+        self.dropped = 0
+        self.tracked = 0
+        self.push_requests = 0
+        self.pushes = 0
+        self.failures = 0
+
+    def submit(self, sid, user_id, activity_type, content_id=None, search_query=None, duration=None,
+               metadata=None):
+        """Queue one event; returns 'queued', 'merged' or 'dropped'"""
+        now = time.monotonic()
+        key = (activity_type, content_id, search_query)
+        with self._lock:
+            self.received += 1
+            connection = self._connections.get(sid)
+            if connection is None:
+                connection = self._connections[sid] = _Connection(user_id)
+
+            event = connection.pending.get(key)
+            if event is not None:
+                event['count'] += 1
+                if duration:
+                    event['duration'] = (event['duration'] or 0) + duration
+                if metadata is not None:
+                    event['metadata'] = metadata
+                self.merged += 1
+                return 'merged'
+
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst, now)
+            if not bucket.take(now):
+                self.dropped += 1
+                return 'dropped'
+
+            connection.pending[key] = {'count': 1, 'duration': duration, 'metadata': metadata}
+            if connection.opened is None:
+                connection.opened = now
+            self._ensure_started()
+        return 'queued'
+
+    def _ensure_started(self):
+        if self._ticker is not None:
+            return
+        self._ticker = threading.Thread(target=self._tick, name='socket-activity', daemon=True)
+        self._ticker.start()
+
+    def _tick(self):
+        while True:
+            time.sleep(min(self.window, self.push_interval) / 2)
+            try:
+                self.flush_due()
+            except Exception as e:
+                logger.error(f"Error flushing socket activity: {e}")
+
+    def flush_due(self, now=None):
+        """Track windows that have closed and send pushes whose interval has passed"""
+        now = now if now is not None else time.monotonic()
+        work = []
+        with self._lock:
+            for sid, connection in self._connections.items():
+                events = {}
+                if connection.opened is not None and now - connection.opened >= self.window:
+                    events, connection.pending, connection.opened = connection.pending, {}, None
+                if events or connection.push_due:
+                    work.append((sid, connection, events))
+            for user_id in [user_id for user_id, bucket in self._buckets.items() if bucket.full(now)]:
+                # A full bucket is the same as a new one
+                del self._buckets[user_id]
+
+        if not work:
+            return
+        with self.app.app_context():
+            for sid, connection, events in work:
+                self._track(connection.user_id, events)
+                if any(activity_type in SIGNIFICANT_ACTIVITIES for activity_type, _, _ in events):
+                    connection.push_due = True
+                    with self._lock:
+                        self.push_requests += 1
+                if connection.push_due:
+                    self._maybe_push(sid, connection, now)
+
+    def _track(self, user_id, events):
+        for (activity_type, content_id, search_query), event in events.items():
+            metadata = event['metadata']
+            if event['count'] > 1 and (metadata is None or isinstance(metadata, dict)):
+                metadata = {**(metadata or {}), 'coalesced': event['count']}
+            try:
+                self.track(user_id, activity_type, content_id, search_query, event['duration'], metadata)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                logger.error(f"Error tracking socket activity for user {user_id}: {e}")
+                continue
+            with self._lock:
+                self.tracked += 1
+
+    def _maybe_push(self, sid, connection, now):
+        if connection.last_push is not None and now - connection.last_push < self.push_interval:
+            return
+        connection.push_due = False
+        connection.last_push = now
+        try:
+            self.push(connection.user_id, sid)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.error(f"Error pushing quick recommendations to user {connection.user_id}: {e}")
+            return
+        with self._lock:
+            self.pushes += 1
+
+    def disconnect(self, sid):
+        """Track whatever the connection still has pending and forget it"""
+        with self._lock:
+            connection = self._connections.pop(sid, None)
+        if connection is not None and connection.pending:
+            with self.app.app_context():
+                self._track(connection.user_id, connection.pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': len(self._connections),
+                'pending': sum(len(connection.pending) for connection in self._connections.values()),
+                'received': self.received,
+                'merged': self.merged,
+                'dropped': self.dropped,
+                'tracked': self.tracked,
+                'push_requests': self.push_requests,
+                'pushes': self.pushes,
+                'failures': self.failures,
+            }
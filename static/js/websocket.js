@@ -93,6 +93,18 @@ class HealthAIWebSocket {
             this.handleQuickRecommendations(data);
         });
         
+        // Predictive insights generated in the background
+        this.socket.on('insights_update', (data) => {
+            this.handleInsightsUpdate(data);
+        });
+        
+        // Streaming consultation events
+        ['consultation_stream_started', 'consultation_chunk', 'consultation_complete', 'consultation_error'].forEach(eventName => {
+            this.socket.on(eventName, (data) => {
+                document.dispatchEvent(new CustomEvent(`healthai:${eventName.replace(/_/g, '-')}`, { detail: data }));
+            });
+        });
+        
         // Search events
         this.socket.on('search_suggestions', (data) => {
             this.handleSearchSuggestions(data);
@@ -238,6 +250,15 @@ class HealthAIWebSocket {
         });
     }
     
+    startConsultationStream(symptoms) {
+        if (!this.isConnected) return false;
+        
+        this.socket.emit('start_consultation_stream', {
+            symptoms: symptoms
+        });
+        return true;
+    }
+    
     performHealthCheck() {
         if (!this.isConnected) return;
         
@@ -269,6 +290,17 @@ class HealthAIWebSocket {
         this.updateQuickRecommendationsUI(data);
     }
     
+    handleInsightsUpdate(data) {
+        console.log('Insights update:', data);
+        
+        // Let pages that display insights refresh themselves
+        document.dispatchEvent(new CustomEvent('healthai:insights-update', { detail: data }));
+        
+        if (window.HealthAI) {
+            window.HealthAI.showNotification('New health insights are available', 'info');
+        }
+    }
+    
     handleSearchSuggestions(data) {
         console.log('Search suggestions:', data);
         
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+In-memory prefix index for search-as-you-type suggestions.
+
+Every title is indexed under each of its word suffixes ("heart health
+guide", "health guide", "guide"), so a prefix matches the start of any word
+and the words after it. Keys are lower-cased, truncated to KEY_BYTES and
+kept in one sorted fixed-width numpy array, and a prefix lookup is two
+binary searches. For prefixes matching more than DENSE_RANGE keys (the
+upper trie nodes) the best entries by popularity are precomputed at build
+time; smaller ranges are ranked on the fly. Category names are matched
+the same way.
+
+The index is built from a catalog snapshot and tagged with its version.
+When the catalog changes, a background job builds the next index and the
+old one keeps serving until it is swapped in, so suggestions never wait
+on the database.
+
+    python suggestions.py benchmark --items 100000 --keystrokes 20000
+"""
+
+import argparse
+import logging
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 24
+DENSE_RANGE = 64
+TITLE_LIMIT = 5
+CATEGORY_LIMIT = 3
+
+# Extra precomputed entries so duplicates (one title, several matching words) can be skipped
+_SLACK = 3
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lower-cased words joined by single spaces; underscores count as spaces"""
+    return ' '.join(_WORD.findall((text or '').lower().replace('_', ' ')))
+
+
+def _word_suffixes(normalized):
+    words = normalized.split(' ')
+    return [' '.join(words[position:]) for position in range(len(words))] if normalized else []
+
+
+def _key(text):
+    return text.encode('utf-8')[:KEY_BYTES]
+
+
+class SuggestionIndex:
+    """Immutable prefix index over one catalog snapshot"""
+
+    def __init__(self, records, categories, version=None):
+        self.version = version
+        self.ids = np.array([record.id for record in records], dtype=np.int64)
+        self.titles = [record.title for record in records]
+        self.categories = [record.category for record in records]
+        self.normalized = [normalize(record.title) for record in records]
+        popularity = np.array([record.popularity_score or 0.0 for record in records], dtype=np.float64)
+
+        entries, keys = [], []
+        for position, text in enumerate(self.normalized):
+            for suffix in _word_suffixes(text):
+                entries.append(position)
+                keys.append(_key(suffix))
+        keys = np.array(keys, dtype=f'S{KEY_BYTES}')
+        entries = np.array(entries, dtype=np.int32)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.entries = entries[order]
+        self.scores = popularity[self.entries] if len(self.entries) else popularity[:0]
+        self.top = {}
+        self._precompute(0, len(self.keys), 0)
+
+        category_sizes = {}
+        for category in self.categories:
+            category_sizes[category] = category_sizes.get(category, 0) + 1
+        self.category_list = [(category, _word_suffixes(normalize(category)))
+                              for category in sorted(categories, key=lambda name: (-category_sizes.get(name, 0), name))]
+
+    def _precompute(self, lo, hi, depth):
+        """Store top entries for every prefix whose key range exceeds DENSE_RANGE"""
+        if hi - lo <= DENSE_RANGE or depth >= KEY_BYTES:
+            return
+        if depth:
+            self.top[self.keys[lo][:depth]] = self._best(lo, hi, TITLE_LIMIT * _SLACK)
+        column = np.frombuffer(self.keys[lo:hi].tobytes(), dtype=np.uint8).reshape(hi - lo, KEY_BYTES)[:, depth]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(column)) + 1, [hi - lo]))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if column[start]:
+                self._precompute(lo + int(start), lo + int(end), depth + 1)
+
+    def _best(self, lo, hi, count):
+        scores = self.scores[lo:hi]
+        if hi - lo > count:
+            candidates = np.argpartition(-scores, count)[:count]
+        else:
+            candidates = np.arange(hi - lo)
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return self.entries[lo + ranked]
+
+    def titles_for(self, query, limit=TITLE_LIMIT):
+        """Positions of the most popular titles with a word starting with query"""
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        prefix = _key(normalized)
+        candidates = self.top.get(prefix)
+        if candidates is None:
+            lo = int(np.searchsorted(self.keys, prefix, side='left'))
+            hi = int(np.searchsorted(self.keys, prefix + b'\xff', side='left'))
+            candidates = self._best(lo, hi, min(hi - lo, limit * _SLACK)) if hi > lo else []
+
+        truncated = len(normalized.encode('utf-8')) > KEY_BYTES
+        results, seen = [], set()
+        for position in candidates:
+            position = int(position)
+            if position in seen:
+                continue
+            if truncated and ' ' + normalized not in ' ' + self.normalized[position]:
+                continue
+            seen.add(position)
+            results.append(position)
+            if len(results) >= limit:
+                break
+        return results
+
+    def categories_for(self, query, limit=CATEGORY_LIMIT):
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        matches = [category for category, suffixes in self.category_list
+                   if any(suffix.startswith(normalized) for suffix in suffixes)]
+        return matches[:limit]
+
+    def suggest(self, query):
+        """Suggestion dicts in the shape the search box expects"""
+        suggestions = [{'text': self.titles[position], 'type': 'content', 'category': self.categories[position]}
+                       for position in self.titles_for(query)]
+        suggestions.extend({'text': category.replace('_', ' ').title(), 'type': 'category', 'category': category}
+                           for category in self.categories_for(query))
+        return suggestions
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class CompletionIndex:
+    """Serves suggestions from the SuggestionIndex of the latest catalog version"""
+
+    def __init__(self, catalog, job_queue):
+        self.catalog = catalog
+        self.job_queue = job_queue
+        self._index = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.builds = 0
+        self.last_build_seconds = None
+
+    def get(self):
+        """Current index; only the very first call waits for a build"""
+        index = self._index
+        if index is None:
+            return self.build()
+        if not self.catalog.is_current(index.version):
+            self.job_queue.submit('suggestions:build', self.build)
+        return index
+
+    def build(self):
+        with self._lock:
+            snapshot = self.catalog.snapshot()
+            if self._index is None or self._index.version != snapshot.version:
+                self._build(snapshot)
+        return self._index
+
+    def _build(self, snapshot):
+        start = time.monotonic()
+        records = snapshot.records(snapshot.ranked_ids)
+        self._index = SuggestionIndex(records, snapshot.categories, snapshot.version)
+        self.builds += 1
+        self.last_build_seconds = round(time.monotonic() - start, 3)
+        logger.info(f"Built suggestion index v{snapshot.version} with {len(self._index)} keys "
+                    f"in {self.last_build_seconds}s")
+
+    def suggest(self, query):
+        self.queries += 1
+        return self.get().suggest(query)
+
+    def stats(self):
+        index = self._index
+        return {
+            'version': index.version if index is not None else None,
+            'keys': len(index) if index is not None else 0,
+            'precomputed_prefixes': len(index.top) if index is not None else 0,
+            'queries': self.queries,
+            'builds': self.builds,
+            'last_build_seconds': self.last_build_seconds,
+        }
+
+
+_BenchmarkRecord = namedtuple('_BenchmarkRecord', 'id title category popularity_score')
+
+
+def benchmark(items=100000, keystrokes=20000):
+    from similarity import synthetic_catalog
+
+    rng = random.Random(3)
+    records = [_BenchmarkRecord(record.id, record.title, record.category, rng.uniform(0, 10))
+               for record in synthetic_catalog(items)]
+    categories = sorted({record.category for record in records})
+
+    start = time.perf_counter()
+    index = SuggestionIndex(records, categories, version=1)
+    build_seconds = time.perf_counter() - start
+
+    # Replay typing: every prefix of a word from a random title, as a user would send them
+    typed = []
+    while len(typed) < keystrokes:
+        word = rng.choice(rng.choice(records).title.split())
+        typed.extend(word[:length] for length in range(2, len(word) + 1))
+    typed = typed[:keystrokes]
+
+    latencies = []
+    start = time.perf_counter()
+    for query in typed:
+        query_start = time.perf_counter()
+        index.suggest(query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'items': items,
+        'keys': len(index),
+        'precomputed_prefixes': len(index.top),
+        'build_seconds': round(build_seconds, 2),
+        'keystrokes_per_second': round(len(typed) / elapsed),
+        'p50_ms': round(latencies[len(latencies) // 2], 4),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)], 4),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the search suggestion index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bench_parser = subparsers.add_parser('benchmark')
+    bench_parser.add_argument('--items', type=int, default=100000)
+    bench_parser.add_argument('--keystrokes', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"🧪 Benchmarking suggestions over {args.items} synthetic items...")
+    for key, value in benchmark(args.items, args.keystrokes).items():
+        print(f"  {key}: {value}")
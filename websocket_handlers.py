@@ -1,15 +1,44 @@
 import json
 import logging
-from flask import session
+from flask import session, url_for, request
 from flask_socketio import emit, join_room, leave_room, disconnect
-from app import socketio, db
-from ai_services import generate_health_recommendations, get_content_based_recommendations
-from models import User, UserActivity
+from app import (
+    app, socketio, db, NER_DEADLINE, ACTIVITY_BUFFER_ENABLED, SOCKET_ACTIVITY_WINDOW, SOCKET_ACTIVITY_RATE,
+    SOCKET_ACTIVITY_BURST, QUICK_RECOMMENDATIONS_INTERVAL
+)
+from ai_services import (
+    generate_health_recommendations,
+    get_content_based_recommendations,
+    invalidate_user_recommendations,
+    extract_medical_entities,
+    stream_symptom_analysis,
+    popularity_tracker,
+    activity_buffer,
+    parse_symptom_analysis,
+    consultation_executor,
+    search_suggestions,
+    _in_app_context
+)
+from models import User, UserActivity, Consultation
+from interest_profiles import record_content_interaction
+from seen_content import mark_seen
+from activity_rollups import record_activities, record_consultation
+from socket_throttle import ActivityCoalescer
 import datetime
 logger = logging.getLogger(__name__)
 
 def track_user_activity(user_id, activity_type, content_id=None, search_query=None, duration=None, metadata=None):
     """Track user activity for recommendation system"""
+    if ACTIVITY_BUFFER_ENABLED:
+        # Written in batches by the activity writer, which also invalidates recommendations
+        queued = activity_buffer.record(user_id, activity_type, content_id=content_id, search_query=search_query,
+                                        duration=duration,
+                                        activity_metadata=json.dumps(metadata) if metadata else None)
+        # Dropped activity is not stored, so it must not count towards popularity either
+        if queued:
+            popularity_tracker.record(content_id, activity_type, metadata)
+        return
+
     try:
         activity = UserActivity(
             user_id=user_id,
@@ -20,10 +49,40 @@ def track_user_activity(user_id, activity_type, content_id=None, search_query=No
             activity_metadata=json.dumps(metadata) if metadata else None
         )
         db.session.add(activity)
+        record_activities([{'user_id': user_id, 'activity_type': activity_type, 'content_id': content_id}])
+        if content_id:
+            record_content_interaction(user_id, content_id)
+            if activity_type == 'view':
+                mark_seen(user_id, content_id)
         db.session.commit()
+        
+        # Content interactions and profile edits change the user's interests
+        if content_id or activity_type == 'profile_update':
+            invalidate_user_recommendations(user_id)
+        popularity_tracker.record(content_id, activity_type, metadata)
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error tracking activity: {e}")
 
+def push_quick_recommendations(user_id, sid):
+    """Send a connection the top content recommendations after significant activity"""
+    content_recommendations = get_content_based_recommendations(user_id, limit=3)
+    content_recs = []
+    for content in content_recommendations:
+        content_recs.append({
+            'id': content.id,
+            'title': content.title,
+            'category': content.category,
+            'content_type': content.content_type
+        })
+    
+    socketio.emit('quick_recommendations', {'recommendations': content_recs}, to=sid)
+
+# Socket activity is merged per connection and rate limited per user before it is tracked
+activity_coalescer = ActivityCoalescer(app, track_user_activity, push_quick_recommendations,
+                                       window=SOCKET_ACTIVITY_WINDOW, rate=SOCKET_ACTIVITY_RATE,
+                                       burst=SOCKET_ACTIVITY_BURST, push_interval=QUICK_RECOMMENDATIONS_INTERVAL)
+
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
@@ -38,6 +97,7 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    activity_coalescer.disconnect(request.sid)
     user_id = session.get('user_id')
     if user_id:
         leave_room(f'user_{user_id}')
@@ -93,31 +153,81 @@ def handle_activity_tracking(data):
         return
 
     try:
-        activity_type = data.get('type')
-        content_id = data.get('content_id')
-        search_query = data.get('search_query')
-        duration = data.get('duration')
-        metadata = data.get('metadata')
-        
-        track_user_activity(user_id, activity_type, content_id, search_query, duration, metadata)
-        
-        # Send updated recommendations if this was a significant activity
-        if activity_type in ['view', 'rating', 'bookmark']:
-            content_recommendations = get_content_based_recommendations(user_id, limit=3)
-            content_recs = []
-            for content in content_recommendations:
-                content_recs.append({
-                    'id': content.id,
-                    'title': content.title,
-                    'category': content.category,
-                    'content_type': content.content_type
-                })
-            
-            emit('quick_recommendations', {'recommendations': content_recs})
-            
+        activity_coalescer.submit(request.sid, user_id, data.get('type'), data.get('content_id'),
+                                  data.get('search_query'), data.get('duration'), data.get('metadata'))
     except Exception as e:
         logger.error(f"Error tracking activity: {e}")
 
+@socketio.on('start_consultation_stream')
+def handle_consultation_stream(data):
+    """Stream a symptom analysis to the client and persist it when complete"""
+    user_id = session.get('user_id')
+    if not user_id:
+        emit('error', {'message': 'Not authenticated'})
+        return
+
+    symptoms = (data or {}).get('symptoms', '').strip()
+    if len(symptoms) < 10:
+        emit('consultation_error', {'message': 'Please provide more detailed symptoms for better analysis.'})
+        return
+
+    user = User.query.get(user_id)
+    user_profile = {
+        'age': user.age,
+        'gender': user.gender,
+        'medical_conditions': user.medical_conditions,
+        'medications': user.medications,
+        'allergies': user.allergies
+    }
+
+    # Entity extraction runs alongside the stream
+    entities_future = consultation_executor.submit(_in_app_context, extract_medical_entities, symptoms)
+
+    try:
+        emit('consultation_stream_started', {})
+        chunks = []
+        for index, chunk in enumerate(stream_symptom_analysis(symptoms, user_profile)):
+            chunks.append(chunk)
+            emit('consultation_chunk', {'index': index, 'text': chunk})
+        analysis = parse_symptom_analysis(''.join(chunks))
+    except Exception as e:
+        logger.error(f"Error streaming symptom analysis: {e}")
+        emit('consultation_error', {'message': 'Failed to analyze symptoms'})
+        return
+
+    try:
+        entities = entities_future.result(timeout=NER_DEADLINE)
+    except Exception as e:
+        logger.error(f"Error extracting entities for streamed consultation: {e}")
+        entities = []
+
+    try:
+        consultation = Consultation(
+            user_id=user_id,
+            symptoms=symptoms,
+            analysis_result=json.dumps(analysis),
+            extracted_entities=json.dumps(entities),
+            severity_level=analysis.get('severity', 'unknown'),
+            confidence_score=analysis.get('confidence', 0.0)
+        )
+        db.session.add(consultation)
+        record_consultation(user_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving streamed consultation: {e}")
+        emit('consultation_error', {'message': 'Failed to save consultation'})
+        return
+
+    track_user_activity(user_id, 'consultation', metadata={'consultation_id': consultation.id})
+
+    emit('consultation_complete', {
+        'consultation_id': consultation.id,
+        'analysis': analysis,
+        'entities': entities,
+        'url': url_for('view_consultation', consultation_id=consultation.id)
+    })
+
 @socketio.on('search_suggestions')
 def handle_search_suggestions(data):
     """Handle real-time search suggestions"""
@@ -133,32 +243,8 @@ def handle_search_suggestions(data):
         if user_id:
             track_user_activity(user_id, 'search', search_query=query)
         
-        # Get suggestions based on content titles and categories
-        from models import HealthContent
-        suggestions = []
-        
-        # Search in titles
-        title_matches = HealthContent.query.filter(
-            HealthContent.title.ilike(f'%{query}%')
-        ).limit(5).all()
-        
-        for content in title_matches:
-            suggestions.append({
-                'text': content.title,
-                'type': 'content',
-                'category': content.category
-            })
-        
-        # Search in categories
-        category_matches = db.session.query(HealthContent.category.distinct())\
-            .filter(HealthContent.category.ilike(f'%{query}%')).limit(3).all()
-        
-        for category in category_matches:
-            suggestions.append({
-                'text': category[0].replace('_', ' ').title(),
-                'type': 'category',
-                'category': category[0]
-            })
+        # Served from the in-memory prefix index; no database round trip per keystroke
+        suggestions = search_suggestions.suggest(query)
         
         emit('search_suggestions', {'suggestions': suggestions[:8]})
         